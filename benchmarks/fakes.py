@@ -0,0 +1,197 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import os
+import random
+import sys
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, "discloud"))
+
+import discord  # noqa: E402
+from typing import List, Union  # noqa: E402
+from settings import MeasurementSystem, Language, ConcurrencyPriority, IntegrationSettings, CommandSettings, \
+    HomeSettings, CacheSettings, HedgingSettings, PrefetchSettings, LocationSettings, ShardingSettings, \
+    MetricsSettings, ApplicationSettings  # noqa: E402
+from cities import City  # noqa: E402
+from http_pool import HttpConnectionPool  # noqa: E402
+from lookup import get_lookup_tables  # noqa: E402
+from rate_limit import RateLimit, SlidingWindowRateLimiter  # noqa: E402
+from routing import ProviderRouter  # noqa: E402
+from weather import Weather, WeatherForecast, AsyncWeatherRepository, WeatherService  # noqa: E402
+
+# Offline stand-ins for the discord gateway objects and the weather providers, so that the benchmarks measure the
+# bot itself, without network
+
+
+def use_repository_directory() -> None:
+    # the lookup tables and the configuration files are read relatively to the repository
+    os.chdir(ROOT_PATH)
+
+
+def create_settings(language: Language = Language.ENGLISH,
+                    measurement_system: MeasurementSystem = MeasurementSystem.METRIC,
+                    concurrency_priority: ConcurrencyPriority = ConcurrencyPriority.AUTO,
+                    integration_settings: IntegrationSettings = None,
+                    cache_settings: CacheSettings = None) -> ApplicationSettings:
+    command_settings = CommandSettings(["!", "?", "."],
+                                       ["weather", "Погода", "天気", "wetter", "clima", "météo", "meteo"],
+                                       ["forecast", "прогноз", "予測", "prognose", "pronóstico",
+                                        "prévision"],
+                                       ["discloud", "bots", "bot"])
+
+    home_settings = HomeSettings("Paris,FR", "Paris", ["general", "weather"], "08:00", "20:00", None)
+
+    return ApplicationSettings(None,
+                               language,
+                               measurement_system,
+                               concurrency_priority,
+                               integration_settings or IntegrationSettings("offline", "offline", ""),
+                               command_settings,
+                               home_settings,
+                               dict(),
+                               cache_settings or CacheSettings(600, 3600, 1024, None, 0),
+                               HedgingSettings(False, 95),
+                               PrefetchSettings(0, 3),
+                               LocationSettings(None),
+                               ShardingSettings(False, None, 1, None),
+                               MetricsSettings(None))
+
+
+class FakeGame(object):
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class FakeUser(object):
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+
+
+class FakeServer(object):
+    def __init__(self, server_id: int, name: str) -> None:
+        self.id = server_id
+        self.name = name
+        self.members = list()
+        self.channels = list()
+
+
+class FakeMember(object):
+    def __init__(self, member_id: int, server: FakeServer, status: discord.Status, game: FakeGame = None) -> None:
+        self.id = member_id
+        self.server = server
+        self.status = status
+        self.game = game
+
+
+class FakeChannel(object):
+    def __init__(self, channel_id: int, server: FakeServer, name: str) -> None:
+        self.id = channel_id
+        self.server = server
+        self.name = name
+
+
+class FakeMessage(object):
+    def __init__(self, content: str, channel: FakeChannel, author: FakeMember) -> None:
+        self.content = content
+        self.channel = channel
+        self.author = author
+
+
+class FakeDiscordClient(object):
+    # the sent messages are only counted
+
+    def __init__(self, user_id: int) -> None:
+        self.user = FakeUser(user_id)
+        self.sent_messages = 0
+
+    async def send_message(self, channel: FakeChannel, content: str) -> None:
+        self.sent_messages += 1
+
+
+def create_server(server_id: int, members_count: int, peers_count: int, seed: int = 0) -> FakeServer:
+    # a synthetic guild, mostly made of humans, with a few online discloud peers and a few other bots
+    rng = random.Random(seed)
+    server = FakeServer(server_id, "server-{}".format(server_id))
+    server.channels = [FakeChannel(server_id * 1000 + index, server, name)
+                       for index, name in enumerate(["general", "weather", "random", "off-topic"])]
+    peer_indexes = set(rng.sample(range(members_count), min(peers_count, members_count)))
+
+    for index in range(members_count):
+        member_id = server_id * 10 ** 7 + index
+
+        if index in peer_indexes:
+            member = FakeMember(member_id, server, discord.Status.online, FakeGame("18°C  64%  12 kmh ⇄"))
+        else:
+            status = rng.choice([discord.Status.online, discord.Status.idle, discord.Status.offline])
+            game = FakeGame(rng.choice(["Minecraft", "Spotify", "100% focus"])) if rng.random() < 0.3 else None
+            member = FakeMember(member_id, server, status, game)
+
+        server.members.append(member)
+
+    return server
+
+
+class FakeWeatherRepository(AsyncWeatherRepository):
+    # answers with deterministic weathers, derived from the location, without any delay
+    NAME = "FAKE"
+
+    _FORECAST_DAYS = 5
+
+    def __init__(self) -> None:
+        super().__init__(SlidingWindowRateLimiter([RateLimit(10 ** 9, SlidingWindowRateLimiter.MINUTE)]))
+        self._weather_codes = sorted(get_lookup_tables().discord_icons.keys())
+        self.requests = 0
+
+    def __build_weather__(self, location: Union[str, City], date: datetime.date,
+                          measurement_system: MeasurementSystem) -> Weather:
+        location_name = self.__get_location_name__(location)
+        rng = random.Random("{}|{}".format(location_name, date.toordinal()))
+
+        return Weather(location_name, date, measurement_system,
+                       rng.choice(self._weather_codes),
+                       rng.uniform(-20, 40),
+                       rng.randint(0, 100),
+                       rng.randint(0, 80))
+
+    async def get_weather_async(self, location: Union[str, City], measurement_system: MeasurementSystem) -> Weather:
+        self.requests += 1
+        return self.__build_weather__(location, datetime.date.today(), measurement_system)
+
+    async def get_forecast_async(self, location: Union[str, City],
+                                 measurement_system: MeasurementSystem) -> WeatherForecast:
+        self.requests += 1
+        today = datetime.date.today()
+
+        return WeatherForecast([self.__build_weather__(location, today + datetime.timedelta(days=days),
+                                                       measurement_system)
+                                for days in range(FakeWeatherRepository._FORECAST_DAYS)])
+
+
+class FakeWeatherService(WeatherService):
+    # the real weather service (cache, coalescing, routing) in front of the fake weather provider
+
+    def __init__(self, application_settings: ApplicationSettings, repositories: List[AsyncWeatherRepository]) -> None:
+        super().__init__(application_settings.integration_settings.open_weather_map_api_key,
+                         application_settings.integration_settings.weather_underground_api_key,
+                         application_settings.cache_settings,
+                         application_settings.hedging_settings,
+                         application_settings.prefetch_settings,
+                         HttpConnectionPool())
+
+        self._router = ProviderRouter(repositories, application_settings.hedging_settings)
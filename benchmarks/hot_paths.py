@@ -0,0 +1,258 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import time
+from typing import Callable, List
+from fakes import ROOT_PATH, FakeDiscordClient, FakeMessage, FakeWeatherRepository, FakeWeatherService, \
+    create_server, create_settings, use_repository_directory
+from settings import Language, MeasurementSystem, ConcurrencyPriority
+from command import CommandHandler
+from message_factory import MessageFactory
+from peers import PeerBotIndex
+from guilds import GuildHomeTable
+from weather import WeatherForecast
+
+# Offline benchmarks of the command handling and message rendering hot paths. The results are printed as json, so
+# that the releases can be compared, e.g. python benchmarks/hot_paths.py --output results.json
+
+_CHATTER = ["hello everyone", "lol", "did anyone see the match yesterday?", "brb", ":thumbsup:",
+            "!play never gonna give you up", "?rank", "https://example.com/cat.gif", "ok", "see you tomorrow"]
+
+_COMMANDS = ["!weather Paris", "!weather london,uk", "!forecast Tokyo", "!weather", "!forecast", "!météo Lyon",
+             "!wetter Berlin", "?weather New York", "!discloud"]
+
+_LOCATIONS = ["Paris", "London", "Tokyo", "Berlin", "Madrid", "Moscow", "New York", "Lyon"]
+
+
+def __measure__(function: Callable[[], int], repeat: int) -> dict:
+    # the function returns the number of operations it has run, the best run is the least disturbed one
+    rates = list()
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operations = function()
+        rates.append(operations / (time.perf_counter() - start))
+
+    return {"best": max(rates), "median": statistics.median(rates), "unit": "operations/s", "repeat": repeat}
+
+
+def __create_messages__(count: int, command_ratio: float, server, seed: int) -> List[FakeMessage]:
+    rng = random.Random(seed)
+    author = server.members[0]
+    messages = list()
+
+    for _ in range(count):
+        content = rng.choice(_COMMANDS) if rng.random() < command_ratio else rng.choice(_CHATTER)
+        messages.append(FakeMessage(content, rng.choice(server.channels), author))
+
+    return messages
+
+
+def benchmark_handle(messages_count: int, repeat: int) -> dict:
+    # messages/s through CommandHandler.handle, once the weather cache is warm
+    results = dict()
+
+    for command_ratio in [0.0, 0.1, 1.0]:
+        settings = create_settings()
+        repository = FakeWeatherRepository()
+        discord_client = FakeDiscordClient(user_id=1)
+        server = create_server(1, members_count=100, peers_count=2)
+        peer_bot_index = PeerBotIndex()
+        peer_bot_index.index_server(server)
+
+        command_handler = CommandHandler(settings,
+                                         FakeWeatherService(settings, [repository]),
+                                         discord_client,
+                                         MessageFactory(settings),
+                                         peer_bot_index,
+                                         GuildHomeTable(settings.home_settings, settings.guild_home_settings))
+
+        messages = __create_messages__(messages_count, command_ratio, server, seed=len(results))
+        loop = asyncio.new_event_loop()
+
+        async def __handle_all__() -> int:
+            for message in messages:
+                await command_handler.handle(message)
+
+            return len(messages)
+
+        loop.run_until_complete(__handle_all__())  # warms the weather cache up
+
+        result = __measure__(lambda: loop.run_until_complete(__handle_all__()), repeat)
+        result["sent_messages"] = discord_client.sent_messages
+        result["provider_requests"] = repository.requests
+        loop.close()
+
+        results["commands_{}%".format(round(command_ratio * 100))] = result
+
+    return results
+
+
+def benchmark_rendering(renders_count: int, repeat: int) -> dict:
+    # format_weather and format_weather_forecast renders/s, for each language and measurement system. The warm
+    # variants render the same few weathers again and again (i.e. the render cache hits), the cold ones only render
+    # distinct weathers, with a new message factory for each run
+    results = dict()
+    loop = asyncio.new_event_loop()
+    repository = FakeWeatherRepository()
+    today = datetime.date.today()
+    days = range(renders_count // len(_LOCATIONS))
+
+    for measurement_system in MeasurementSystem:
+        weathers = [loop.run_until_complete(repository.get_weather_async(location, measurement_system))
+                    for location in _LOCATIONS]
+        forecasts = [loop.run_until_complete(repository.get_forecast_async(location, measurement_system))
+                     for location in _LOCATIONS]
+
+        distinct_weathers = [repository.__build_weather__(location, today + datetime.timedelta(days=day),
+                                                          measurement_system)
+                             for day in days for location in _LOCATIONS]
+        distinct_forecasts = [WeatherForecast([repository.__build_weather__(location,
+                                                                            today + datetime.timedelta(days=day + i),
+                                                                            measurement_system)
+                                               for i in range(5)])
+                              for day in days for location in _LOCATIONS]
+
+        for language in Language:
+            settings = create_settings(language, measurement_system)
+            message_factory = MessageFactory(settings)
+
+            def __format_weathers__() -> int:
+                for _ in range(renders_count // len(weathers)):
+                    for weather in weathers:
+                        message_factory.format_weather(weather, False)
+
+                return renders_count // len(weathers) * len(weathers)
+
+            def __format_forecasts__() -> int:
+                for _ in range(renders_count // len(forecasts)):
+                    for forecast in forecasts:
+                        message_factory.format_weather_forecast(forecast)
+
+                return renders_count // len(forecasts) * len(forecasts)
+
+            def __format_distinct_weathers__() -> int:
+                cold_message_factory = MessageFactory(settings)
+
+                for weather in distinct_weathers:
+                    cold_message_factory.format_weather(weather, False)
+
+                return len(distinct_weathers)
+
+            def __format_distinct_forecasts__() -> int:
+                cold_message_factory = MessageFactory(settings)
+
+                for forecast in distinct_forecasts:
+                    cold_message_factory.format_weather_forecast(forecast)
+
+                return len(distinct_forecasts)
+
+            key = "{}/{}".format(language.value, measurement_system.value)
+            results[key] = {"format_weather": __measure__(__format_weathers__, repeat),
+                            "format_weather_forecast": __measure__(__format_forecasts__, repeat),
+                            "format_weather_cold": __measure__(__format_distinct_weathers__, repeat),
+                            "format_weather_forecast_cold": __measure__(__format_distinct_forecasts__, repeat)}
+
+    loop.close()
+    return results
+
+
+def benchmark_handling_priority(members_counts: List[int], checks_count: int, repeat: int) -> dict:
+    # cost of indexing a guild and of the handling priority checks against it, for each concurrency priority
+    results = dict()
+
+    for members_count in members_counts:
+        server = create_server(1, members_count, peers_count=max(members_count // 1000, 2))
+        discord_client = FakeDiscordClient(user_id=server.members[-1].id + 1)
+        peer_bot_index = PeerBotIndex()
+
+        def __index_server__() -> int:
+            peer_bot_index.index_server(server)
+            return members_count
+
+        result = {"index_server": dict(__measure__(__index_server__, repeat), unit="members/s")}
+
+        for concurrency_priority in [ConcurrencyPriority.AUTO, ConcurrencyPriority.PARTITION]:
+            settings = create_settings(concurrency_priority=concurrency_priority)
+            command_handler = CommandHandler(settings, None, discord_client, MessageFactory(settings),
+                                             peer_bot_index,
+                                             GuildHomeTable(settings.home_settings, settings.guild_home_settings))
+            messages = [FakeMessage("!weather Paris", channel, server.members[0]) for channel in server.channels]
+
+            def __check_priority__() -> int:
+                for _ in range(checks_count // len(messages)):
+                    for message in messages:
+                        command_handler.__has_handling_priority__(message)
+
+                return checks_count // len(messages) * len(messages)
+
+            result[concurrency_priority.value] = __measure__(__check_priority__, repeat)
+
+        results["{}_members".format(members_count)] = result
+
+    return results
+
+
+def __get_revision__() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_PATH,
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="offline benchmarks of the discloud hot paths")
+    parser.add_argument("--output", help="json file to write the results to (default: standard output)")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for a smoke run")
+    args = parser.parse_args()
+
+    use_repository_directory()
+    logging.disable(logging.CRITICAL)  # the handled commands are logged at the info level
+
+    scale = 10 if args.quick else 1
+    repeat = 3 if args.quick else 5
+
+    results = {"revision": __get_revision__(),
+               "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "benchmarks": {"handle": benchmark_handle(20000 // scale, repeat),
+                              "rendering": benchmark_rendering(10000 // scale, repeat),
+                              "handling_priority": benchmark_handling_priority([1000, 10000, 100000],
+                                                                               100000 // scale, repeat)}}
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
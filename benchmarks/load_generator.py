@@ -0,0 +1,213 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from typing import List, Tuple
+from fakes import FakeDiscordClient, FakeMessage, create_server, create_settings, use_repository_directory
+from settings import IntegrationSettings, CacheSettings
+from command import CommandHandler
+from weather import WeatherService
+from http_pool import HttpConnectionPool
+from message_factory import MessageFactory
+from peers import PeerBotIndex
+from guilds import GuildHomeTable
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+
+# Replays a synthetic stream of discord messages through the command handler, with the actual weather service and
+# repositories pointed at the provider stand-in (see provider_stub.py), and reports the throughput and latencies:
+#
+#   python benchmarks/load_generator.py --messages 5000 --rate 200 --command-ratio 0.2 --locations 500
+
+_CHATTER = ["hello everyone", "lol", "did anyone see the match yesterday?", "brb", ":thumbsup:", "?rank", "ok"]
+
+
+def __create_messages__(args: argparse.Namespace, server) -> List[Tuple[FakeMessage, bool]]:
+    # the locations popularity follows a zipf law, as the real one: a few cities get most of the commands
+    rng = random.Random(args.seed)
+    locations = ["City{}".format(index) for index in range(args.locations)]
+    cumulated_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(locations))))
+    author = server.members[0]
+    messages = list()
+
+    for _ in range(args.messages):
+        is_command = rng.random() < args.command_ratio
+
+        if is_command:
+            command = "!forecast" if rng.random() < args.forecast_ratio else "!weather"
+            content = "{} {}".format(command, rng.choices(locations, cum_weights=cumulated_weights)[0])
+        else:
+            content = rng.choice(_CHATTER)
+
+        messages.append((FakeMessage(content, rng.choice(server.channels), author), is_command))
+
+    return messages
+
+
+def __get_percentile__(sorted_values: List[float], percentile: float) -> float:
+    if not sorted_values:
+        return None
+
+    return sorted_values[min(int(len(sorted_values) * percentile / 100), len(sorted_values) - 1)]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    integration_settings = IntegrationSettings(None,
+                                               args.owm_key if "owm" in args.providers else None,
+                                               args.wu_key if "wu" in args.providers else None,
+                                               args.owm_url,
+                                               args.wu_url)
+
+    settings = create_settings(integration_settings=integration_settings,
+                               cache_settings=CacheSettings(args.cache_ttl, args.cache_ttl, args.cache_size, None, 0))
+
+    def __create_rate_limiter__(name: str, limits: List[RateLimit]) -> SlidingWindowRateLimiter:
+        # the stand-in quotas are tested, rather than the bot rate limits, unless they are explicitly kept
+        if args.provider_rate_limits:
+            return SlidingWindowRateLimiter(limits)
+
+        return SlidingWindowRateLimiter([RateLimit(10 ** 9, SlidingWindowRateLimiter.MINUTE)])
+
+    http_pool = HttpConnectionPool()
+
+    weather_service = WeatherService(integration_settings.open_weather_map_api_key,
+                                     integration_settings.weather_underground_api_key,
+                                     settings.cache_settings,
+                                     settings.hedging_settings,
+                                     settings.prefetch_settings,
+                                     http_pool,
+                                     rate_limiter_factory=__create_rate_limiter__,
+                                     owm_base_url=integration_settings.open_weather_map_base_url,
+                                     wu_base_url=integration_settings.weather_underground_base_url)
+
+    discord_client = FakeDiscordClient(user_id=1)
+    server = create_server(1, members_count=100, peers_count=0)
+    peer_bot_index = PeerBotIndex()
+    peer_bot_index.index_server(server)
+
+    command_handler = CommandHandler(settings,
+                                     weather_service,
+                                     discord_client,
+                                     MessageFactory(settings),
+                                     peer_bot_index,
+                                     GuildHomeTable(settings.home_settings, settings.guild_home_settings))
+
+    messages = __create_messages__(args, server)
+    latencies = list()
+    errors = dict()  # exception type -> count
+
+    async def __handle__(message: FakeMessage, is_command: bool) -> None:
+        start = time.monotonic()
+
+        try:
+            await command_handler.handle(message)
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        finally:
+            if is_command:
+                latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+
+    if args.rate > 0:
+        # open loop: the messages arrive as a poisson process, whatever the handling latencies
+        rng = random.Random(args.seed)
+        arrival = start
+        tasks = list()
+
+        for message, is_command in messages:
+            arrival += rng.expovariate(args.rate)
+            await asyncio.sleep(max(arrival - time.monotonic(), 0))
+            tasks.append(asyncio.ensure_future(__handle__(message, is_command)))
+
+        await asyncio.gather(*tasks)
+    else:
+        # closed loop: a fixed number of concurrent senders, each waiting for its previous message
+        pending_messages = iter(messages)
+
+        async def __send__() -> None:
+            for message, is_command in pending_messages:
+                await __handle__(message, is_command)
+
+        await asyncio.gather(*[__send__() for _ in range(args.concurrency)])
+
+    duration = time.monotonic() - start
+    await http_pool.close()
+
+    latencies.sort()
+    cache = weather_service.cache
+    router = weather_service.router
+
+    return {"messages": len(messages),
+            "commands": len(latencies),
+            "duration": duration,
+            "throughput": {"messages_per_second": len(messages) / duration,
+                           "commands_per_second": len(latencies) / duration},
+            "command_latency": {"p50": __get_percentile__(latencies, 50),
+                                "p90": __get_percentile__(latencies, 90),
+                                "p99": __get_percentile__(latencies, 99),
+                                "max": latencies[-1] if latencies else None,
+                                "unit": "seconds"},
+            "sent_messages": discord_client.sent_messages,
+            "errors": errors,
+            "cache": {"hits": cache.hits, "misses": cache.misses},
+            "providers": {repository.NAME: {"error_rate": router.get_health(repository).error_rate,
+                                            "latency_p50": router.get_health(repository).get_latency_percentile(50),
+                                            "latency_p99": router.get_health(repository).get_latency_percentile(99)}
+                          for repository in router.repositories}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="replays synthetic discord messages against the provider stand-in")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=100, help="messages/s (0 = closed loop, see --concurrency)")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent senders of the closed loop")
+    parser.add_argument("--command-ratio", type=float, default=0.1, help="share of the messages which are commands")
+    parser.add_argument("--forecast-ratio", type=float, default=0.3, help="share of the commands which are forecasts")
+    parser.add_argument("--locations", type=int, default=200, help="number of distinct locations")
+    parser.add_argument("--cache-ttl", type=int, default=600, help="weather and forecast cache ttl, in seconds")
+    parser.add_argument("--cache-size", type=int, default=1024)
+    parser.add_argument("--providers", default="owm,wu", help="providers to enable")
+    parser.add_argument("--provider-rate-limits", action="store_true", help="keep the bot rate limits")
+    parser.add_argument("--owm-url", default="http://127.0.0.1:8082/data/2.5")
+    parser.add_argument("--wu-url", default="http://127.0.0.1:8081")
+    parser.add_argument("--owm-key", default="load-test")
+    parser.add_argument("--wu-key", default="load-test")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="json file to write the results to (default: standard output)")
+    args = parser.parse_args()
+
+    use_repository_directory()
+    logging.disable(logging.CRITICAL)  # the handled commands and the provider failures are counted instead
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import math
+import random
+import time
+import zlib
+from aiohttp import web
+from typing import Callable, Dict, List
+from fakes import use_repository_directory
+from lookup import get_lookup_tables
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+
+# A local stand-in for the Weather Underground and Open Weather Map endpoints used by the weather repositories, with
+# configurable latencies, errors, throttling and quotas, for load and chaos tests without burning the API keys:
+#
+#   python benchmarks/provider_stub.py --wu "latency=lognormal:0.3:0.5,error_rate=0.02" --owm "quota_per_minute=60"
+#
+# and then WU_BASE_URL=http://127.0.0.1:8081 OWM_BASE_URL=http://127.0.0.1:8082/data/2.5 for the bot (or the load
+# generator, which uses these addresses by default)
+
+
+class LatencyDistribution(object):
+    # "constant:<seconds>", "uniform:<min>:<max>", "exponential:<mean>" or "lognormal:<median>:<sigma>"
+
+    def __init__(self, kind: str, parameters: List[float]) -> None:
+        expected_counts = {"constant": 1, "uniform": 2, "exponential": 1, "lognormal": 2}
+
+        if kind not in expected_counts:
+            raise ValueError("unknown latency distribution '{}'".format(kind))
+
+        if len(parameters) != expected_counts[kind]:
+            raise ValueError("the {} latency distribution expects {} parameter(s)".format(kind, expected_counts[kind]))
+
+        self.kind = kind
+        self.parameters = parameters
+
+    @staticmethod
+    def parse(spec: str) -> "LatencyDistribution":
+        kind, *parameters = spec.split(":")
+        return LatencyDistribution(kind, [float(parameter) for parameter in parameters])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "constant":
+            return self.parameters[0]
+        elif self.kind == "uniform":
+            return rng.uniform(*self.parameters)
+        elif self.kind == "exponential":
+            return rng.expovariate(1 / self.parameters[0]) if self.parameters[0] > 0 else 0
+        else:
+            return rng.lognormvariate(math.log(self.parameters[0]), self.parameters[1])
+
+
+class ProviderBehavior(object):
+    # the rates are probabilities per request, the quotas are counted per api key (0 = unlimited)
+    _HANG_DURATION = 60  # seconds, beyond the request timeout of the bot
+
+    def __init__(self,
+                 latency: LatencyDistribution,
+                 error_rate: float = 0,
+                 throttle_rate: float = 0,
+                 hang_rate: float = 0,
+                 quota_per_minute: int = 0,
+                 quota_per_day: int = 0) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.hang_rate = hang_rate
+        self.quota_per_minute = quota_per_minute
+        self.quota_per_day = quota_per_day
+
+    @staticmethod
+    def parse(spec: str) -> "ProviderBehavior":
+        # e.g. "latency=lognormal:0.2:0.5,error_rate=0.01,throttle_rate=0.01,quota_per_minute=60"
+        options = dict(option.split("=", 1) for option in spec.split(",") if option.strip())
+        parsers = {"error_rate": float, "throttle_rate": float, "hang_rate": float,
+                   "quota_per_minute": int, "quota_per_day": int}
+
+        for name in options:
+            if name != "latency" and name not in parsers:
+                raise ValueError("unknown provider behavior option '{}'".format(name))
+
+        return ProviderBehavior(LatencyDistribution.parse(options.get("latency", "constant:0")),
+                                **{name: parsers[name](value) for name, value in options.items() if name in parsers})
+
+    def create_quota(self) -> SlidingWindowRateLimiter:
+        quotas = [(self.quota_per_minute, SlidingWindowRateLimiter.MINUTE),
+                  (self.quota_per_day, SlidingWindowRateLimiter.DAY)]
+        limits = [RateLimit(quota, period) for quota, period in quotas if quota > 0]
+
+        return SlidingWindowRateLimiter(limits) if limits else None
+
+
+class ProviderStub(object):
+    NAME = None
+
+    def __init__(self, behavior: ProviderBehavior, seed: int) -> None:
+        self._behavior = behavior
+        self._rng = random.Random(seed)
+        self._quotas = dict()  # api key -> rate limiter
+        self._responses = dict()  # status -> count
+        self._start = time.monotonic()
+
+    def __get_api_key__(self, request: web.Request) -> str:
+        pass
+
+    def __create_error_response__(self, status: int, message: str) -> web.Response:
+        pass
+
+    def get_routes(self) -> List[web.RouteDef]:
+        pass
+
+    @staticmethod
+    def __get_random__(location: str, date: datetime.date) -> random.Random:
+        # the same location has the same weather during a whole day
+        return random.Random("{}|{}".format(location.strip().lower(), date.toordinal()))
+
+    def __is_over_quota__(self, api_key: str) -> bool:
+        if api_key not in self._quotas:
+            self._quotas[api_key] = self._behavior.create_quota()
+
+        quota = self._quotas[api_key]
+        return quota is not None and not quota.try_acquire()
+
+    async def __answer__(self, request: web.Request, build_json: Callable[[], dict]) -> web.Response:
+        await asyncio.sleep(self._behavior.latency.sample(self._rng))
+
+        if self._rng.random() < self._behavior.hang_rate:
+            await asyncio.sleep(ProviderBehavior._HANG_DURATION)
+
+        if self.__is_over_quota__(self.__get_api_key__(request)):
+            response = self.__create_error_response__(429, "the request quota has been exceeded")
+        elif self._rng.random() < self._behavior.throttle_rate:
+            response = self.__create_error_response__(429, "too many requests")
+        elif self._rng.random() < self._behavior.error_rate:
+            response = self.__create_error_response__(500, "internal error")
+        else:
+            try:
+                response = web.json_response(build_json())
+            except KeyError as e:
+                response = self.__create_error_response__(400, "missing parameter {}".format(e))
+
+        self._responses[response.status] = self._responses.get(response.status, 0) + 1
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.get_stats())
+
+    def get_stats(self) -> dict:
+        requests_count = sum(self._responses.values())
+
+        return {"requests": requests_count,
+                "requests_per_second": requests_count / max(time.monotonic() - self._start, 1e-9),
+                "responses": {str(status): count for status, count in sorted(self._responses.items())}}
+
+
+class WeatherUndergroundStub(ProviderStub):
+    NAME = "WU"
+
+    _FORECAST_DAYS = 4
+
+    def __init__(self, behavior: ProviderBehavior, seed: int) -> None:
+        super().__init__(behavior, seed)
+        self._icons = sorted(get_lookup_tables().owm_codes.keys())
+
+    def __get_api_key__(self, request: web.Request) -> str:
+        return request.match_info["key"]
+
+    def __create_error_response__(self, status: int, message: str) -> web.Response:
+        return web.json_response({"response": {"error": {"type": "stub", "description": message}}}, status=status)
+
+    def __build_observation__(self, query: str, date: datetime.date) -> dict:
+        rng = ProviderStub.__get_random__(query, date)
+        temperature = rng.uniform(-20, 40)
+        wind_speed = rng.uniform(0, 80)
+
+        return {"icon": rng.choice(self._icons),
+                "celsius": round(temperature),
+                "fahrenheit": round(temperature * 9 / 5 + 32),
+                "kph": round(wind_speed),
+                "mph": round(wind_speed / 1.609),
+                "humidity": rng.randint(0, 100)}
+
+    def __build_conditions__(self, query: str) -> dict:
+        observation = self.__build_observation__(query, datetime.date.today())
+
+        return {"current_observation": {"icon": observation["icon"],
+                                        "temp_c": observation["celsius"],
+                                        "temp_f": observation["fahrenheit"],
+                                        "wind_kph": observation["kph"],
+                                        "wind_mph": observation["mph"],
+                                        "relative_humidity": "{}%".format(observation["humidity"])}}
+
+    def __build_forecast__(self, query: str) -> dict:
+        forecast_days = list()
+        today = datetime.date.today()
+
+        for days in range(WeatherUndergroundStub._FORECAST_DAYS):
+            date = today + datetime.timedelta(days=days)
+            observation = self.__build_observation__(query, date)
+            epoch = int(datetime.datetime.combine(date, datetime.time(12)).timestamp())
+
+            forecast_days.append({"date": {"epoch": str(epoch)},
+                                  "icon": observation["icon"],
+                                  "high": {"celsius": str(observation["celsius"]),
+                                           "fahrenheit": str(observation["fahrenheit"])},
+                                  "avewind": {"kph": observation["kph"], "mph": observation["mph"]},
+                                  "avehumidity": observation["humidity"]})
+
+        return {"forecast": {"simpleforecast": {"forecastday": forecast_days}}}
+
+    async def __handle_conditions__(self, request: web.Request) -> web.Response:
+        return await self.__answer__(request, lambda: self.__build_conditions__(request.match_info["query"]))
+
+    async def __handle_forecast__(self, request: web.Request) -> web.Response:
+        return await self.__answer__(request, lambda: self.__build_forecast__(request.match_info["query"]))
+
+    def get_routes(self) -> List[web.RouteDef]:
+        return [web.get("/api/{key}/conditions/q/{query}.json", self.__handle_conditions__),
+                web.get("/api/{key}/forecast/q/{query}.json", self.__handle_forecast__)]
+
+
+class OpenWeatherMapStub(ProviderStub):
+    NAME = "OWM"
+
+    _DEFAULT_FORECAST_DAYS = 7
+
+    def __init__(self, behavior: ProviderBehavior, seed: int) -> None:
+        super().__init__(behavior, seed)
+        self._weather_codes = sorted(get_lookup_tables().discord_icons.keys())
+
+    def __get_api_key__(self, request: web.Request) -> str:
+        return request.query.get("appid", "")
+
+    def __create_error_response__(self, status: int, message: str) -> web.Response:
+        return web.json_response({"cod": status, "message": message}, status=status)
+
+    @staticmethod
+    def __get_location__(query: Dict[str, str]) -> str:
+        return query["id"] if "id" in query else query["q"]
+
+    def __build_weather__(self, location: str, date: datetime.date, units: str, daily: bool) -> dict:
+        # the temperatures and wind speeds are in the requested units (m/s for metric, mph for imperial)
+        rng = ProviderStub.__get_random__(location, date)
+        temperature = rng.uniform(-20, 40)
+        temperature = temperature * 9 / 5 + 32 if units == "imperial" else temperature
+        wind_speed = rng.uniform(0, 22)
+        wind_speed = wind_speed * 2.237 if units == "imperial" else wind_speed
+        humidity = rng.randint(0, 100)
+        weather = [{"id": rng.choice(self._weather_codes)}]
+        epoch = int(datetime.datetime.combine(date, datetime.time(12)).timestamp())
+
+        if daily:
+            return {"dt": epoch, "temp": {"day": temperature}, "humidity": humidity, "speed": wind_speed,
+                    "weather": weather}
+
+        return {"id": int(location) if location.isdigit() else zlib.crc32(location.encode("utf-8")) % 10 ** 7,
+                "name": location, "dt": epoch, "weather": weather,
+                "main": {"temp": temperature, "humidity": humidity}, "wind": {"speed": wind_speed}, "cod": 200}
+
+    def __build_current__(self, query: Dict[str, str]) -> dict:
+        location = OpenWeatherMapStub.__get_location__(query)
+        return self.__build_weather__(location, datetime.date.today(), query.get("units"), daily=False)
+
+    def __build_daily_forecast__(self, query: Dict[str, str]) -> dict:
+        location = OpenWeatherMapStub.__get_location__(query)
+        today = datetime.date.today()
+        days_count = int(query.get("cnt", OpenWeatherMapStub._DEFAULT_FORECAST_DAYS))
+
+        weathers = [self.__build_weather__(location, today + datetime.timedelta(days=days), query.get("units"),
+                                           daily=True)
+                    for days in range(days_count)]
+
+        return {"cod": "200", "cnt": len(weathers), "list": weathers}
+
+    def __build_group__(self, query: Dict[str, str]) -> dict:
+        weathers = [self.__build_weather__(city_id, datetime.date.today(), query.get("units"), daily=False)
+                    for city_id in query["id"].split(",")]
+
+        return {"cnt": len(weathers), "list": weathers}
+
+    async def __handle_weather__(self, request: web.Request) -> web.Response:
+        return await self.__answer__(request, lambda: self.__build_current__(request.query))
+
+    async def __handle_daily_forecast__(self, request: web.Request) -> web.Response:
+        return await self.__answer__(request, lambda: self.__build_daily_forecast__(request.query))
+
+    async def __handle_group__(self, request: web.Request) -> web.Response:
+        return await self.__answer__(request, lambda: self.__build_group__(request.query))
+
+    def get_routes(self) -> List[web.RouteDef]:
+        return [web.get("/data/2.5/weather", self.__handle_weather__),
+                web.get("/data/2.5/forecast/daily", self.__handle_daily_forecast__),
+                web.get("/data/2.5/group", self.__handle_group__)]
+
+
+async def serve(stubs: Dict[int, ProviderStub], host: str) -> None:
+    # each provider is served on its own port, along with its statistics at /stats
+    runners = list()
+
+    for port, stub in stubs.items():
+        application = web.Application()
+        application.router.add_routes(stub.get_routes())
+        application.router.add_get("/stats", stub.handle_stats)
+
+        runner = web.AppRunner(application, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        runners.append(runner)
+
+        logging.info("{} stand-in listening on http://{}:{}".format(stub.NAME, host, port))
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="local stand-in for the weather providers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--wu-port", type=int, default=8081)
+    parser.add_argument("--owm-port", type=int, default=8082)
+    parser.add_argument("--wu", default="latency=lognormal:0.25:0.5", help="Weather Underground behavior")
+    parser.add_argument("--owm", default="latency=lognormal:0.15:0.5", help="Open Weather Map behavior")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    use_repository_directory()
+
+    stubs = {args.wu_port: WeatherUndergroundStub(ProviderBehavior.parse(args.wu), args.seed),
+             args.owm_port: OpenWeatherMapStub(ProviderBehavior.parse(args.owm), args.seed)}
+
+    try:
+        asyncio.run(serve(stubs, args.host))
+    except KeyboardInterrupt:
+        for stub in stubs.values():
+            logging.info("{} stand-in statistics: {}".format(stub.NAME, json.dumps(stub.get_stats())))
+
+
+if __name__ == "__main__":
+    main()
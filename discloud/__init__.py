@@ -19,9 +19,12 @@ import os
 import sys
 import logging
 import configparser
-from typing import List
+import datetime
+import zoneinfo
+from typing import Dict, List
 from settings import MeasurementSystem, Language, ConcurrencyPriority, IntegrationSettings, CommandSettings, \
-    HomeSettings, ApplicationSettings
+    HomeSettings, CacheSettings, HedgingSettings, PrefetchSettings, LocationSettings, \
+    ShardingSettings, MetricsSettings, ApplicationSettings
 from main import Application
 
 
@@ -46,7 +49,11 @@ class ConfigurationFactory(object):
 
     _CONCURRENCY_PRIORITIES = {"always": ConcurrencyPriority.ALWAYS,
                                "auto": ConcurrencyPriority.AUTO,
-                               "never": ConcurrencyPriority.NEVER}
+                               "never": ConcurrencyPriority.NEVER,
+                               "partition": ConcurrencyPriority.PARTITION}
+
+    _BOOLEANS = {"true": True,
+                 "false": False}
 
     _DEFAULT_LOGGING_LEVEL = "info"
     _DEFAULT_LANGUAGE = "en"
@@ -55,6 +62,21 @@ class ConfigurationFactory(object):
     _DEFAULT_CHANNELS = "general,weather"
     _DEFAULT_MORNING_FORECAST_TIME = "08:00"
     _DEFAULT_EVENING_FORECAST_TIME = "20:00"
+    _DEFAULT_WEATHER_CACHE_TTL = "600"  # 10 minutes
+    _DEFAULT_FORECAST_CACHE_TTL = "3600"  # 1 hour
+    _DEFAULT_CACHE_MAX_SIZE = "1024"
+    _DEFAULT_DISK_CACHE_MAX_SIZE = "10000"
+    _DEFAULT_HEDGED_REQUESTS = "false"
+    _DEFAULT_HEDGING_PERCENTILE = "95"
+    _DEFAULT_PREFETCH_LOCATIONS = "10"
+    _DEFAULT_PREFETCH_MIN_REQUESTS = "3"
+    _DEFAULT_CITY_INDEX_PATH = "data/cities.idx"
+    _DEFAULT_GUILDS_CONFIG_PATH = "config/guilds.ini"
+    _DEFAULT_SHARDED = "false"
+    _DEFAULT_SHARD_COUNT = "0"  # recommended by discord
+    _DEFAULT_SHARD_PROCESSES = "1"
+    _DEFAULT_SHARED_STATE_SOCKET = "/tmp/discloud.sock"
+    _DEFAULT_METRICS_PORT = "0"  # disabled
 
     def __init__(self):
         self.is_configuration_valid = True
@@ -68,6 +90,101 @@ class ConfigurationFactory(object):
         logging.error(message)
         return None
 
+    def __parse_int__(self, key: str, value: str, minimum: int, maximum: int = None):
+        try:
+            parsed_value = int(value)
+        except (TypeError, ValueError):
+            parsed_value = None
+
+        if parsed_value is None or parsed_value < minimum:
+            msg_template = "invalid value '{}' for environment variable '{}', it must be an integer >= {}"
+            return self.__abort_start__(msg_template.format(value, key, minimum))
+
+        if maximum is not None and parsed_value > maximum:
+            msg_template = "invalid value '{}' for environment variable '{}', it must be an integer <= {}"
+            return self.__abort_start__(msg_template.format(value, key, maximum))
+
+        return parsed_value
+
+    def __parse_timezone__(self, key: str, value: str):
+        if value is None or value.strip() == "":
+            return None
+
+        try:
+            return zoneinfo.ZoneInfo(value.strip())
+        except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+            msg_template = "invalid value '{}' for environment variable '{}', it must be a timezone name (e.g. {})"
+            return self.__abort_start__(msg_template.format(value, key, "Europe/Paris"))
+
+    def __parse_time__(self, key: str, value: str):
+        if value is None or value.strip() == "":
+            return value
+
+        try:
+            datetime.datetime.strptime(value.strip(), "%H:%M")
+            return value.strip()
+        except ValueError:
+            msg_template = "invalid value '{}' for '{}', it must be a time from 00:00 to 23:59"
+            return self.__abort_start__(msg_template.format(value, key))
+
+    def __parse_guild_home_settings__(self, file_path: str,
+                                      default_home_settings: HomeSettings) -> Dict[int, HomeSettings]:
+        # each section of the file is a guild id, its missing options fall back to the default home settings
+        if not os.path.isfile(file_path):
+            msg_template = "there is no guilds configuration at '{}', every guild will use the default home"
+            logging.info(msg_template.format(file_path))
+            return dict()
+
+        config = configparser.ConfigParser(interpolation=None)
+        config.read(file_path, encoding="utf-8")
+
+        guild_home_settings = dict()
+
+        for section in config.sections():
+            try:
+                guild_id = int(section)
+            except ValueError:
+                self.__abort_start__("invalid guild id '{}' in '{}', it must be an integer".format(section, file_path))
+                continue
+
+            options = config[section]
+            key_template = section + ".{}"
+
+            full_name = options.get("full_name", default_home_settings.full_name)
+            display_name = options.get("display_name",
+                                       full_name if "full_name" in options else default_home_settings.display_name)
+
+            if "periodic_forecast_channels" in options:
+                periodic_forecast_channels = \
+                    ConfigurationFactory.__parse_array__(options["periodic_forecast_channels"])
+            else:
+                periodic_forecast_channels = default_home_settings.periodic_forecast_channels
+
+            morning_forecast_time = self.__parse_time__(key_template.format("morning_forecast_time"),
+                                                        options.get("morning_forecast_time",
+                                                                    default_home_settings.morning_forecast_time))
+
+            evening_forecast_time = self.__parse_time__(key_template.format("evening_forecast_time"),
+                                                        options.get("evening_forecast_time",
+                                                                    default_home_settings.evening_forecast_time))
+
+            if "forecast_timezone" in options:
+                forecast_timezone = self.__parse_timezone__(key_template.format("forecast_timezone"),
+                                                            options["forecast_timezone"])
+            else:
+                forecast_timezone = default_home_settings.forecast_timezone
+
+            guild_home_settings[guild_id] = HomeSettings(full_name,
+                                                         display_name,
+                                                         periodic_forecast_channels,
+                                                         morning_forecast_time,
+                                                         evening_forecast_time,
+                                                         forecast_timezone)
+
+        logging.info("{} guild(s) with their own home in '{}'".format(len(guild_home_settings), file_path))
+
+        return guild_home_settings
+
     def __parse_dict__(self, key: str, value: str, reference_dict: dict):
         if value not in reference_dict:
             valid_values = ",".join(reference_dict.keys())
@@ -116,6 +233,8 @@ class ConfigurationFactory(object):
         discord_bot_token = self.__read_env_variable__("DISCORD_BOT_TOKEN", None)
         open_weather_map_api_key = self.__read_env_variable__("OPEN_WEATHER_MAP_API_KEY", None)
         weather_underground_api_key = self.__read_env_variable__("WEATHER_UNDERGROUND_API_KEY", "")
+        open_weather_map_base_url = self.__read_env_variable__("OWM_BASE_URL", "")
+        weather_underground_base_url = self.__read_env_variable__("WU_BASE_URL", "")
 
         config = configparser.ConfigParser()
         config.read("config/commands.ini")
@@ -143,9 +262,80 @@ class ConfigurationFactory(object):
         evening_forecast_time = self.__read_env_variable__("EVENING_FORECAST_TIME",
                                                            ConfigurationFactory._DEFAULT_EVENING_FORECAST_TIME)
 
+        forecast_timezone_str = self.__read_env_variable__("FORECAST_TIMEZONE", "")
+        forecast_timezone = self.__parse_timezone__("FORECAST_TIMEZONE", forecast_timezone_str)
+
+        weather_cache_ttl_str = self.__read_env_variable__("WEATHER_CACHE_TTL",
+                                                           ConfigurationFactory._DEFAULT_WEATHER_CACHE_TTL)
+
+        weather_cache_ttl = self.__parse_int__("WEATHER_CACHE_TTL", weather_cache_ttl_str, 0)
+
+        forecast_cache_ttl_str = self.__read_env_variable__("FORECAST_CACHE_TTL",
+                                                            ConfigurationFactory._DEFAULT_FORECAST_CACHE_TTL)
+
+        forecast_cache_ttl = self.__parse_int__("FORECAST_CACHE_TTL", forecast_cache_ttl_str, 0)
+
+        cache_max_size_str = self.__read_env_variable__("CACHE_MAX_SIZE", ConfigurationFactory._DEFAULT_CACHE_MAX_SIZE)
+        cache_max_size = self.__parse_int__("CACHE_MAX_SIZE", cache_max_size_str, 1)
+
+        disk_cache_path = self.__read_env_variable__("WEATHER_CACHE_PATH", "").strip() or None
+
+        disk_cache_max_size_str = self.__read_env_variable__("DISK_CACHE_MAX_SIZE",
+                                                             ConfigurationFactory._DEFAULT_DISK_CACHE_MAX_SIZE)
+
+        disk_cache_max_size = self.__parse_int__("DISK_CACHE_MAX_SIZE", disk_cache_max_size_str, 1)
+
+        hedged_requests_str = self.__read_env_variable__("HEDGED_REQUESTS",
+                                                         ConfigurationFactory._DEFAULT_HEDGED_REQUESTS)
+        hedged_requests = self.__parse_dict__("HEDGED_REQUESTS", hedged_requests_str, ConfigurationFactory._BOOLEANS)
+
+        hedging_percentile_str = self.__read_env_variable__("HEDGING_PERCENTILE",
+                                                            ConfigurationFactory._DEFAULT_HEDGING_PERCENTILE)
+
+        hedging_percentile = self.__parse_int__("HEDGING_PERCENTILE", hedging_percentile_str, 1, 99)
+
+        prefetch_locations_str = self.__read_env_variable__("PREFETCH_LOCATIONS",
+                                                            ConfigurationFactory._DEFAULT_PREFETCH_LOCATIONS)
+
+        prefetch_locations = self.__parse_int__("PREFETCH_LOCATIONS", prefetch_locations_str, 0)
+
+        prefetch_min_requests_str = self.__read_env_variable__("PREFETCH_MIN_REQUESTS",
+                                                               ConfigurationFactory._DEFAULT_PREFETCH_MIN_REQUESTS)
+
+        prefetch_min_requests = self.__parse_int__("PREFETCH_MIN_REQUESTS", prefetch_min_requests_str, 1)
+
+        city_index_path = self.__read_env_variable__("CITY_INDEX_PATH", ConfigurationFactory._DEFAULT_CITY_INDEX_PATH)
+
+        guilds_config_path = self.__read_env_variable__("GUILDS_CONFIG_PATH",
+                                                        ConfigurationFactory._DEFAULT_GUILDS_CONFIG_PATH)
+
+        sharded_str = self.__read_env_variable__("SHARDED", ConfigurationFactory._DEFAULT_SHARDED)
+        sharded = self.__parse_dict__("SHARDED", sharded_str, ConfigurationFactory._BOOLEANS)
+
+        shard_count_str = self.__read_env_variable__("SHARD_COUNT", ConfigurationFactory._DEFAULT_SHARD_COUNT)
+        shard_count = self.__parse_int__("SHARD_COUNT", shard_count_str, 0)
+
+        shard_processes_str = self.__read_env_variable__("SHARD_PROCESSES",
+                                                         ConfigurationFactory._DEFAULT_SHARD_PROCESSES)
+
+        shard_processes = self.__parse_int__("SHARD_PROCESSES", shard_processes_str, 1)
+
+        if shard_processes is not None and shard_processes > 1 \
+                and (shard_count is None or shard_count < shard_processes):
+            self.__abort_start__("the environment variable 'SHARD_COUNT' must be >= 'SHARD_PROCESSES' "
+                                 "when the shards are split between several processes")
+
+        shared_state_socket = self.__read_env_variable__("SHARED_STATE_SOCKET",
+                                                         ConfigurationFactory._DEFAULT_SHARED_STATE_SOCKET)
+
+        metrics_port_str = self.__read_env_variable__("METRICS_PORT", ConfigurationFactory._DEFAULT_METRICS_PORT)
+        metrics_port = self.__parse_int__("METRICS_PORT", metrics_port_str, 0, 65535)
+
         integration_settings = IntegrationSettings(discord_bot_token,
                                                    open_weather_map_api_key,
-                                                   weather_underground_api_key)
+                                                   weather_underground_api_key,
+                                                   open_weather_map_base_url.rstrip("/") or None,
+                                                   weather_underground_base_url.rstrip("/") or None)
 
         command_settings = CommandSettings(command_prefixes, weather_commands, forecast_commands, help_commands)
 
@@ -153,7 +343,26 @@ class ConfigurationFactory(object):
                                      home_display_name,
                                      periodic_forecast_channels,
                                      morning_forecast_time,
-                                     evening_forecast_time)
+                                     evening_forecast_time,
+                                     forecast_timezone)
+
+        guild_home_settings = self.__parse_guild_home_settings__(guilds_config_path, home_settings)
+
+        cache_settings = CacheSettings(weather_cache_ttl,
+                                       forecast_cache_ttl,
+                                       cache_max_size,
+                                       disk_cache_path,
+                                       disk_cache_max_size)
+
+        hedging_settings = HedgingSettings(hedged_requests, hedging_percentile)
+
+        prefetch_settings = PrefetchSettings(prefetch_locations, prefetch_min_requests)
+
+        location_settings = LocationSettings(city_index_path)
+
+        sharding_settings = ShardingSettings(sharded, shard_count or None, shard_processes, shared_state_socket)
+
+        metrics_settings = MetricsSettings(metrics_port or None)
 
         application_settings = ApplicationSettings(logging_level,
                                                    language,
@@ -161,19 +370,28 @@ class ConfigurationFactory(object):
                                                    concurrency_priority,
                                                    integration_settings,
                                                    command_settings,
-                                                   home_settings)
+                                                   home_settings,
+                                                   guild_home_settings,
+                                                   cache_settings,
+                                                   hedging_settings,
+                                                   prefetch_settings,
+                                                   location_settings,
+                                                   sharding_settings,
+                                                   metrics_settings)
 
         return application_settings
 
-logging.basicConfig(level=logging.INFO)
 
-configuration_factory = ConfigurationFactory()
-configuration = configuration_factory.create()
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    configuration_factory = ConfigurationFactory()
+    configuration = configuration_factory.create()
 
-if not configuration_factory.is_configuration_valid:
-    logging.error("the bot configuration is invalid, the application will NOT start")
-    sys.exit(1)
+    if not configuration_factory.is_configuration_valid:
+        logging.error("the bot configuration is invalid, the application will NOT start")
+        sys.exit(1)
 
-logging.basicConfig(level=configuration.logging_level)
+    logging.basicConfig(level=configuration.logging_level)
 
-Application(configuration).run()
+    Application(configuration).run()
@@ -0,0 +1,128 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import discord
+from typing import Iterable, List
+from guilds import GuildHomeTable
+from metrics import DISCORD_SEND_LATENCY, BROADCAST_FAILURES
+
+
+class ForecastChannelIndex(object):
+    # Keeps the channels receiving the periodic forecasts, updated from the gateway events
+
+    def __init__(self, guild_home_table: GuildHomeTable) -> None:
+        self._guild_home_table = guild_home_table
+        self._channels = dict()  # channel id -> channel
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    @property
+    def channels(self) -> List[discord.TextChannel]:
+        return list(self._channels.values())
+
+    def index_channels(self, channels: Iterable[discord.TextChannel]) -> None:
+        self._channels.clear()
+
+        for channel in channels:
+            self.update_channel(channel)
+
+        logging.debug("{} channel(s) will receive the periodic forecasts".format(len(self._channels)))
+
+    def update_channel(self, channel: discord.TextChannel) -> None:
+        # the private channels have no server, they never receive the periodic forecasts
+        if getattr(channel, "server", None) is None:
+            return
+
+        if channel.name in self._guild_home_table.get(channel.server.id).periodic_forecast_channels:
+            self._channels[channel.id] = channel
+        else:
+            self._channels.pop(channel.id, None)
+
+    def remove_channel(self, channel: discord.TextChannel) -> None:
+        self._channels.pop(channel.id, None)
+
+    def index_server(self, server: discord.Guild) -> None:
+        for channel in server.channels:
+            self.update_channel(channel)
+
+    def remove_server(self, server: discord.Guild) -> None:
+        for channel in server.channels:
+            self.remove_channel(channel)
+
+
+class BroadcastMessageDiscordCommand(object):
+    _MAX_CONCURRENT_SENDS = 10
+    _MAX_RATE_LIMITED_ATTEMPTS = 3
+    _DEFAULT_RETRY_AFTER = 1  # seconds
+
+    def __init__(self, discord_client: discord.Client, channels: List[discord.TextChannel], msg: str) -> None:
+        self._discord_client = discord_client
+        self._channels = channels
+        self._msg = msg
+
+    @staticmethod
+    def __get_retry_after__(e: discord.HTTPException) -> float:
+        try:
+            return float(e.response.headers["Retry-After"])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return BroadcastMessageDiscordCommand._DEFAULT_RETRY_AFTER
+
+    @staticmethod
+    def __get_channel_name__(channel: discord.TextChannel) -> str:
+        server = getattr(channel, "server", None)
+        return channel.name if server is None else "{}.{}".format(server.name, channel.name)
+
+    async def __send__(self, semaphore: asyncio.Semaphore, channel: discord.TextChannel) -> bool:
+        error = None
+
+        async with semaphore:
+            for attempt in range(BroadcastMessageDiscordCommand._MAX_RATE_LIMITED_ATTEMPTS):
+                try:
+                    with DISCORD_SEND_LATENCY.time():
+                        await self._discord_client.send_message(channel, self._msg)
+
+                    return True
+                except discord.HTTPException as e:
+                    if e.status == 429 and attempt + 1 < BroadcastMessageDiscordCommand._MAX_RATE_LIMITED_ATTEMPTS:
+                        await asyncio.sleep(BroadcastMessageDiscordCommand.__get_retry_after__(e))
+                        continue
+
+                    error = e
+                    break
+                except Exception as e:
+                    # e.g. a connection error, which must not stop the broadcast to the other channels either
+                    error = e
+                    break
+
+        logging.error("failed to broadcast to channel {}".format(
+            BroadcastMessageDiscordCommand.__get_channel_name__(channel)), exc_info=error)
+        BROADCAST_FAILURES.inc()
+        return False
+
+    async def execute(self) -> int:
+        # the channels are isolated from each other: a failing channel neither stops nor delays the other ones
+        semaphore = asyncio.Semaphore(BroadcastMessageDiscordCommand._MAX_CONCURRENT_SENDS)
+        results = await asyncio.gather(*[self.__send__(semaphore, channel) for channel in self._channels])
+        failures_count = sum(1 for sent in results if not sent)
+
+        if failures_count > 0:
+            logging.warning("the broadcast failed for {}/{} channel(s)".format(failures_count, len(self._channels)))
+
+        return len(results) - failures_count
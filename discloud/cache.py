@@ -0,0 +1,124 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import heapq
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+
+class TtlLruCache(object):
+    def __init__(self, max_size: int) -> None:
+        if max_size <= 0:
+            raise ValueError("the cache maximum size must be > 0")
+
+        self._max_size = max_size
+        self._entries = OrderedDict()  # key -> (expiration monotonic time, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expiration, value = entry
+
+        if expiration <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_time_to_live(self, key: Hashable) -> float:
+        # unlike get(), it neither counts as a hit or a miss nor refreshes the entry recency
+        entry = self._entries.get(key)
+        return None if entry is None else max(entry[0] - time.monotonic(), 0)
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class CacheTier(object):
+    # A slower cache behind the in-memory one (e.g. on disk), whose values are serialized strings.
+    # Its failures are logged by the implementations and never surface to the callers
+
+    async def get(self, key: str) -> Optional[Tuple[str, float]]:
+        # returns the value with its remaining time to live, None if the key is missing or expired
+        pass
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        pass
+
+    async def maintain(self) -> None:
+        # background maintenance of the tier, runs forever
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class PopularityTracker(object):
+    # Counts the requests made for each key, the older requests weighing exponentially less
+
+    def __init__(self, half_life: float, max_size: int) -> None:
+        self._half_life = half_life
+        self._max_size = max_size
+        self._entries = dict()  # key -> [score, last request monotonic time, value]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __get_score__(self, entry: list, now: float) -> float:
+        return entry[0] * 0.5 ** ((now - entry[1]) / self._half_life)
+
+    def track(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry is None:
+            if len(self._entries) >= self._max_size:
+                # the least popular half is forgotten at once, so that pruning does not happen on every new key
+                for forgotten_key, _ in self.get_most_popular(len(self._entries))[self._max_size // 2:]:
+                    del self._entries[forgotten_key]
+
+            entry = self._entries[key] = [0.0, now, value]
+
+        entry[0] = self.__get_score__(entry, now) + 1
+        entry[1] = now
+        entry[2] = value
+
+    def get_most_popular(self, count: int, min_score: float = 0) -> List[Tuple[Hashable, Any]]:
+        # the keys whose score has decayed below min_score are left out, however few the other keys are
+        now = time.monotonic()
+        most_popular = heapq.nlargest(count, self._entries.items(), key=lambda item: self.__get_score__(item[1], now))
+        return [(key, entry[2]) for key, entry in most_popular if self.__get_score__(entry, now) >= min_score]
@@ -0,0 +1,222 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import json
+import logging
+import mmap
+import os
+import sys
+import unicodedata
+from array import array
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class City(NamedTuple):
+    id: int
+    name: str
+    country: str
+    latitude: float
+    longitude: float
+
+
+class UnknownLocationError(ValueError):
+    pass
+
+
+class CityIndex(object):
+    # The index file is built from the Open Weather Map city list (see build()), each line being a city:
+    #   <folded name>\t<id>\t<name>\t<country>\t<latitude>\t<longitude>\t<population>\n
+    # The lines are sorted by folded name (then by decreasing population), the file is memory mapped and only the
+    # offsets of its lines are kept in memory
+
+    _MIN_PREFIX_LENGTH = 4  # shorter inputs must match a city name exactly
+    _MAX_PREFIX_MATCHES = 5000  # bounds the scan of the short prefixes (e.g. "sant")
+    _COUNTRY_ALIASES = {"uk": "gb", "england": "gb", "scotland": "gb", "wales": "gb", "usa": "us"}
+    _NAME_ALIASES = {"nyc": "new york", "new york city": "new york", "sf": "san francisco", "la": "los angeles",
+                     "st petersburg": "saint petersburg"}
+
+    def __init__(self, file_path: str) -> None:
+        self._file = open(file_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = array("I")
+
+        offset = 0
+
+        while offset < len(self._mmap):
+            self._offsets.append(offset)
+            offset = self._mmap.find(b"\n", offset) + 1
+
+            if offset == 0:
+                break
+
+        logging.info("{} cities loaded from the city index {}".format(len(self._offsets), file_path))
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @staticmethod
+    def fold(text: str) -> str:
+        decomposed = unicodedata.normalize("NFKD", text)
+        without_diacritics = "".join(c for c in decomposed if not unicodedata.combining(c))
+        spaced = without_diacritics.casefold().replace("-", " ").replace("'", " ").replace("_", " ")
+        return " ".join(spaced.split())
+
+    def __get_key__(self, index: int) -> bytes:
+        start = self._offsets[index]
+        return self._mmap[start:self._mmap.find(b"\t", start)]
+
+    def __get_fields__(self, index: int) -> List[str]:
+        start = self._offsets[index]
+        end = self._mmap.find(b"\n", start)
+        return self._mmap[start:end].decode("utf-8").split("\t")
+
+    def __get_city__(self, index: int) -> City:
+        _, city_id, name, country, latitude, longitude, _ = self.__get_fields__(index)
+        return City(int(city_id), name, country, float(latitude), float(longitude))
+
+    def __get_population__(self, index: int) -> int:
+        return int(self.__get_fields__(index)[6])
+
+    def __bisect__(self, key: bytes) -> int:
+        low, high = 0, len(self._offsets)
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if self.__get_key__(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def __find__(self, folded_name: str, prefix: bool) -> List[int]:
+        key = folded_name.encode("utf-8")
+        index = self.__bisect__(key)
+        matches = list()
+
+        while index < len(self._offsets):
+            candidate_key = self.__get_key__(index)
+
+            if candidate_key == key or prefix and candidate_key.startswith(key):
+                matches.append(index)
+                index += 1
+            else:
+                break
+
+            if len(matches) >= CityIndex._MAX_PREFIX_MATCHES:
+                break
+
+        if prefix:
+            # the exact matches are already ranked by population, but the prefix ones are ranked by name first
+            # (e.g. "pari" would otherwise be Paria before Paris)
+            matches.sort(key=lambda match: -self.__get_population__(match))
+
+        return matches
+
+    @staticmethod
+    def __split__(location: str) -> Tuple[str, Optional[str]]:
+        # "Paris,FR", "paris, fr" and "Paris" are all accepted, the suffix being a country code or a region
+        name, _, suffix = location.partition(",")
+        folded_name = CityIndex.fold(name)
+        folded_suffix = CityIndex.fold(suffix)
+        return CityIndex._NAME_ALIASES.get(folded_name, folded_name), \
+            CityIndex._COUNTRY_ALIASES.get(folded_suffix, folded_suffix) or None
+
+    def __find_cities__(self, folded_name: str) -> List[City]:
+        if not folded_name:
+            return []
+
+        matches = self.__find__(folded_name, False)
+
+        if not matches and len(folded_name) >= CityIndex._MIN_PREFIX_LENGTH:
+            matches = self.__find__(folded_name, True)
+
+        return [self.__get_city__(index) for index in matches]
+
+    def has_city_named(self, location: str) -> bool:
+        folded_name, _ = CityIndex.__split__(location)
+        return len(self.__find_cities__(folded_name)) > 0
+
+    def resolve(self, location: str) -> Optional[City]:
+        # None when no city has this name, or when none of them is in the country of the suffix (which may be a
+        # region the index knows nothing about, e.g. a US state)
+        folded_name, country = CityIndex.__split__(location)
+        cities = self.__find_cities__(folded_name)
+
+        if country is None:
+            return cities[0] if cities else None
+
+        for city in cities:
+            if city.country.lower() == country:
+                return city
+
+        return None
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def load(file_path: str) -> Optional["CityIndex"]:
+        if not file_path or not os.path.isfile(file_path) or os.path.getsize(file_path) == 0:
+            logging.info("there is no city index at '{}', locations will not be normalized".format(file_path))
+            return None
+
+        return CityIndex(file_path)
+
+    @staticmethod
+    def build(city_list_path: str, index_path: str) -> int:
+        # the city list is the (gzipped) json of http://bulk.openweathermap.org/sample/, its "current" variant
+        # includes the cities population, used to rank the cities with the same name
+        open_city_list = gzip.open if city_list_path.endswith(".gz") else open
+
+        with open_city_list(city_list_path, "rt", encoding="utf-8") as f:
+            owm_cities = json.load(f)
+
+        lines = list()
+
+        for owm_city in owm_cities:
+            name = " ".join(owm_city["name"].split())
+            folded_name = CityIndex.fold(name)
+
+            if not folded_name:
+                continue
+
+            latitude = owm_city["coord"]["lat"]
+            longitude = owm_city["coord"]["lon"]
+            population = owm_city.get("stat", {}).get("population", 0)
+            line = "\t".join([folded_name, str(owm_city["id"]), name, owm_city.get("country", ""),
+                              str(latitude), str(longitude), str(population)])
+            lines.append((folded_name.encode("utf-8"), -population, owm_city["id"], line))
+
+        lines.sort()
+
+        with open(index_path, "w", encoding="utf-8", newline="\n") as f:
+            for _, _, _, line in lines:
+                f.write(line + "\n")
+
+        return len(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python discloud/cities.py <owm city list (.json or .json.gz)> <city index>")
+        sys.exit(1)
+
+    print("{} cities written to {}".format(CityIndex.build(sys.argv[1], sys.argv[2]), sys.argv[2]))
@@ -0,0 +1,82 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, List
+
+
+class RequestCoalescer(object):
+    def __init__(self) -> None:
+        self._in_flight = dict()
+
+    @staticmethod
+    def __consume_exception__(future: asyncio.Future) -> None:
+        # avoids "exception was never retrieved" warnings when every waiter has been cancelled
+        if not future.cancelled():
+            future.exception()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._in_flight
+
+    async def run(self, key: Hashable, coroutine_factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._in_flight.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(coroutine_factory())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._in_flight.pop(key, None))
+            future.add_done_callback(RequestCoalescer.__consume_exception__)
+
+        # a cancelled waiter must not cancel the request shared with the other waiters
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def __resolve_keys__(batch_future: asyncio.Future, key_futures: List[asyncio.Future]) -> None:
+        for index, key_future in enumerate(key_futures):
+            if batch_future.cancelled():
+                key_future.cancel()
+            elif batch_future.exception() is not None:
+                key_future.set_exception(batch_future.exception())
+            else:
+                key_future.set_result(batch_future.result()[index])
+
+    def run_many(self, keys: List[Hashable],
+                 coroutine_factory: Callable[[List[Hashable]], Awaitable[List[Any]]]) -> Awaitable[List[Any]]:
+        # A single request for the keys which are not in flight yet (e.g. a batch endpoint), each one of them being
+        # registered on its own so that a concurrent run() of any of these keys waits for this request. Unlike run(),
+        # the keys are registered as soon as it is called, before the returned results are awaited
+        missing_keys = [key for key in dict.fromkeys(keys) if key not in self._in_flight]
+
+        if missing_keys:
+            loop = asyncio.get_event_loop()
+            key_futures = [loop.create_future() for _ in missing_keys]
+
+            for key, key_future in zip(missing_keys, key_futures):
+                self._in_flight[key] = key_future
+                key_future.add_done_callback(lambda f, key=key: self._in_flight.pop(key, None))
+                key_future.add_done_callback(RequestCoalescer.__consume_exception__)
+
+            batch_future = asyncio.ensure_future(coroutine_factory(missing_keys))
+            batch_future.add_done_callback(lambda f: RequestCoalescer.__resolve_keys__(f, key_futures))
+            batch_future.add_done_callback(RequestCoalescer.__consume_exception__)
+
+        results = asyncio.gather(*[self._in_flight[key] for key in keys])
+        results.add_done_callback(RequestCoalescer.__consume_exception__)
+        return asyncio.shield(results)
@@ -16,35 +16,44 @@
 # along with discloud.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import json
 import logging
+import os
 import asyncio
-import configparser
-import schedule
 import discord
 from typing import List
-from settings import Language, MeasurementSystem, ConcurrencyPriority, HomeSettings, ApplicationSettings
+from settings import MeasurementSystem, ConcurrencyPriority, HomeSettings, ApplicationSettings
 from weather import Weather, WeatherForecast, WeatherService
+from cities import UnknownLocationError
 from message_factory import MessageFactory
-
-OWM_CONFIG_PATH = "config/open_weather_map.ini"
+from lookup import get_lookup_tables
+from dispatcher import CommandKind, CommandDispatcher
+from peers import PeerBotIndex
+from broadcast import ForecastChannelIndex, BroadcastMessageDiscordCommand
+from scheduler import AsyncScheduler, DailyJob
+from publisher import HomeWeatherPublisher, HomeWeatherSnapshot
+from guilds import GuildHomeTable
+from hash_ring import ConsistentHashRing
+from metrics import COMMANDS, COMMAND_HANDLING_LATENCY, DISCORD_SEND_LATENCY
 
 
 class SendWeatherDiscordCommand(object):
     def __init__(self,
                  discord_client: discord.Client,
                  channel: discord.TextChannel,
-                 home_settings: HomeSettings,
                  weather: Weather,
+                 is_home: bool,
                  message_factory: MessageFactory) -> None:
         self._discord_client = discord_client
         self._channel = channel
-        self._home_settings = home_settings
         self._weather = weather
+        self._is_home = is_home
         self._message_factory = message_factory
 
     async def execute(self) -> None:
-        msg = self._message_factory.format_weather(self._weather)
-        await self._discord_client.send_message(self._channel, msg)
+        msg = self._message_factory.format_weather(self._weather, self._is_home)
+        with DISCORD_SEND_LATENCY.time():
+            await self._discord_client.send_message(self._channel, msg)
 
 
 class SendForecastDiscordCommand(object):
@@ -52,63 +61,126 @@ class SendForecastDiscordCommand(object):
                  discord_client: discord.Client,
                  channel: discord.TextChannel,
                  forecast: WeatherForecast,
-                 language: Language,
                  message_factory: MessageFactory) -> None:
         self._discord_client = discord_client
         self._channel = channel
         self._forecast = forecast
-        self._language = language
         self._message_factory = message_factory
 
-    def __get_localized_weekday__(self, weekday_index: int) -> str:
-        config = configparser.ConfigParser()
-        config.read("i18n/{}.ini".format(self._language.value))
-        return config["weekdays"][str(weekday_index)]
-
     async def execute(self) -> None:
         msg = self._message_factory.format_weather_forecast(self._forecast)
-        await self._discord_client.send_message(self._channel, msg)
+        with DISCORD_SEND_LATENCY.time():
+            await self._discord_client.send_message(self._channel, msg)
+
+
+class DiscordProfileState(object):
+    # Remembers what has last been applied to the bot profile, so that Discord is only called on actual changes.
+    # Discord only gives the hash of the current avatar, the icons of the uploaded avatars hashes are kept in a file
+    # so that a restart does not upload the avatar again
+
+    _AVATAR_HASHES_PATH = "data/avatar_hashes.json"
+
+    def __init__(self, avatar_hashes_path: str = _AVATAR_HASHES_PATH) -> None:
+        self.avatar_icon = None
+        self.username = None
+        self.presence = None
+        self.weather_presence = None  # the weather part of the presence, whatever its rotation
+        self._avatars_bytes = dict()
+        self._avatar_hashes_path = avatar_hashes_path
+        self._avatar_hashes = dict()  # avatar hash -> google icon code
+
+        try:
+            with open(avatar_hashes_path, "r", encoding="utf-8") as f:
+                self._avatar_hashes = json.load(f)
+        except (OSError, ValueError):
+            logging.debug("no known avatar hashes in '{}'".format(avatar_hashes_path))
+
+    def seed(self, user: discord.User) -> None:
+        # the profile left by the previous run is taken as the applied one
+        self.username = user.name
+        self.avatar_icon = self._avatar_hashes.get(user.avatar)
+
+    def record_avatar(self, avatar_icon: str, avatar_hash: str) -> None:
+        self.avatar_icon = avatar_icon
+        self._avatar_hashes[avatar_hash] = avatar_icon
+
+        try:
+            os.makedirs(os.path.dirname(self._avatar_hashes_path) or ".", exist_ok=True)
+
+            with open(self._avatar_hashes_path, "w", encoding="utf-8") as f:
+                json.dump(self._avatar_hashes, f)
+        except OSError:
+            logging.exception("failed to save the avatar hashes to '{}'".format(self._avatar_hashes_path))
+
+    def get_avatar_bytes(self, google_icon_code: str) -> bytes:
+        avatar_bytes = self._avatars_bytes.get(google_icon_code)
+
+        if avatar_bytes is None:
+            file_path = "images/google/{}.png".format(google_icon_code)
+
+            logging.debug("image to be used as the bot avatar: " + file_path)
+
+            with open(file_path, "rb") as f:
+                avatar_bytes = f.read()
+
+            self._avatars_bytes[google_icon_code] = avatar_bytes
+
+        return avatar_bytes
 
 
 class UpdateWeatherPresenceDiscordCommand(object):
-    def __init__(self, discord_client: discord.Client, weather: Weather, should_help: bool) -> None:
+    def __init__(self,
+                 discord_client: discord.Client,
+                 weather: Weather,
+                 should_help: bool,
+                 profile_state: DiscordProfileState,
+                 presence_marker: str = None) -> None:
         self._discord_client = discord_client
         self._weather = weather
         self._should_help = should_help
+        self._profile_state = profile_state
+        self._presence_marker = presence_marker
 
     async def execute(self) -> None:
-        msg = MessageFactory.format_presence(self._weather, self._should_help)
+        msg = MessageFactory.format_presence(self._weather, self._should_help, self._presence_marker)
+
+        if msg == self._profile_state.presence:
+            logging.debug("discord bot presence is unchanged, no update needed")
+            return
+
         await self._discord_client.change_presence(activity=discord.Game(name=msg))
+        self._profile_state.presence = msg
 
 
 class UpdateWeatherProfileDiscordCommand(object):
-    @staticmethod
-    def __get_avatar_bytes__(weather_code) -> bytearray:
-        config = configparser.ConfigParser()
-        config.read(OWM_CONFIG_PATH)
+    def __init__(self, discord_client: discord.Client, weather: Weather, profile_state: DiscordProfileState) -> None:
+        self._discord_client = discord_client
+        self._weather = weather
+        self._profile_state = profile_state
 
-        google_icon_code = config["google-icons"][str(weather_code)]
+    async def execute(self) -> None:
+        avatar_icon = get_lookup_tables().google_icons[self._weather.weather_code]
+        username = self._weather.location
 
-        file_path = "images/google/{}.png".format(google_icon_code)
+        # avatar edits are heavily rate limited by discord, only the changed fields are sent
+        changes = dict()
 
-        logging.debug("image to be used as the bot avatar: " + file_path)
+        if avatar_icon != self._profile_state.avatar_icon:
+            changes["avatar"] = self._profile_state.get_avatar_bytes(avatar_icon)
 
-        f = open(file_path, "rb")
+        if username != self._profile_state.username:
+            changes["username"] = username
 
-        try:
-            avatar_bytes = f.read()
-        finally:
-            f.close()
+        if not changes:
+            logging.debug("discord bot profile is unchanged, no update needed")
+            return
 
-        return avatar_bytes
+        await self._discord_client.user.edit(password=None, **changes)
 
-    def __init__(self, discord_client: discord.Client, weather: Weather) -> None:
-        self._discord_client = discord_client
-        self._weather = weather
+        if "avatar" in changes:
+            self._profile_state.record_avatar(avatar_icon, self._discord_client.user.avatar)
 
-    async def execute(self) -> None:
-        avatar_bytes = UpdateWeatherProfileDiscordCommand.__get_avatar_bytes__(self._weather.weather_code)
-        await self._discord_client.user.edit(password=None, username=self._weather.location, avatar=avatar_bytes)
+        self._profile_state.username = username
 
 
 class CommandHandler(object):
@@ -119,226 +191,286 @@ class CommandHandler(object):
                  application_settings: ApplicationSettings,
                  weather_service: WeatherService,
                  discord_client: discord.Client,
-                 message_factory: MessageFactory) -> None:
+                 message_factory: MessageFactory,
+                 peer_bot_index: PeerBotIndex,
+                 guild_home_table: GuildHomeTable) -> None:
         self._application_settings = application_settings
         self._weather_service = weather_service
         self._discord_client = discord_client
         self._message_factory = message_factory
+        self._peer_bot_index = peer_bot_index
+        self._guild_home_table = guild_home_table
+        self._dispatcher = CommandDispatcher(application_settings.command_settings)
+        self._hash_rings = dict()  # server id -> ring of the discloud instances of the server
 
-    @staticmethod
-    def __is_discloud_bot__(member: discord.Member) -> bool:
-        if member.game is None:
-            return False
-
-        bot_game_probable_strings = ["°C", "°F", "%", "mph", "kmh", "discloud"]
-        bot_strings_threshold = 2
-
-        member_found_strings = 0
-
-        for probable_string in bot_game_probable_strings:
-            if probable_string in member.game.name:
-                member_found_strings += 1
-
-        return member_found_strings >= bot_strings_threshold
+    def __get_hash_ring__(self, server_id) -> ConsistentHashRing:
+        # the ring is only rebuilt when the instances of the server change
+        instance_ids = self._peer_bot_index.get_peer_ids(server_id) | {self._discord_client.user.id}
+        hash_ring = self._hash_rings.get(server_id)
 
-    @staticmethod
-    def __is_parametized_command__(command) -> bool:
-        return len(command.content.split(" ")) > 1
+        if hash_ring is None or hash_ring.nodes != instance_ids:
+            hash_ring = self._hash_rings[server_id] = ConsistentHashRing(instance_ids)
 
-    @staticmethod
-    def __build_commands__(prefixes: List[str], commands: List[str]) -> List[str]:
-        command_prefixes = list()
-
-        for command in commands:
-            for prefix in prefixes:
-                command_prefixes.append(prefix + command)
-
-        return command_prefixes
+        return hash_ring
 
     def __has_handling_priority__(self, command) -> bool:
-        # Currently, the bot with the lowest ID detains the handling priority
+        # With the partition priority, the channels are spread between the discloud instances of the server,
+        # otherwise the bot with the lowest ID detains the handling priority
 
         if self._application_settings.concurrency_priority is ConcurrencyPriority.ALWAYS:
             return True
         elif self._application_settings.concurrency_priority is ConcurrencyPriority.NEVER:
             return False
+        elif self._application_settings.concurrency_priority is ConcurrencyPriority.PARTITION:
+            hash_ring = self.__get_hash_ring__(command.channel.server.id)
+            return hash_ring.get_node(command.channel.id) == self._discord_client.user.id
 
-        for member in command.channel.server.members:
-            if CommandHandler.__is_discloud_bot__(member) and member.status is discord.Status.online:
-                if member.id < self._discord_client.user.id:
-                    return False
-
-        return True
-
-    def __build_weather_commands__(self) -> List[str]:
-        return CommandHandler.__build_commands__(self._application_settings.command_settings.prefixes,
-                                                 self._application_settings.command_settings.weather)
-
-    def __build_forecast_commands__(self) -> List[str]:
-        return CommandHandler.__build_commands__(self._application_settings.command_settings.prefixes,
-                                                 self._application_settings.command_settings.forecast)
+        lowest_peer_id = self._peer_bot_index.get_lowest_peer_id(command.channel.server.id)
 
-    def __build_help_commands__(self) -> List[str]:
-        return CommandHandler.__build_commands__(self._application_settings.command_settings.prefixes,
-                                                 self._application_settings.command_settings.help)
+        return lowest_peer_id is None or not lowest_peer_id < self._discord_client.user.id
 
-    def __extract_location__(self, command) -> str:
-        content = command.content.replace("@ ", "@").replace("@", "")
-
-        weather_commands = self.__build_weather_commands__()
-        forecast_commands = self.__build_forecast_commands__()
-
-        for prefix in weather_commands:
-            content = content.replace(prefix, "", 1)
-
-        for prefix in forecast_commands:
-            content = content.replace(prefix, "", 1)
+    async def handle_weather(self, command, location: str) -> None:
+        logging.info("handling weather command...")
+        measurement_system = self._application_settings.measurement_system
+        weather = await self._weather_service.get_weather(location, measurement_system)
+        home_settings = self._guild_home_table.get(command.channel.server.id)
 
-        if content is None or content.strip() == "":
-            return self._application_settings.home_settings.full_name
-        else:
-            return content
+        # with a city index, the weather is named after the resolved city (e.g. "Paris" for "paris,fr")
+        is_home = home_settings.display_name.upper() == weather.location.upper() \
+            or self._weather_service.is_same_location(location, home_settings.full_name)
 
-    async def handle_weather(self, command) -> None:
-        logging.info("handling weather command...")
-        location = self.__extract_location__(command)
-        weather = self._weather_service.get_weather(location, self._application_settings.measurement_system)
         await SendWeatherDiscordCommand(self._discord_client,
                                         command.channel,
-                                        self._application_settings.home_settings,
                                         weather,
+                                        is_home,
                                         self._message_factory).execute()
 
-    async def handle_forecast(self, command) -> None:
+    async def handle_forecast(self, command, location: str) -> None:
         logging.info("handling forecast command...")
-        location = self.__extract_location__(command)
-        forecast = self._weather_service.get_forecast(location, self._application_settings.measurement_system)
+        measurement_system = self._application_settings.measurement_system
+        forecast = await self._weather_service.get_forecast(location, measurement_system)
         await SendForecastDiscordCommand(self._discord_client,
                                          command.channel, forecast,
-                                         self._application_settings.language,
                                          self._message_factory).execute()
 
+    def remove_server(self, server: discord.Guild) -> None:
+        self._hash_rings.pop(server.id, None)
+
     async def handle_help(self, command) -> None:
         logging.info("handling help...")
         msg = MessageFactory.format_help()
-        await self._discord_client.send_message(command.channel, msg)
+
+        with DISCORD_SEND_LATENCY.time():
+            await self._discord_client.send_message(command.channel, msg)
 
     async def handle(self, command) -> None:
-        weather_commands = self.__build_weather_commands__()
-        forecast_commands = self.__build_forecast_commands__()
-        help_commands = self.__build_help_commands__()
+        dispatched_command = self._dispatcher.dispatch(command.content)
+
+        if dispatched_command is None:
+            return
+
+        command_kind, location = dispatched_command
+        COMMANDS.inc(command_kind.value)
+
+        with COMMAND_HANDLING_LATENCY.time():
+            await self.__handle_command__(command, command_kind, location)
 
-        if any(command.content.startswith(prefix) for prefix in weather_commands):
-            if not CommandHandler.__is_parametized_command__(command) or self.__has_handling_priority__(command):
-                return await self.handle_weather(command)
+    async def __handle_command__(self, command, command_kind: CommandKind, location: str) -> None:
+        if command_kind is CommandKind.HELP:
+            return await self.handle_help(command)
+
+        # commands without location are answered by every instance, since they target each instance's own home
+        if location is not None and not self.__has_handling_priority__(command):
+            return
+
+        if location is None:
+            location = self._guild_home_table.get(command.channel.server.id).full_name
+
+        try:
+            if command_kind is CommandKind.WEATHER:
+                return await self.handle_weather(command, location)
 
-        if any(command.content.startswith(prefix) for prefix in forecast_commands):
-            if not CommandHandler.__is_parametized_command__(command) or self.__has_handling_priority__(command):
-                return await self.handle_forecast(command)
+            if command_kind is CommandKind.FORECAST:
+                return await self.handle_forecast(command, location)
+        except UnknownLocationError:
+            # the location has been rejected by the city index or by the weather provider
+            logging.info("unknown location '{}'".format(location))
+            msg = MessageFactory.format_unknown_location(location)
 
-        if any(command.content.startswith(prefix) for prefix in help_commands):
-            if True or self.__has_handling_priority__(command):
-                return await self.handle_help(command)
+            with DISCORD_SEND_LATENCY.time():
+                await self._discord_client.send_message(command.channel, msg)
 
 
 class WeatherDiscordService(object):
     _REALTIME_WEATHER_FREQUENCY = 31 * 60  # 31 minutes
-    _HELP_FREQUENCY = 1 * 60  # 1 minute
+    _PRESENCE_FREQUENCY = 1 * 60  # 1 minute, the presence is only sent to discord when it changes
+    _FIRST_PUBLICATION_RETRY_DELAY = 5  # seconds, doubled after each failure
+    _MAX_FIRST_PUBLICATION_RETRY_DELAY = 5 * 60  # 5 minutes
 
     def __init__(self,
                  measurement_system: MeasurementSystem,
-                 home_settings: HomeSettings,
+                 guild_home_table: GuildHomeTable,
                  weather_service: WeatherService,
-                 discord_client: discord.Client) -> None:
+                 discord_client: discord.Client,
+                 message_factory: MessageFactory,
+                 forecast_channel_index: ForecastChannelIndex,
+                 home_weather_publisher: HomeWeatherPublisher,
+                 updates_profile: bool = True,
+                 presence_marker: str = None,
+                 profile_state: DiscordProfileState = None) -> None:
         self._measurement_system = measurement_system
-        self._home_settings = home_settings
+        self._guild_home_table = guild_home_table
         self._weather_service = weather_service
         self._discord_client = discord_client
+        self._message_factory = message_factory
+        self._forecast_channel_index = forecast_channel_index
+        self._home_weather_publisher = home_weather_publisher
+        self._profile_state = profile_state or DiscordProfileState()
+        self._should_help = True
+        self._presence_marker = presence_marker  # advertises the concurrency priority to the other instances
 
-    def __should_send_forecast__(self, channel: discord.TextChannel) -> bool:
-        return channel.name in self._home_settings.periodic_forecast_channels
+        # the bot profile is shared by all the shards, only one process should update it
+        if updates_profile:
+            home_weather_publisher.subscribe(self.update_profile)
 
-    async def update_profile(self) -> None:
+    async def publish_home_weather(self) -> None:
         await self._discord_client.wait_until_ready()
+        retry_delay = WeatherDiscordService._FIRST_PUBLICATION_RETRY_DELAY
 
         while not self._discord_client.is_closed():
             try:
-                logging.debug("updating discord bot profile...")
-                weather = self._weather_service.get_weather(self._home_settings.full_name, self._measurement_system)
-                weather.location = self._home_settings.display_name
-                await UpdateWeatherProfileDiscordCommand(self._discord_client, weather).execute()
-                logging.debug("discord bot profile updated successfully")
-                await asyncio.sleep(WeatherDiscordService._REALTIME_WEATHER_FREQUENCY)
-            except discord.HTTPException:
-                logging.exception("discord bot profile update failed")
+                logging.debug("publishing the home weather...")
+                await self._home_weather_publisher.publish()
+            except Exception:
+                logging.exception("home weather publication failed")
+
+                # the presence waits for the first snapshot, which is retried sooner than the next publication
+                if self._home_weather_publisher.snapshot is None:
+                    await asyncio.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, WeatherDiscordService._MAX_FIRST_PUBLICATION_RETRY_DELAY)
+                    continue
+
+            await asyncio.sleep(WeatherDiscordService._REALTIME_WEATHER_FREQUENCY)
 
         logging.warning("discord connection has closed")
 
+    def seed_profile_state(self) -> None:
+        self._profile_state.seed(self._discord_client.user)
+
+    async def update_profile(self, snapshot: HomeWeatherSnapshot) -> None:
+        try:
+            logging.debug("updating discord bot profile...")
+            await UpdateWeatherProfileDiscordCommand(self._discord_client,
+                                                     snapshot.weather,
+                                                     self._profile_state).execute()
+            logging.debug("discord bot profile updated successfully")
+        except discord.HTTPException:
+            logging.exception("discord bot profile update failed")
+
     async def update_presence(self) -> None:
         await self._discord_client.wait_until_ready()
-        await asyncio.sleep(5)  # to mitigate concurrency problems with update_profile()
-
-        weather = None
-        should_help = False
+        await self._home_weather_publisher.wait_for_snapshot()
 
         while not self._discord_client.is_closed():
             try:
-                logging.debug("updating discord bot presence...")
-
-                if weather is None:
-                    weather = self._weather_service.get_weather(self._home_settings.full_name, self._measurement_system)
-                    weather_date = datetime.datetime.now()
-                else:
-                    seconds_since_realtime_update = (datetime.datetime.now() - weather_date).total_seconds()
-
-                    if seconds_since_realtime_update >= WeatherDiscordService._REALTIME_WEATHER_FREQUENCY:
-                        weather = self._weather_service.get_weather(self._home_settings.full_name,
-                                                                    self._measurement_system)
-                        weather_date = datetime.datetime.now()
-
-                await UpdateWeatherPresenceDiscordCommand(self._discord_client, weather, should_help).execute()
-                should_help = not should_help
-                logging.debug("discord bot presence updated successfully")
-                await asyncio.sleep(WeatherDiscordService._HELP_FREQUENCY)
+                await self.update_presence_once()
             except discord.HTTPException:
                 logging.exception("discord bot presence update failed")
 
-        logging.warning("discord connection has closed")
+            await asyncio.sleep(WeatherDiscordService._PRESENCE_FREQUENCY)
 
-    async def send_home_forecast(self) -> None:
-        def __periodically_send_morning_forecast__() -> None:
-            __send_home_forecast__("sending periodic morning weather forecast...",
-                                   lambda weathers: list(filter(lambda w: w.date == datetime.date.today(), weathers)))
-
-        def __periodically_send_evening_forecast__() -> None:
-            __send_home_forecast__("sending periodic evening weather forecast...",
-                                   lambda weathers: list(filter(lambda w: w.date != datetime.date.today(), weathers)))
-
-        def __send_home_forecast__(logging_header: str, weathers_predicate) -> None:
-            logging.debug(logging_header)
-
-            forecast = self._weather_service.get_forecast(self._home_settings.full_name, self._measurement_system)
-
-            forecast.weathers = weathers_predicate(forecast.weathers)
-
-            for channel in self._discord_client.get_all_channels():
-                if self.__should_send_forecast__(channel):
-                    try:
-                        asyncio.get_event_loop().run_until_complete(
-                            SendForecastDiscordCommand(self._discord_client, channel, forecast).execute())
-                    except discord.HTTPException:
-                        msg_template = "failed to send home weather forecast (@{}) to channel {}.{}"
-                        msg = msg_template.format(self._home_settings.full_name, channel.server.name, channel.name)
-                        logging.exception(msg)
-
-        if self._home_settings.morning_forecast_time is not None:
-            schedule.every().day.at(self._home_settings.morning_forecast_time)\
-                .do(__periodically_send_morning_forecast__)
-
-        if self._home_settings.evening_forecast_time is not None:
-            schedule.every().day.at(self._home_settings.evening_forecast_time)\
-                .do(__periodically_send_evening_forecast__)
+        logging.warning("discord connection has closed")
 
-        while True:
-            schedule.run_pending()
-            await asyncio.sleep(1)
+    async def update_presence_once(self) -> None:
+        # the help presence and the weather one take turns when the weather changes, rather than every minute, so
+        # that the presence is only sent to discord when it changes
+        weather = self._home_weather_publisher.snapshot.weather
+        weather_presence = MessageFactory.format_presence(weather, False)
+
+        if weather_presence != self._profile_state.weather_presence:
+            self._should_help = not self._should_help
+            self._profile_state.weather_presence = weather_presence
+
+        logging.debug("updating discord bot presence...")
+        await UpdateWeatherPresenceDiscordCommand(self._discord_client,
+                                                  weather,
+                                                  self._should_help,
+                                                  self._profile_state,
+                                                  self._presence_marker).execute()
+
+    async def __send_home_forecast__(self, full_name: str, channels: List[discord.TextChannel],
+                                     weathers_predicate) -> None:
+        try:
+            home_forecast = await self._weather_service.get_forecast(full_name, self._measurement_system)
+        except Exception:
+            # the other homes forecasts are still sent
+            logging.exception("failed to fetch the home weather forecast (@{})".format(full_name))
+            return
+
+        forecast = WeatherForecast(weathers_predicate(home_forecast.weathers))
+
+        if not forecast.weathers:
+            logging.warning("there is no home weather forecast (@{}) to send".format(full_name))
+            return
+
+        # the forecast is fetched and rendered once, whatever the number of guilds sharing this home
+        msg = self._message_factory.format_weather_forecast(forecast)
+        sent_count = await BroadcastMessageDiscordCommand(self._discord_client, channels, msg).execute()
+
+        logging.debug("home weather forecast (@{}) sent to {}/{} channel(s)".format(full_name,
+                                                                                    sent_count,
+                                                                                    len(channels)))
+
+    async def __send_home_forecasts__(self, logging_header: str, is_scheduled_home, weathers_predicate) -> None:
+        logging.debug(logging_header)
+
+        # the homes are grouped as the weather cache does, so that e.g. "Paris,FR" and "paris, fr" share a forecast
+        channels_by_location = dict()  # location key -> (home full name, channels)
+
+        for channel in self._forecast_channel_index.channels:
+            home_settings = self._guild_home_table.get(channel.server.id)
+
+            if is_scheduled_home(home_settings):
+                location_key = self._weather_service.get_location_key(home_settings.full_name)
+                channels_by_location.setdefault(location_key, (home_settings.full_name, list()))[1].append(channel)
+
+        await asyncio.gather(*[self.__send_home_forecast__(full_name, channels, weathers_predicate)
+                               for full_name, channels in channels_by_location.values()])
+
+    def schedule_home_forecasts(self, scheduler: AsyncScheduler) -> None:
+        # a single job per distinct time and timezone, shared by all the guilds forecasting at that time
+        morning_slots = {(home_settings.morning_forecast_time, home_settings.forecast_timezone)
+                         for home_settings in self._guild_home_table.get_all()
+                         if home_settings.morning_forecast_time is not None}
+
+        evening_slots = {(home_settings.evening_forecast_time, home_settings.forecast_timezone)
+                         for home_settings in self._guild_home_table.get_all()
+                         if home_settings.evening_forecast_time is not None}
+
+        def __send_morning_forecasts__(forecast_time: str, timezone: datetime.tzinfo):
+            async def __send__() -> None:
+                today = datetime.datetime.now(timezone).date()
+                await self.__send_home_forecasts__("sending periodic morning weather forecasts...",
+                                                   lambda h: h.morning_forecast_time == forecast_time
+                                                   and h.forecast_timezone == timezone,
+                                                   lambda weathers: [w for w in weathers if w.date == today])
+            return __send__
+
+        def __send_evening_forecasts__(forecast_time: str, timezone: datetime.tzinfo):
+            async def __send__() -> None:
+                today = datetime.datetime.now(timezone).date()
+                await self.__send_home_forecasts__("sending periodic evening weather forecasts...",
+                                                   lambda h: h.evening_forecast_time == forecast_time
+                                                   and h.forecast_timezone == timezone,
+                                                   lambda weathers: [w for w in weathers if w.date != today])
+            return __send__
+
+        for forecast_time, timezone in morning_slots:
+            time_of_day = datetime.datetime.strptime(forecast_time, "%H:%M").time()
+            scheduler.add_job(DailyJob(time_of_day, timezone, __send_morning_forecasts__(forecast_time, timezone),
+                                       ("morning", forecast_time, timezone)))
+
+        for forecast_time, timezone in evening_slots:
+            time_of_day = datetime.datetime.strptime(forecast_time, "%H:%M").time()
+            scheduler.add_job(DailyJob(time_of_day, timezone, __send_evening_forecasts__(forecast_time, timezone),
+                                       ("evening", forecast_time, timezone)))
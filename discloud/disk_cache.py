@@ -0,0 +1,117 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from cache import CacheTier
+
+
+class SqliteCacheTier(CacheTier):
+    # The entries expiration is a wall clock time (unlike the in-memory cache), so that it survives restarts.
+    # Every query runs on a single dedicated thread, which owns the sqlite connection
+
+    _COMPACTION_FREQUENCY = 10 * 60  # 10 minutes
+
+    def __init__(self, file_path: str, max_size: int) -> None:
+        if max_size <= 0:
+            raise ValueError("the disk cache maximum size must be > 0")
+
+        self._file_path = file_path
+        self._max_size = max_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache")
+        self._connection = self._executor.submit(self.__connect__).result()
+
+        logging.info("weather cache persisted in {}".format(file_path))
+
+    def __connect__(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self._file_path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = sqlite3.connect(self._file_path)
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")  # only effective on a new database file
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")  # a lost cache entry is not worth an fsync per write
+        connection.execute("CREATE TABLE IF NOT EXISTS entries ("
+                           "key TEXT PRIMARY KEY, value TEXT NOT NULL, expiration REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_expiration ON entries (expiration)")
+        connection.commit()
+        return connection
+
+    async def __run__(self, function, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def __get__(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        row = self._connection.execute("SELECT value, expiration FROM entries WHERE key = ? AND expiration > ?",
+                                       (key, now)).fetchone()
+        return None if row is None else (row[0], row[1] - now)
+
+    def __set__(self, key: str, value: str, ttl: float) -> None:
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO entries (key, value, expiration) VALUES (?, ?, ?)",
+                                     (key, value, time.time() + ttl))
+
+    def __compact__(self) -> int:
+        with self._connection:
+            expired_count = self._connection.execute("DELETE FROM entries WHERE expiration <= ?",
+                                                     (time.time(),)).rowcount
+
+            # above the size cap, the entries closest to their expiration are evicted first
+            evicted_count = self._connection.execute("DELETE FROM entries WHERE key IN ("
+                                                     "SELECT key FROM entries ORDER BY expiration DESC "
+                                                     "LIMIT -1 OFFSET ?)", (self._max_size,)).rowcount
+
+        self._connection.execute("PRAGMA incremental_vacuum")
+        return expired_count + evicted_count
+
+    async def get(self, key: str) -> Optional[Tuple[str, float]]:
+        try:
+            return await self.__run__(self.__get__, key)
+        except sqlite3.Error:
+            logging.exception("failed to read the weather cache entry '{}' from the disk".format(key))
+            return None
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        if ttl <= 0:
+            return
+
+        try:
+            await self.__run__(self.__set__, key, value, ttl)
+        except sqlite3.Error:
+            logging.exception("failed to write the weather cache entry '{}' to the disk".format(key))
+
+    async def maintain(self) -> None:
+        while True:
+            try:
+                removed_count = await self.__run__(self.__compact__)
+                logging.debug("{} entries removed from the disk weather cache".format(removed_count))
+            except sqlite3.Error:
+                logging.exception("failed to compact the disk weather cache")
+
+            await asyncio.sleep(SqliteCacheTier._COMPACTION_FREQUENCY)
+
+    def close(self) -> None:
+        self._executor.submit(self._connection.close).result()
+        self._executor.shutdown()
@@ -0,0 +1,70 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from enum import Enum
+from typing import List, Optional, Tuple
+from settings import CommandSettings
+
+
+class CommandKind(Enum):
+    WEATHER = "weather"
+    FORECAST = "forecast"
+    HELP = "help"
+
+
+class CommandDispatcher(object):
+    def __init__(self, command_settings: CommandSettings) -> None:
+        prefixes = [prefix for prefix in command_settings.prefixes if prefix]
+
+        # most messages are not commands, they are rejected by their first character without running the regex
+        self._prefixes_first_characters = frozenset(prefix[0] for prefix in prefixes)
+
+        commands_pattern = "|".join("(?P<{}>{})".format(kind.value, CommandDispatcher.__build_alternation__(names))
+                                    for kind, names in [(CommandKind.WEATHER, command_settings.weather),
+                                                        (CommandKind.FORECAST, command_settings.forecast),
+                                                        (CommandKind.HELP, command_settings.help)])
+
+        pattern = "(?:{})(?:{})(?P<argument>.*)".format(CommandDispatcher.__build_alternation__(prefixes),
+                                                       commands_pattern)
+
+        self._regex = re.compile(pattern, re.DOTALL)
+
+    @staticmethod
+    def __build_alternation__(strings: List[str]) -> str:
+        # the longest strings come first so that a command is never shadowed by one of its own prefixes
+        return "|".join(re.escape(string) for string in sorted(strings, key=len, reverse=True) if string)
+
+    @staticmethod
+    def __extract_location__(argument: str) -> Optional[str]:
+        location = argument.replace("@ ", "@").replace("@", "").strip()
+        return location if location else None
+
+    def dispatch(self, content: str) -> Optional[Tuple[CommandKind, Optional[str]]]:
+        if not content or content[0] not in self._prefixes_first_characters:
+            return None
+
+        match = self._regex.match(content)
+
+        if match is None:
+            return None
+
+        for kind in CommandKind:
+            if match.group(kind.value) is not None:
+                return kind, CommandDispatcher.__extract_location__(match.group("argument"))
+
+        return None
@@ -0,0 +1,44 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Dict, List
+from settings import HomeSettings
+
+
+class GuildHomeTable(object):
+    # The home settings of each guild, the guilds without their own home sharing the default one
+
+    def __init__(self, default_home_settings: HomeSettings, guild_home_settings: Dict[int, HomeSettings]) -> None:
+        self._default_home_settings = default_home_settings
+        self._guild_home_settings = dict(guild_home_settings)
+
+    def __len__(self) -> int:
+        return len(self._guild_home_settings)
+
+    @property
+    def default(self) -> HomeSettings:
+        return self._default_home_settings
+
+    def get(self, guild_id) -> HomeSettings:
+        # the ids are integers in the guilds configuration, but may be strings in the gateway objects
+        try:
+            return self._guild_home_settings.get(int(guild_id), self._default_home_settings)
+        except (TypeError, ValueError):
+            return self._default_home_settings
+
+    def get_all(self) -> List[HomeSettings]:
+        return [self._default_home_settings] + list(self._guild_home_settings.values())
@@ -0,0 +1,50 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import hashlib
+from typing import Hashable, Iterable
+
+
+class ConsistentHashRing(object):
+    # Each node owns the keys hashed between its points and the previous ones on the ring, so that adding or removing
+    # a node only moves the keys of that node. The hash must be the same for every bot instance, hence blake2b
+    # instead of the (randomized) builtin hash()
+
+    _VIRTUAL_NODES = 160  # points per node, which evens out the share of each node
+
+    def __init__(self, nodes: Iterable[Hashable], virtual_nodes: int = _VIRTUAL_NODES) -> None:
+        self._nodes = frozenset(nodes)
+        points = sorted((ConsistentHashRing.__hash_key__("{}#{}".format(node, replica)), str(node), node)
+                        for node in self._nodes for replica in range(virtual_nodes))
+        self._hashes = [point_hash for point_hash, _, _ in points]
+        self._owners = [node for _, _, node in points]
+
+    @staticmethod
+    def __hash_key__(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    @property
+    def nodes(self) -> frozenset:
+        return self._nodes
+
+    def get_node(self, key: Hashable) -> Hashable:
+        if not self._hashes:
+            return None
+
+        index = bisect.bisect(self._hashes, ConsistentHashRing.__hash_key__(str(key)))
+        return self._owners[index % len(self._owners)]
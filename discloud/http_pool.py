@@ -0,0 +1,74 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import aiohttp
+
+
+class HttpConnectionPool(object):
+    _MAX_CONNECTIONS = 64
+    _MAX_CONNECTIONS_PER_HOST = 16
+    _KEEPALIVE_TIMEOUT = 60  # seconds before an idle connection is closed
+    _REQUEST_TIMEOUT = 10  # seconds
+    _STALE_CONNECTION_RETRIES = 1
+
+    # errors raised when a pooled connection has been closed by the server while it was idle
+    _STALE_CONNECTION_ERRORS = (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError)
+
+    def __init__(self,
+                 max_connections: int = _MAX_CONNECTIONS,
+                 max_connections_per_host: int = _MAX_CONNECTIONS_PER_HOST,
+                 keepalive_timeout: float = _KEEPALIVE_TIMEOUT,
+                 request_timeout: float = _REQUEST_TIMEOUT) -> None:
+        self._max_connections = max_connections
+        self._max_connections_per_host = max_connections_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._request_timeout = request_timeout
+        self._session = None
+
+    def __get_session__(self) -> aiohttp.ClientSession:
+        # the session is bound to the running event loop, so it can only be created from a coroutine
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._max_connections,
+                                             limit_per_host=self._max_connections_per_host,
+                                             keepalive_timeout=self._keepalive_timeout)
+
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self._request_timeout))
+
+        return self._session
+
+    async def get_json(self, url: str, params: dict = None):
+        attempt = 0
+
+        while True:
+            try:
+                async with self.__get_session__().get(url, params=params) as response:
+                    response.raise_for_status()
+                    data = await response.text(encoding="utf-8")
+                    return json.loads(data)
+            except HttpConnectionPool._STALE_CONNECTION_ERRORS:
+                if attempt >= HttpConnectionPool._STALE_CONNECTION_RETRIES:
+                    raise
+
+                attempt += 1
+                logging.debug("stale pooled connection, retrying the request...")
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,80 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import configparser
+from types import MappingProxyType
+from typing import Mapping
+from settings import Language
+
+
+class LookupTables(object):
+    _OWM_CONFIG_PATH = "config/open_weather_map.ini"
+    _WU_CONFIG_PATH = "config/weather_underground.ini"
+    _I18N_PATH_TEMPLATE = "i18n/{}.ini"
+
+    def __init__(self,
+                 discord_icons: Mapping[int, str],
+                 google_icons: Mapping[int, str],
+                 owm_codes: Mapping[str, int],
+                 weekdays: Mapping[Language, Mapping[int, str]]) -> None:
+        self.discord_icons = discord_icons
+        self.google_icons = google_icons
+        self.owm_codes = owm_codes
+        self.weekdays = weekdays
+
+    @staticmethod
+    def __read_config__(path: str) -> configparser.ConfigParser:
+        config = configparser.ConfigParser()
+
+        if not config.read(path, encoding="utf-8"):
+            raise ValueError("the lookup table file '{}' cannot be read".format(path))
+
+        return config
+
+    @staticmethod
+    def __by_weather_code__(section) -> Mapping[int, str]:
+        return MappingProxyType({int(code): value for code, value in section.items()})
+
+    @staticmethod
+    def load() -> "LookupTables":
+        owm_config = LookupTables.__read_config__(LookupTables._OWM_CONFIG_PATH)
+        wu_config = LookupTables.__read_config__(LookupTables._WU_CONFIG_PATH)
+
+        discord_icons = LookupTables.__by_weather_code__(owm_config["discord-icons"])
+        google_icons = LookupTables.__by_weather_code__(owm_config["google-icons"])
+        owm_codes = MappingProxyType({wu_icon: int(code) for wu_icon, code in wu_config["owm-codes"].items()})
+
+        weekdays = dict()
+
+        for language in Language:
+            i18n_config = LookupTables.__read_config__(LookupTables._I18N_PATH_TEMPLATE.format(language.value))
+            weekdays[language] = MappingProxyType({int(index): name
+                                                   for index, name in i18n_config["weekdays"].items()})
+
+        return LookupTables(discord_icons, google_icons, owm_codes, MappingProxyType(weekdays))
+
+
+_lookup_tables = None
+
+
+def get_lookup_tables() -> LookupTables:
+    global _lookup_tables
+
+    if _lookup_tables is None:
+        _lookup_tables = LookupTables.load()
+
+    return _lookup_tables
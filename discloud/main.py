@@ -15,40 +15,289 @@
 # You should have received a copy of the GNU General Public License
 # along with discloud.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
 import discord
+from typing import Callable, List
 from command import CommandHandler, WeatherDiscordService
-from weather import WeatherService
-from settings import ApplicationSettings
+from weather import WeatherService, WeatherUndergroundRepository, OpenWeatherMapRepository
+from http_pool import HttpConnectionPool
+from cities import CityIndex
+from disk_cache import SqliteCacheTier
+from settings import ApplicationSettings, ConcurrencyPriority
 from message_factory import MessageFactory
+from lookup import get_lookup_tables
+from peers import PeerBotIndex
+from broadcast import ForecastChannelIndex
+from scheduler import AsyncScheduler
+from publisher import HomeWeatherPublisher
+from guilds import GuildHomeTable
+from cache import CacheTier
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+from shared_state import SharedStateServer, SharedStateClient, SharedRateLimiter
+from metrics import MetricsServer, CACHE_REQUESTS, PROVIDER_QUOTA_REMAINING
 
 
 class Application(object):
+    _STATE_SERVER_STARTUP_TIMEOUT = 10  # seconds
+
     def __init__(self, application_settings: ApplicationSettings) -> None:
         self._settings = application_settings
 
+    def __create_disk_cache_tier__(self) -> CacheTier:
+        cache_settings = self._settings.cache_settings
+
+        if not cache_settings.disk_path:
+            return None
+
+        return SqliteCacheTier(cache_settings.disk_path, cache_settings.disk_max_size)
+
     def run(self) -> None:
-        discord_client = discord.Client()
+        get_lookup_tables()  # the lookup tables are loaded once, before handling any message
+
+        sharding_settings = self._settings.sharding_settings
+
+        if not sharding_settings.enabled:
+            self.__run_client__(discord.Client(), self.__create_disk_cache_tier__())
+        elif sharding_settings.process_count == 1:
+            discord_client = discord.AutoShardedClient(shard_count=sharding_settings.shard_count)
+            self.__run_client__(discord_client, self.__create_disk_cache_tier__())
+        else:
+            self.__run_processes__()
+
+    def __run_state_server__(self) -> None:
+        rate_limits = {WeatherUndergroundRepository.NAME: WeatherUndergroundRepository.RATE_LIMITS,
+                       OpenWeatherMapRepository.NAME: OpenWeatherMapRepository.RATE_LIMITS}
+
+        server = SharedStateServer(self._settings.sharding_settings.state_socket_path,
+                                   self._settings.cache_settings.max_size,
+                                   rate_limits,
+                                   self.__create_disk_cache_tier__())
+
+        asyncio.run(server.serve())
+
+    def __run_shard_process__(self, shard_ids: List[int], process_index: int) -> None:
+        sharding_settings = self._settings.sharding_settings
+        state_client = SharedStateClient(sharding_settings.state_socket_path)
+        shared_rate_limiters = list()
+
+        def __create_rate_limiter__(name: str, limits: List[RateLimit]) -> SlidingWindowRateLimiter:
+            rate_limiter = SharedRateLimiter(state_client, name, limits)
+            shared_rate_limiters.append(rate_limiter)
+            return rate_limiter
+
+        logging.info("shard process {} starting with the shards {}".format(os.getpid(), shard_ids))
+
+        discord_client = discord.AutoShardedClient(shard_ids=shard_ids, shard_count=sharding_settings.shard_count)
+        self.__run_client__(discord_client, state_client, __create_rate_limiter__, shared_rate_limiters,
+                            process_index)
+
+    @staticmethod
+    def __get_process_context__() -> multiprocessing.context.BaseContext:
+        # the processes inherit the loaded settings and the bound methods they run, which only the fork start method
+        # provides (forkserver is the default on linux since python 3.14, spawn on windows and macos)
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("the shard processes need the fork start method, which this platform does not support "
+                             "(set SHARD_PROCESSES to 1)")
+
+        return multiprocessing.get_context("fork")
+
+    def __run_processes__(self) -> None:
+        # a state server process shares the weather cache and rate limits of the shard processes, which each run
+        # their own event loop over a contiguous range of shards
+        process_context = Application.__get_process_context__()
+        sharding_settings = self._settings.sharding_settings
+        shard_ids = list(range(sharding_settings.shard_count))
+        process_count = sharding_settings.process_count
+        shard_ranges = [shard_ids[i * len(shard_ids) // process_count:(i + 1) * len(shard_ids) // process_count]
+                        for i in range(process_count)]
+
+        # a socket left over by a previous run would be taken for the one of the new state server
+        if os.path.exists(sharding_settings.state_socket_path):
+            os.remove(sharding_settings.state_socket_path)
+
+        state_server = process_context.Process(target=self.__run_state_server__, name="discloud-state")
+        state_server.start()
+
+        deadline = time.monotonic() + Application._STATE_SERVER_STARTUP_TIMEOUT
+
+        while not os.path.exists(sharding_settings.state_socket_path) and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        processes = [state_server] + [process_context.Process(target=self.__run_shard_process__,
+                                                              args=(shard_range, index),
+                                                              name="discloud-shards-{}".format(index))
+                                      for index, shard_range in enumerate(shard_ranges)]
+
+        for process in processes[1:]:
+            process.start()
+
+        # the processes live and die together, so that a restart policy (e.g. docker) restarts them all
+        multiprocessing.connection.wait([process.sentinel for process in processes])
+
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+            process.join()
+
+        logging.error("a discloud process has stopped, the other ones have been stopped as well")
+
+    @staticmethod
+    def __register_weather_metrics__(weather_service: WeatherService) -> None:
+        cache = weather_service.cache
+        CACHE_REQUESTS.set_function(lambda: cache.hits, "hit")
+        CACHE_REQUESTS.set_function(lambda: cache.misses, "miss")
+
+        windows = {SlidingWindowRateLimiter.MINUTE: "minute", SlidingWindowRateLimiter.DAY: "day"}
+
+        for repository in weather_service.router.repositories:
+            rate_limiter = repository.rate_limiter
+
+            for limit in rate_limiter.limits:
+                # the loop variables are bound as default arguments, to be read when the metrics are rendered
+                PROVIDER_QUOTA_REMAINING.set_function(lambda r=rate_limiter, p=limit.period: r.get_remaining(p),
+                                                      repository.NAME, windows.get(limit.period, str(limit.period)))
+
+    def __run_client__(self,
+                       discord_client: discord.Client,
+                       cache_tier: CacheTier,
+                       rate_limiter_factory: Callable[[str, List[RateLimit]], SlidingWindowRateLimiter] = None,
+                       shared_rate_limiters: List[SharedRateLimiter] = (),
+                       process_index: int = 0) -> None:
+        # with several shard processes, only the first one updates the bot profile, and each one serves its metrics
+        # on its own port (METRICS_PORT + process index)
+
+        http_pool = HttpConnectionPool()
 
         weather_service = WeatherService(self._settings.integration_settings.open_weather_map_api_key,
-                                         self._settings.integration_settings.weather_underground_api_key)
+                                         self._settings.integration_settings.weather_underground_api_key,
+                                         self._settings.cache_settings,
+                                         self._settings.hedging_settings,
+                                         self._settings.prefetch_settings,
+                                         http_pool,
+                                         CityIndex.load(self._settings.location_settings.city_index_path),
+                                         cache_tier,
+                                         rate_limiter_factory,
+                                         self._settings.integration_settings.open_weather_map_base_url,
+                                         self._settings.integration_settings.weather_underground_base_url)
 
         message_factory = MessageFactory(self._settings)
 
+        # the partition instances only share the channels with the instances advertising the partition priority,
+        # since the others do not know about the ring
+        is_partitioned = self._settings.concurrency_priority is ConcurrencyPriority.PARTITION
+        peer_bot_index = PeerBotIndex(is_partitioned)
+
+        guild_home_table = GuildHomeTable(self._settings.home_settings, self._settings.guild_home_settings)
+
         command_handler = CommandHandler(self._settings,
                                          weather_service,
                                          discord_client,
-                                         message_factory)
+                                         message_factory,
+                                         peer_bot_index,
+                                         guild_home_table)
+
+        forecast_channel_index = ForecastChannelIndex(guild_home_table)
+
+        home_weather_publisher = HomeWeatherPublisher(self._settings.measurement_system,
+                                                      self._settings.home_settings,
+                                                      weather_service)
 
         weather_discord_service = WeatherDiscordService(self._settings.measurement_system,
-                                                        self._settings.home_settings,
+                                                        guild_home_table,
                                                         weather_service,
-                                                        discord_client)
+                                                        discord_client,
+                                                        message_factory,
+                                                        forecast_channel_index,
+                                                        home_weather_publisher,
+                                                        process_index == 0,
+                                                        PeerBotIndex.PARTITION_MARKER if is_partitioned else None)
 
         @discord_client.event
         async def on_message(message) -> None:
             await command_handler.handle(message)
 
-        discord_client.loop.create_task(weather_discord_service.send_home_forecast())
-        discord_client.loop.create_task(weather_discord_service.update_profile())
+        @discord_client.event
+        async def on_ready() -> None:
+            weather_discord_service.seed_profile_state()
+            peer_bot_index.index_servers(discord_client.servers)
+            forecast_channel_index.index_channels(discord_client.get_all_channels())
+
+        @discord_client.event
+        async def on_server_join(server) -> None:
+            peer_bot_index.index_server(server)
+            forecast_channel_index.index_server(server)
+
+        @discord_client.event
+        async def on_server_remove(server) -> None:
+            peer_bot_index.remove_server(server)
+            forecast_channel_index.remove_server(server)
+            command_handler.remove_server(server)
+
+        @discord_client.event
+        async def on_channel_create(channel) -> None:
+            forecast_channel_index.update_channel(channel)
+
+        @discord_client.event
+        async def on_channel_update(before, after) -> None:
+            forecast_channel_index.update_channel(after)
+
+        @discord_client.event
+        async def on_channel_delete(channel) -> None:
+            forecast_channel_index.remove_channel(channel)
+
+        @discord_client.event
+        async def on_member_join(member) -> None:
+            peer_bot_index.update_member(member)
+
+        @discord_client.event
+        async def on_member_update(before, after) -> None:
+            peer_bot_index.update_member(after)
+
+        @discord_client.event
+        async def on_member_remove(member) -> None:
+            peer_bot_index.remove_member(member)
+
+        scheduler = AsyncScheduler()
+        weather_discord_service.schedule_home_forecasts(scheduler)
+        scheduler.start(discord_client.loop)
+
+        discord_client.loop.create_task(weather_service.refresh_ahead())
+
+        if cache_tier is not None:
+            discord_client.loop.create_task(cache_tier.maintain())
+
+        for rate_limiter in shared_rate_limiters:
+            discord_client.loop.create_task(rate_limiter.keep_synced())
+
+        if self._settings.metrics_settings.port is not None:
+            Application.__register_weather_metrics__(weather_service)
+            metrics_server = MetricsServer(self._settings.metrics_settings.port + process_index)
+            discord_client.loop.create_task(metrics_server.start())
+            discord_client.loop.create_task(metrics_server.monitor_event_loop_lag())
+
+        discord_client.loop.create_task(weather_discord_service.publish_home_weather())
         discord_client.loop.create_task(weather_discord_service.update_presence())
-        discord_client.run(self._settings.integration_settings.discord_bot_token)
+
+        # the loop is run here rather than by discord_client.run(), which closes it: the pooled provider connections
+        # must be closed on the loop they were opened on
+        loop = discord_client.loop
+
+        try:
+            loop.run_until_complete(discord_client.start(self._settings.integration_settings.discord_bot_token))
+        except KeyboardInterrupt:
+            loop.run_until_complete(discord_client.logout())
+        finally:
+            pending_tasks = asyncio.all_tasks(loop)
+
+            for task in pending_tasks:
+                task.cancel()
+
+            loop.run_until_complete(asyncio.gather(*pending_tasks, return_exceptions=True))
+            loop.run_until_complete(http_pool.close())
+            loop.close()
@@ -1,11 +1,11 @@
-import configparser
+from typing import Dict, Tuple
 from settings import Language, MeasurementSystem, ApplicationSettings
 from weather import Weather, WeatherForecast
+from lookup import get_lookup_tables
+from cache import TtlLruCache
 
 
 class MessageFactory(object):
-    _OWM_CONFIG_PATH = "config/open_weather_map.ini"
-
     _DIGITS_WIDTHS = {'0': 3, '1': 2, '2': 3, '3': 3, '4': 3, '5': 3, '6': 3, '7': 3, '8': 3, '9': 3}
 
     _LOWERS_WIDTHS = {'a': 3, 'b': 3, 'c': 3, 'd': 3, 'e': 3, 'f': 2, 'g': 3, 'h': 3, 'i': 2, 'j': 2, 'k': 3, 'l': 2,
@@ -20,20 +20,28 @@ class MessageFactory(object):
 
     _CHARACTERS_WIDTHS = {**_DIGITS_WIDTHS, **_LOWERS_WIDTHS, **_UPPERS_WIDTHS, **_SPECIALS_WIDTHS}
 
+    _WEEKDAY_WIDTH = 10.5
+    _RENDER_CACHE_MAX_SIZE = 1024
+
     def __init__(self, application_settings: ApplicationSettings):
         self._application_settings = application_settings
+        self._lookup_tables = get_lookup_tables()
 
-    @staticmethod
-    def __get_text_width__(text: str) -> float:
-        width = 0
+        # the forecast columns widths only depend on the measurement system, and the weekday cells on the language
+        self._column_widths = {measurement_system: MessageFactory.__get_column_widths__(measurement_system)
+                               for measurement_system in MeasurementSystem}
+
+        self._weekday_cells = {language: {index: MessageFactory.__add_margin__(weekday, MessageFactory._WEEKDAY_WIDTH)
+                                          for index, weekday in weekdays.items()}
+                               for language, weekdays in self._lookup_tables.weekdays.items()}
 
-        for c in text:
-            if c in MessageFactory._CHARACTERS_WIDTHS:
-                width += MessageFactory._CHARACTERS_WIDTHS[c]
-            else:
-                width += 1
+        # the same weathers are rendered again and again (e.g. broadcast to every channel), the renders are keyed
+        # on the rendered data itself, so they never expire
+        self._render_cache = TtlLruCache(MessageFactory._RENDER_CACHE_MAX_SIZE)
 
-        return width
+    @staticmethod
+    def __get_text_width__(text: str) -> float:
+        return sum(MessageFactory._CHARACTERS_WIDTHS.get(c, 1) for c in text)
 
     @staticmethod
     def __get_temperature_suffix__(measurement_system: MeasurementSystem) -> str:
@@ -57,62 +65,69 @@ class MessageFactory(object):
         full_date_margin = round(max_width) - round(text_width)
         return (" " * full_date_margin) + text
 
-    def __get_localized_weekday__(self, weekday_index: int) -> str:
-        config = configparser.ConfigParser()
-        config.read("i18n/{}.ini".format(self._application_settings.language.value))
-        return config["weekdays"][str(weekday_index)]
+    @staticmethod
+    def __get_column_widths__(measurement_system: MeasurementSystem) -> Tuple[float, float, float]:
+        # the widths of the largest temperature, humidity and wind speed
+        temperature_suffix = MessageFactory.__get_temperature_suffix__(measurement_system)
+        wind_speed_suffix = MessageFactory.__get_wind_speed_suffix__(measurement_system)
+
+        return (MessageFactory.__get_text_width__("999" + temperature_suffix),
+                MessageFactory.__get_text_width__("100%"),
+                MessageFactory.__get_text_width__("999" + wind_speed_suffix))
+
+    @staticmethod
+    def __get_render_key__(weather: Weather) -> tuple:
+        return (weather.location, weather.date, weather.measurement_system, weather.weather_code,
+                weather.temperature, weather.humidity, weather.wind_speed)
+
+    def __render_forecast_row__(self, weather: Weather, weekday_cells: Dict[int, str]) -> str:
+        temperature_width, humidity_width, wind_speed_width = self._column_widths[weather.measurement_system]
+        temperature_suffix = MessageFactory.__get_temperature_suffix__(weather.measurement_system)
+        wind_speed_suffix = MessageFactory.__get_wind_speed_suffix__(weather.measurement_system)
+
+        full_temperature = MessageFactory.__add_margin__(str(round(weather.temperature)) + temperature_suffix,
+                                                         temperature_width)
+        full_humidity = MessageFactory.__add_margin__(str(weather.humidity) + "%", humidity_width)
+        full_wind_speed = MessageFactory.__add_margin__(str(round(weather.wind_speed)) + wind_speed_suffix,
+                                                        wind_speed_width)
+
+        return "{}   :{}:   {}   {}   {}\n".format(weekday_cells[weather.date.weekday()],
+                                                  self._lookup_tables.discord_icons[weather.weather_code],
+                                                  full_temperature,
+                                                  full_humidity,
+                                                  full_wind_speed)
+
+    def __render_forecast__(self, forecast: WeatherForecast) -> str:
+        weekday_cells = self._weekday_cells[self._application_settings.language]
+        rows = [self.__render_forecast_row__(weather, weekday_cells) for weather in forecast.weathers]
+        return "**@ " + forecast.weathers[0].location.title() + "**\n\n" + "".join(rows)
 
     def format_weather_forecast(self, forecast: WeatherForecast) -> str:
-        config = configparser.ConfigParser()
-        config.read(MessageFactory._OWM_CONFIG_PATH)
-
-        msg = "**@ " + forecast.weathers[0].location.title() + "**\n\n"
-
-        for weather in forecast.weathers:
-            weekday_index = weather.date.weekday()
-            week_day = self.__get_localized_weekday__(weekday_index)
-            full_date = week_day
-            full_date = MessageFactory.__add_margin__(full_date, 10.5)
-
-            discord_icon_code = config["discord-icons"][str(weather.weather_code)]
-            temperature_suffix = MessageFactory.__get_temperature_suffix__(weather.measurement_system)
-            humidity_suffix = "%"
-            wind_speed_suffix = MessageFactory.__get_wind_speed_suffix__(weather.measurement_system)
-
-            str_temperature = str(round(weather.temperature))
-            str_humidity = str(weather.humidity)
-            str_wind_speed = str(round(weather.wind_speed))
-
-            full_temperature = str_temperature + temperature_suffix
-            full_humidity = str_humidity + humidity_suffix
-            full_wind_speed = str_wind_speed + wind_speed_suffix
-
-            full_temperature = MessageFactory.__add_margin__(full_temperature,
-                                                             MessageFactory.__get_text_width__("999"
-                                                                                               + temperature_suffix))
-            full_humidity = MessageFactory.__add_margin__(full_humidity,
-                                                          MessageFactory.__get_text_width__("100%"))
-
-            full_wind_speed = MessageFactory.__add_margin__(full_wind_speed,
-                                                            MessageFactory.__get_text_width__("999"
-                                                                                              + wind_speed_suffix))
-
-            msg += "{}   :{}:   {}   {}   {}\n".format(full_date,
-                                                       discord_icon_code,
-                                                       full_temperature,
-                                                       full_humidity,
-                                                       full_wind_speed)
+        render_key = ("forecast", self._application_settings.language) \
+            + tuple(MessageFactory.__get_render_key__(weather) for weather in forecast.weathers)
+        msg = self._render_cache.get(render_key)
+
+        if msg is None:
+            msg = self.__render_forecast__(forecast)
+            self._render_cache.set(render_key, msg, float("inf"))
 
         return msg
 
-    def format_weather(self, weather: Weather) -> str:
-        config = configparser.ConfigParser()
-        config.read(MessageFactory._OWM_CONFIG_PATH)
+    def format_weather(self, weather: Weather, is_home: bool) -> str:
+        # the home of the guild the weather is sent to is not repeated in the message
+        render_key = ("weather", self._application_settings.language, is_home,
+                      MessageFactory.__get_render_key__(weather))
+        msg = self._render_cache.get(render_key)
 
-        is_home = self._application_settings.home_settings.display_name.upper() == weather.location.upper()
+        if msg is None:
+            msg = self.__render_weather__(weather, is_home)
+            self._render_cache.set(render_key, msg, float("inf"))
 
+        return msg
+
+    def __render_weather__(self, weather: Weather, is_home: bool) -> str:
         header = "" if is_home else "**@ " + weather.location.title() + "**: "
-        discord_icon_code = config["discord-icons"][str(weather.weather_code)]
+        discord_icon_code = self._lookup_tables.discord_icons[weather.weather_code]
         temperature_suffix = MessageFactory.__get_temperature_suffix__(weather.measurement_system)
         wind_speed_suffix = MessageFactory.__get_wind_speed_suffix__(weather.measurement_system)
 
@@ -123,7 +138,7 @@ class MessageFactory(object):
                                                    round(weather.wind_speed), wind_speed_suffix)
 
     @staticmethod
-    def format_presence(weather: Weather, should_help: bool) -> str:
+    def format_presence(weather: Weather, should_help: bool, marker: str = None) -> str:
         temperature_suffix = MessageFactory.__get_temperature_suffix__(weather.measurement_system)
         humidity_suffix = "%"
         wind_speed_suffix = MessageFactory.__get_wind_speed_suffix__(weather.measurement_system)
@@ -140,8 +155,16 @@ class MessageFactory(object):
         else:
             msg = "{}  {}  {}".format(temperature_text, humidity_text, wind_speed_text)
 
+        if marker is not None:
+            msg += " " + marker
+
         return msg
 
+    @staticmethod
+    def format_unknown_location(location: str) -> str:
+        msg = "unknown location '{}', try with its city name and country code (e.g. `!weather Paris,FR`)"
+        return msg.format(location)
+
     @staticmethod
     def format_help() -> str:
         msg = "discloud: the weather on your discord server!\n"
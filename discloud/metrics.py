@@ -0,0 +1,255 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import bisect
+import logging
+import time
+from aiohttp import web
+from typing import Callable, Dict, List, Tuple
+
+# The metrics are exposed in the prometheus text format, see
+# https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+
+
+class Metric(object):
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._functions = dict()  # label values -> function returning the current value
+
+    @staticmethod
+    def __format_value__(value: float) -> str:
+        if value == float("inf"):
+            return "+Inf"
+
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def __format_labels__(self, label_values: Tuple[str, ...], extra_labels: Dict[str, str] = None) -> str:
+        labels = list(zip(self.label_names, label_values)) + list((extra_labels or dict()).items())
+
+        if not labels:
+            return ""
+
+        escaped_labels = ['{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                          for name, value in labels]
+
+        return "{" + ",".join(escaped_labels) + "}"
+
+    def set_function(self, function: Callable[[], float], *label_values: str) -> None:
+        # the value is read from the function when rendered, for the values already maintained elsewhere
+        self._functions[label_values] = function
+
+    def __get_samples__(self) -> List[Tuple[str, Tuple[str, ...], Dict[str, str], float]]:
+        samples = list()
+
+        for label_values, function in self._functions.items():
+            try:
+                samples.append(("", label_values, None, function()))
+            except Exception:
+                logging.exception("failed to read the value of the metric {}".format(self.name))
+
+        return samples
+
+    def render(self) -> str:
+        lines = ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} {}".format(self.name, self.TYPE)]
+
+        for suffix, label_values, extra_labels, value in self.__get_samples__():
+            lines.append("{}{}{} {}".format(self.name, suffix, self.__format_labels__(label_values, extra_labels),
+                                            Metric.__format_value__(value)))
+
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values = dict()  # label values -> count
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def __get_samples__(self) -> List[Tuple[str, Tuple[str, ...], Dict[str, str], float]]:
+        return [("", label_values, None, value) for label_values, value in self._values.items()] \
+            + super().__get_samples__()
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values = dict()  # label values -> value
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def __get_samples__(self) -> List[Tuple[str, Tuple[str, ...], Dict[str, str], float]]:
+        return [("", label_values, None, value) for label_values, value in self._values.items()] \
+            + super().__get_samples__()
+
+
+class _HistogramTimer(object):
+    def __init__(self, histogram: "Histogram", label_values: Tuple[str, ...]) -> None:
+        self._histogram = histogram
+        self._label_values = label_values
+        self._start = None
+
+    def __enter__(self) -> "_HistogramTimer":
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._histogram.observe(time.monotonic() - self._start, *self._label_values)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, label_names)
+        self._buckets = tuple(sorted(buckets))
+        self._values = dict()  # label values -> [count per bucket (not cumulated, +Inf last), sum]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        entry = self._values.get(label_values)
+
+        if entry is None:
+            entry = self._values[label_values] = [[0] * (len(self._buckets) + 1), 0.0]
+
+        entry[0][bisect.bisect_left(self._buckets, value)] += 1
+        entry[1] += value
+
+    def time(self, *label_values: str) -> _HistogramTimer:
+        return _HistogramTimer(self, label_values)
+
+    def get_count(self, *label_values: str) -> int:
+        entry = self._values.get(label_values)
+        return 0 if entry is None else sum(entry[0])
+
+    def __get_samples__(self) -> List[Tuple[str, Tuple[str, ...], Dict[str, str], float]]:
+        samples = list()
+
+        for label_values, (bucket_counts, total) in self._values.items():
+            cumulated_count = 0
+
+            for upper_bound, bucket_count in zip(self._buckets + (float("inf"),), bucket_counts):
+                cumulated_count += bucket_count
+                samples.append(("_bucket", label_values, {"le": Metric.__format_value__(upper_bound)},
+                                cumulated_count))
+
+            samples.append(("_sum", label_values, None, total))
+            samples.append(("_count", label_values, None, cumulated_count))
+
+        return samples
+
+
+class MetricsRegistry(object):
+    def __init__(self) -> None:
+        self._metrics = list()
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self._metrics)
+
+
+REGISTRY = MetricsRegistry()
+
+PROVIDER_LATENCY = REGISTRY.register(Histogram("discloud_provider_request_seconds",
+                                               "Duration of the weather provider calls",
+                                               ("provider",)))
+
+PROVIDER_ERRORS = REGISTRY.register(Counter("discloud_provider_errors_total",
+                                            "Weather provider calls which have failed",
+                                            ("provider",)))
+
+PROVIDER_QUOTA_REMAINING = REGISTRY.register(Gauge("discloud_provider_quota_remaining",
+                                                   "Requests left in the weather provider rate limit windows",
+                                                   ("provider", "window")))
+
+COMMANDS = REGISTRY.register(Counter("discloud_commands_total", "Commands received, by kind", ("kind",)))
+
+COMMAND_HANDLING_LATENCY = REGISTRY.register(Histogram("discloud_command_handling_seconds",
+                                                       "Duration of the message handling, from reception to answer"))
+
+DISCORD_SEND_LATENCY = REGISTRY.register(Histogram("discloud_discord_send_seconds",
+                                                   "Duration of the messages sending to discord"))
+
+BROADCAST_FAILURES = REGISTRY.register(Counter("discloud_broadcast_failures_total",
+                                               "Scheduled forecasts which could not be sent to a channel"))
+
+CACHE_REQUESTS = REGISTRY.register(Counter("discloud_cache_requests_total",
+                                           "In-memory weather cache lookups, by result",
+                                           ("result",)))
+
+EVENT_LOOP_LAG = REGISTRY.register(Gauge("discloud_event_loop_lag_seconds",
+                                         "Delay of the latest event loop lag probe beyond its expected wake up"))
+
+
+class MetricsServer(object):
+    _LOOP_LAG_PROBE_FREQUENCY = 1  # second
+
+    def __init__(self, port: int, registry: MetricsRegistry = REGISTRY) -> None:
+        self._port = port
+        self._registry = registry
+        self._runner = None
+
+    _CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    async def __handle_metrics__(self, request: web.Request) -> web.Response:
+        return web.Response(body=self._registry.render().encode("utf-8"),
+                            headers={"Content-Type": MetricsServer._CONTENT_TYPE})
+
+    async def start(self) -> None:
+        # served from the bot event loop, next to the discord client
+        application = web.Application()
+        application.router.add_get("/metrics", self.__handle_metrics__)
+        self._runner = web.AppRunner(application, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, port=self._port).start()
+
+        logging.info("metrics served on port {} (/metrics)".format(self._port))
+
+    async def monitor_event_loop_lag(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(MetricsServer._LOOP_LAG_PROBE_FREQUENCY)
+            EVENT_LOOP_LAG.set(max(time.monotonic() - start - MetricsServer._LOOP_LAG_PROBE_FREQUENCY, 0))
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
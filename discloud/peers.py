@@ -0,0 +1,119 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import discord
+from typing import Iterable
+
+
+class PeerBotIndex(object):
+    # Keeps track of the online discloud bots of each server, updated from the gateway events. The instances using the
+    # partition priority advertise it in their presence, and only count each other (see PARTITION_MARKER)
+
+    PARTITION_MARKER = "⇄"
+
+    def __init__(self, partition_only: bool = False) -> None:
+        self._partition_only = partition_only
+        self._peers = dict()  # server id -> ids of the online discloud bots
+        self._lowest_peers = dict()  # server id -> lowest online discloud bot id
+
+    @staticmethod
+    def is_discloud_bot(member: discord.Member) -> bool:
+        if member.game is None:
+            return False
+
+        bot_game_probable_strings = ["°C", "°F", "%", "mph", "kmh", "discloud"]
+        bot_strings_threshold = 2
+
+        member_found_strings = 0
+
+        for probable_string in bot_game_probable_strings:
+            if probable_string in member.game.name:
+                member_found_strings += 1
+
+        return member_found_strings >= bot_strings_threshold
+
+    @staticmethod
+    def is_partition_bot(member: discord.Member) -> bool:
+        return PeerBotIndex.is_discloud_bot(member) and member.game.name.endswith(PeerBotIndex.PARTITION_MARKER)
+
+    def __is_online_peer__(self, member: discord.Member) -> bool:
+        if member.status is not discord.Status.online:
+            return False
+
+        if self._partition_only:
+            return PeerBotIndex.is_partition_bot(member)
+
+        return PeerBotIndex.is_discloud_bot(member)
+
+    def __add_peer__(self, server_id, member_id) -> None:
+        peers = self._peers.setdefault(server_id, set())
+
+        if member_id in peers:
+            return
+
+        peers.add(member_id)
+        lowest_peer = self._lowest_peers.get(server_id)
+
+        if lowest_peer is None or member_id < lowest_peer:
+            self._lowest_peers[server_id] = member_id
+
+    def __remove_peer__(self, server_id, member_id) -> None:
+        peers = self._peers.get(server_id)
+
+        if peers is None or member_id not in peers:
+            return
+
+        peers.remove(member_id)
+
+        if not peers:
+            del self._peers[server_id]
+            del self._lowest_peers[server_id]
+        elif self._lowest_peers[server_id] == member_id:
+            self._lowest_peers[server_id] = min(peers)
+
+    def index_server(self, server: discord.Guild) -> None:
+        self.remove_server(server)
+
+        for member in server.members:
+            self.update_member(member)
+
+        logging.debug("{} discloud peer(s) online on server {}".format(len(self._peers.get(server.id, ())),
+                                                                      server.name))
+
+    def index_servers(self, servers: Iterable[discord.Guild]) -> None:
+        for server in servers:
+            self.index_server(server)
+
+    def remove_server(self, server: discord.Guild) -> None:
+        self._peers.pop(server.id, None)
+        self._lowest_peers.pop(server.id, None)
+
+    def update_member(self, member: discord.Member) -> None:
+        if self.__is_online_peer__(member):
+            self.__add_peer__(member.server.id, member.id)
+        else:
+            self.__remove_peer__(member.server.id, member.id)
+
+    def remove_member(self, member: discord.Member) -> None:
+        self.__remove_peer__(member.server.id, member.id)
+
+    def get_peer_ids(self, server_id) -> frozenset:
+        return frozenset(self._peers.get(server_id, ()))
+
+    def get_lowest_peer_id(self, server_id):
+        return self._lowest_peers.get(server_id)
@@ -0,0 +1,74 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import copy
+import datetime
+import logging
+from typing import Awaitable, Callable, NamedTuple
+from settings import MeasurementSystem, HomeSettings
+from weather import Weather, WeatherService
+
+
+class HomeWeatherSnapshot(NamedTuple):
+    weather: Weather
+    fetched_at: datetime.datetime
+
+
+class HomeWeatherPublisher(object):
+    # Fetches the home weather once for every consumer, each consumer receiving the same snapshot
+
+    def __init__(self,
+                 measurement_system: MeasurementSystem,
+                 home_settings: HomeSettings,
+                 weather_service: WeatherService) -> None:
+        self._measurement_system = measurement_system
+        self._home_settings = home_settings
+        self._weather_service = weather_service
+        self._subscribers = list()
+        self._snapshot = None
+        self._first_snapshot = asyncio.Event()
+
+    @property
+    def snapshot(self) -> HomeWeatherSnapshot:
+        return self._snapshot
+
+    def subscribe(self, callback: Callable[[HomeWeatherSnapshot], Awaitable[None]]) -> None:
+        self._subscribers.append(callback)
+
+    async def wait_for_snapshot(self) -> HomeWeatherSnapshot:
+        await self._first_snapshot.wait()
+        return self._snapshot
+
+    async def __notify__(self, callback, snapshot: HomeWeatherSnapshot) -> None:
+        try:
+            await callback(snapshot)
+        except Exception:
+            logging.exception("a home weather subscriber failed to handle the new snapshot")
+
+    async def publish(self) -> HomeWeatherSnapshot:
+        home_weather = await self._weather_service.get_weather(self._home_settings.full_name, self._measurement_system)
+
+        # the snapshot owns its weather, the instance returned by the weather service is shared with its cache
+        weather = copy.copy(home_weather)
+        weather.location = self._home_settings.display_name
+        self._snapshot = HomeWeatherSnapshot(weather, datetime.datetime.now())
+        self._first_snapshot.set()
+
+        await asyncio.gather(*[self.__notify__(callback, self._snapshot) for callback in self._subscribers])
+
+        return self._snapshot
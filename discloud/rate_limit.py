@@ -0,0 +1,99 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import time
+from collections import deque
+from typing import List, NamedTuple
+
+
+class RateLimit(NamedTuple):
+    max_requests: int
+    period: float  # seconds
+
+
+class SlidingWindowRateLimiter(object):
+    MINUTE = 60
+    DAY = 24 * 60 * 60
+
+    def __init__(self, limits: List[RateLimit]) -> None:
+        if not limits:
+            raise ValueError("at least one rate limit must be provided")
+
+        self._limits = limits
+        self._windows = [deque() for _ in limits]  # timestamps of the requests made during each period
+        self._lock = None
+
+    @property
+    def limits(self) -> List[RateLimit]:
+        return self._limits
+
+    def __evict__(self, now: float) -> None:
+        for limit, window in zip(self._limits, self._windows):
+            while window and window[0] <= now - limit.period:
+                window.popleft()
+
+    def has_capacity(self) -> bool:
+        self.__evict__(time.monotonic())
+        return all(len(window) < limit.max_requests for limit, window in zip(self._limits, self._windows))
+
+    def get_delay(self) -> float:
+        now = time.monotonic()
+        self.__evict__(now)
+
+        delay = 0
+
+        for limit, window in zip(self._limits, self._windows):
+            if len(window) >= limit.max_requests:
+                # a slot is freed when the request at the window boundary leaves the period
+                boundary_request = window[len(window) - limit.max_requests]
+                delay = max(delay, boundary_request + limit.period - now)
+
+        return delay
+
+    def try_acquire(self) -> bool:
+        if not self.has_capacity():
+            return False
+
+        now = time.monotonic()
+
+        for window in self._windows:
+            window.append(now)
+
+        return True
+
+    async def acquire(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # waiters are served in order, so that a burst cannot starve the earliest callers
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep(self.get_delay())
+
+    def get_remaining(self, period: float) -> int:
+        self.__evict__(time.monotonic())
+
+        for limit, window in zip(self._limits, self._windows):
+            if limit.period == period:
+                return limit.max_requests - len(window)
+
+        raise ValueError("there is no rate limit with a period of {} seconds".format(period))
+
+    def get_utilization(self) -> float:
+        self.__evict__(time.monotonic())
+        return max(len(window) / limit.max_requests for limit, window in zip(self._limits, self._windows))
@@ -0,0 +1,283 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import time
+import aiohttp
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, List
+from settings import HedgingSettings
+from cities import UnknownLocationError
+from metrics import PROVIDER_LATENCY, PROVIDER_ERRORS
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class ProviderHealth(object):
+    _EWMA_WEIGHT = 0.2  # weight of the latest observation
+    _FAILURE_THRESHOLD = 5  # consecutive failures before the circuit opens
+    _OPEN_DURATION = 60  # seconds before a single probe request is let through an open circuit
+    _ERROR_RATE_HALF_LIFE = 60  # seconds, so that an unused provider is eventually given another chance
+    _LATENCY_SAMPLES = 200
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.latency = 0.0  # seconds, exponentially weighted moving average
+        self.consecutive_failures = 0
+        self.state = CircuitState.CLOSED
+        self._opened_at = None
+        self._probing = False
+        self._error_rate = 0.0  # exponentially weighted moving average
+        self._observed_at = time.monotonic()
+        self._latencies = deque(maxlen=ProviderHealth._LATENCY_SAMPLES)  # latencies of the latest successes
+
+    @property
+    def error_rate(self) -> float:
+        elapsed = time.monotonic() - self._observed_at
+        return self._error_rate * 0.5 ** (elapsed / ProviderHealth._ERROR_RATE_HALF_LIFE)
+
+    def __observe__(self, latency: float, error: bool) -> None:
+        self.latency += ProviderHealth._EWMA_WEIGHT * (latency - self.latency)
+        self._error_rate = self.error_rate + ProviderHealth._EWMA_WEIGHT * ((1.0 if error else 0.0) - self.error_rate)
+        self._observed_at = time.monotonic()
+
+    def is_available(self) -> bool:
+        if self.state is CircuitState.OPEN and time.monotonic() - self._opened_at >= ProviderHealth._OPEN_DURATION:
+            self.state = CircuitState.HALF_OPEN
+
+        if self.state is CircuitState.HALF_OPEN:
+            return not self._probing
+
+        return self.state is CircuitState.CLOSED
+
+    @property
+    def latency_samples(self) -> int:
+        return len(self._latencies)
+
+    def get_latency_percentile(self, percentile: int) -> float:
+        if not self._latencies:
+            return None
+
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)]
+
+    def start_request(self) -> None:
+        if self.state is CircuitState.HALF_OPEN:
+            self._probing = True
+
+    def cancel_request(self) -> None:
+        self._probing = False
+
+    def record_success(self, latency: float) -> None:
+        self.__observe__(latency, False)
+        self._latencies.append(latency)
+        self.consecutive_failures = 0
+        self._probing = False
+
+        if self.state is not CircuitState.CLOSED:
+            logging.info("the {} circuit breaker is now closed".format(self.name))
+            self.state = CircuitState.CLOSED
+
+    def record_failure(self, latency: float) -> None:
+        self.__observe__(latency, True)
+        self.consecutive_failures += 1
+        self._probing = False
+
+        if self.state is CircuitState.HALF_OPEN \
+                or self.consecutive_failures >= ProviderHealth._FAILURE_THRESHOLD and self.state is CircuitState.CLOSED:
+            logging.warning("the {} circuit breaker is now open".format(self.name))
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+
+class ProviderRouter(object):
+    _MAX_ATTEMPTS = 2
+    _ERROR_RATE_PENALTY = 10  # seconds added to the score of a provider that always fails
+    _PREFERENCE_MARGIN = 0.5  # seconds a less preferred provider must be faster by to be chosen
+    _MAX_RATE_LIMIT_DELAY = 10  # seconds a request may wait for a rate limited provider
+    _MIN_HEDGING_SAMPLES = 20  # latencies needed before the hedging delay is derived from the percentile
+    _DEFAULT_HEDGING_DELAY = 1  # seconds
+    _MIN_HEDGING_DELAY = 0.05  # seconds
+    _MAX_HEDGING_UTILIZATION = 0.5  # hedges only spend the spare half of each rate limit window
+
+    def __init__(self, repositories: List, hedging_settings: HedgingSettings) -> None:
+        # the repositories are given by order of preference
+        self._repositories = repositories
+        self._hedging_settings = hedging_settings
+        self._healths = {repository.NAME: ProviderHealth(repository.NAME) for repository in repositories}
+
+    @staticmethod
+    def __is_client_error__(error: Exception) -> bool:
+        # the request itself is invalid (e.g. unknown location), it says nothing about the provider health
+        if isinstance(error, UnknownLocationError):
+            return True
+
+        return isinstance(error, aiohttp.ClientResponseError) and 400 <= error.status < 500 and error.status != 429
+
+    @property
+    def repositories(self) -> List:
+        return self._repositories
+
+    def get_health(self, repository) -> ProviderHealth:
+        return self._healths[repository.NAME]
+
+    def __get_score__(self, rank: int, repository) -> float:
+        health = self.get_health(repository)
+        return health.latency + health.error_rate * ProviderRouter._ERROR_RATE_PENALTY \
+            + rank * ProviderRouter._PREFERENCE_MARGIN
+
+    def get_candidates(self) -> List:
+        available = [(rank, repository) for rank, repository in enumerate(self._repositories)
+                     if self.get_health(repository).is_available()]
+
+        queryable = [(self.__get_score__(rank, repository), rank, repository) for rank, repository in available
+                     if repository.is_queryable()]
+
+        # rate limited providers are only used as a last resort, when they free up soon enough
+        rate_limited = [(repository.rate_limiter.get_delay(), rank, repository) for rank, repository in available
+                        if not repository.is_queryable()]
+
+        return [repository for _, _, repository in sorted(queryable, key=lambda c: c[:2])] \
+            + [repository for delay, _, repository in sorted(rate_limited, key=lambda c: c[:2])
+               if delay <= ProviderRouter._MAX_RATE_LIMIT_DELAY]
+
+    def __get_hedging_delay__(self, repository) -> float:
+        health = self.get_health(repository)
+
+        if health.latency_samples < ProviderRouter._MIN_HEDGING_SAMPLES:
+            return ProviderRouter._DEFAULT_HEDGING_DELAY
+
+        delay = health.get_latency_percentile(self._hedging_settings.percentile)
+        return max(delay, ProviderRouter._MIN_HEDGING_DELAY)
+
+    @staticmethod
+    def __can_hedge__(repository) -> bool:
+        return repository.rate_limiter.get_utilization() < ProviderRouter._MAX_HEDGING_UTILIZATION
+
+    async def __call_repository__(self, repository, operation: Callable[[Any], Awaitable[Any]]) -> Any:
+        health = self.get_health(repository)
+        health.start_request()
+        start = time.monotonic()
+
+        try:
+            result = await operation(repository)
+        except asyncio.CancelledError:
+            health.cancel_request()
+            raise
+        except Exception as e:
+            latency = time.monotonic() - start
+            PROVIDER_LATENCY.observe(latency, repository.NAME)
+
+            if ProviderRouter.__is_client_error__(e):
+                health.record_success(latency)
+            else:
+                health.record_failure(latency)
+                PROVIDER_ERRORS.inc(repository.NAME)
+                logging.warning("the {} weather repository failed ({!r})".format(repository.NAME, e))
+
+            raise
+
+        latency = time.monotonic() - start
+        PROVIDER_LATENCY.observe(latency, repository.NAME)
+        health.record_success(latency)
+        return result
+
+    async def __call_hedged__(self, primary, secondary, operation: Callable[[Any], Awaitable[Any]]) -> Any:
+        primary_task = asyncio.ensure_future(self.__call_repository__(primary, operation))
+        tasks = {primary_task}
+        done, _ = await asyncio.wait(tasks, timeout=self.__get_hedging_delay__(primary))
+
+        if not done:
+            # the budget is checked again since other requests may have consumed it while waiting
+            if ProviderRouter.__can_hedge__(secondary):
+                logging.debug("{} is slow to answer, hedging with {}...".format(primary.NAME, secondary.NAME))
+                tasks.add(asyncio.ensure_future(self.__call_repository__(secondary, operation)))
+        elif primary_task.exception() is not None and not ProviderRouter.__is_client_error__(primary_task.exception()):
+            tasks.add(asyncio.ensure_future(self.__call_repository__(secondary, operation)))
+
+        last_error = None
+
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+
+                    last_error = task.exception()
+
+                    if ProviderRouter.__is_client_error__(last_error):
+                        raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        raise last_error
+
+    @staticmethod
+    def has_budget(repository, request_count: int) -> bool:
+        rate_limiter = repository.rate_limiter
+        return all(rate_limiter.get_remaining(limit.period) >= request_count for limit in rate_limiter.limits)
+
+    def __get_call_candidates__(self, locations: List = None) -> List:
+        # the locations are given for the batch operations, which may cost several requests
+        candidates = self.get_candidates()
+
+        if locations is not None:
+            # each request of a batch is charged to the rate limits, only the providers with enough budget left for
+            # all of them are tried, the ones fetching the batch with the fewest requests first
+            candidates = [repository for repository in candidates
+                          if ProviderRouter.has_budget(repository, repository.get_request_count(locations))]
+            candidates.sort(key=lambda repository: repository.get_request_count(locations))
+
+        return candidates[:ProviderRouter._MAX_ATTEMPTS]
+
+    def get_serving_repository(self, locations: List = None):
+        # the repository the next call would be sent to first (None if there is none)
+        candidates = self.__get_call_candidates__(locations)
+        return candidates[0] if candidates else None
+
+    async def call(self, operation: Callable[[Any], Awaitable[Any]], locations: List = None) -> Any:
+        candidates = self.__get_call_candidates__(locations)
+
+        if not candidates:
+            raise ValueError("there is no queryable weather repository at the moment")
+
+        # a hedged batch would cost its requests twice
+        if self._hedging_settings.enabled and locations is None and len(candidates) > 1 \
+                and ProviderRouter.__can_hedge__(candidates[1]):
+            return await self.__call_hedged__(candidates[0], candidates[1], operation)
+
+        last_error = None
+
+        for repository in candidates:
+            try:
+                return await self.__call_repository__(repository, operation)
+            except Exception as e:
+                if ProviderRouter.__is_client_error__(e):
+                    raise
+
+                last_error = e
+
+        raise last_error
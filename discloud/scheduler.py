@@ -0,0 +1,142 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+from typing import Awaitable, Callable, Hashable
+
+
+class DailyJob(object):
+    def __init__(self,
+                 time_of_day: datetime.time,
+                 timezone: datetime.tzinfo,
+                 callback: Callable[[], Awaitable[None]],
+                 tag: Hashable = None) -> None:
+        # a None timezone stands for the local timezone of the host
+        self.time_of_day = time_of_day
+        self.timezone = timezone
+        self.callback = callback
+        self.tag = tag
+        self.cancelled = False
+
+    def today(self) -> datetime.date:
+        return datetime.datetime.now(self.timezone).date()
+
+    def __at__(self, date: datetime.date) -> datetime.datetime:
+        if self.timezone is None:
+            # astimezone() on a naive datetime applies the local DST rules of that very date
+            return datetime.datetime.combine(date, self.time_of_day).astimezone()
+        else:
+            return datetime.datetime.combine(date, self.time_of_day, tzinfo=self.timezone)
+
+    def get_next_run(self, after: datetime.datetime) -> datetime.datetime:
+        date = after.astimezone(self.timezone).date() if self.timezone is not None else after.astimezone().date()
+        next_run = self.__at__(date)
+
+        while next_run <= after:
+            date += datetime.timedelta(days=1)
+            next_run = self.__at__(date)
+
+        return next_run
+
+
+class AsyncScheduler(object):
+    # The deadlines are kept in wall-clock time, while the event loop timers are monotonic: the timer is never armed
+    # for more than _MAX_SLEEP so that wall-clock jumps (NTP corrections, suspended hosts) are caught up quickly
+
+    _MAX_SLEEP = 5 * 60  # seconds
+    _MAX_LATENESS = 60 * 60  # seconds after which a missed run is skipped instead of being run late
+
+    def __init__(self) -> None:
+        self._deadlines = []  # heap of (next run, sequence, job)
+        self._sequence = itertools.count()
+        self._timer = None
+        self._loop = None
+
+    def __len__(self) -> int:
+        return sum(1 for _, _, job in self._deadlines if not job.cancelled)
+
+    @staticmethod
+    def __now__() -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    @staticmethod
+    def __log_job_failure__(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("scheduled job failed", exc_info=task.exception())
+
+    def __push__(self, job: DailyJob, after: datetime.datetime) -> None:
+        heapq.heappush(self._deadlines, (job.get_next_run(after), next(self._sequence), job))
+
+    def __arm__(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._deadlines and self._deadlines[0][2].cancelled:
+            heapq.heappop(self._deadlines)
+
+        if self._loop is None or not self._deadlines:
+            return
+
+        delay = (self._deadlines[0][0] - AsyncScheduler.__now__()).total_seconds()
+        delay = min(max(delay, 0), AsyncScheduler._MAX_SLEEP)
+        self._timer = self._loop.call_at(self._loop.time() + delay, self.__wake_up__)
+
+    def __wake_up__(self) -> None:
+        self._timer = None
+        now = AsyncScheduler.__now__()
+
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, _, job = heapq.heappop(self._deadlines)
+
+            if job.cancelled:
+                continue
+
+            if (now - deadline).total_seconds() <= AsyncScheduler._MAX_LATENESS:
+                task = self._loop.create_task(job.callback())
+                task.add_done_callback(AsyncScheduler.__log_job_failure__)
+            else:
+                logging.warning("a scheduled job missed its run of {} and has been skipped".format(deadline))
+
+            self.__push__(job, now)
+
+        self.__arm__()
+
+    def add_job(self, job: DailyJob) -> DailyJob:
+        self.__push__(job, AsyncScheduler.__now__())
+        self.__arm__()
+        return job
+
+    def remove_jobs(self, tag: Hashable) -> None:
+        # cancelled jobs are lazily dropped from the heap when they reach its top
+        for _, _, job in self._deadlines:
+            if job.tag == tag:
+                job.cancelled = True
+
+        self.__arm__()
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self.__arm__()
+
+    def stop(self) -> None:
+        self._loop = None
+        self.__arm__()
@@ -15,8 +15,9 @@
 # You should have received a copy of the GNU General Public License
 # along with discloud.  If not, see <http://www.gnu.org/licenses/>.
 
+import datetime
 from enum import Enum
-from typing import List
+from typing import Dict, List
 
 
 class MeasurementSystem(Enum):
@@ -28,6 +29,7 @@ class ConcurrencyPriority(Enum):
     ALWAYS = "always"
     AUTO = "auto"
     NEVER = "never"
+    PARTITION = "partition"
 
 
 class Language(Enum):
@@ -40,10 +42,17 @@ class Language(Enum):
 
 
 class IntegrationSettings(object):
-    def __init__(self, discord_bot_token: str, open_weather_map_api_key: str, weather_underground_api_key: str) -> None:
+    def __init__(self,
+                 discord_bot_token: str,
+                 open_weather_map_api_key: str,
+                 weather_underground_api_key: str,
+                 open_weather_map_base_url: str = None,
+                 weather_underground_base_url: str = None) -> None:
         self.discord_bot_token = discord_bot_token
         self.open_weather_map_api_key = open_weather_map_api_key
         self.weather_underground_api_key = weather_underground_api_key
+        self.open_weather_map_base_url = open_weather_map_base_url  # None stands for the actual provider api
+        self.weather_underground_base_url = weather_underground_base_url
 
 
 class CommandSettings(object):
@@ -55,12 +64,17 @@ class CommandSettings(object):
 
 
 class HomeSettings(object):
+    # one instance per guild with its own home, hence the slots
+    __slots__ = ("full_name", "display_name", "periodic_forecast_channels",
+                 "morning_forecast_time", "evening_forecast_time", "forecast_timezone")
+
     def __init__(self,
                  full_name: str,
                  display_name: str,
                  periodic_forecast_channels: List[str],
                  morning_forecast_time: str,
-                 evening_forecast_time: str) -> None:
+                 evening_forecast_time: str,
+                 forecast_timezone: datetime.tzinfo) -> None:
         self.full_name = full_name
         self.display_name = display_name
         self.periodic_forecast_channels = periodic_forecast_channels
@@ -75,6 +89,47 @@ class HomeSettings(object):
         else:
             self.evening_forecast_time = evening_forecast_time
 
+        self.forecast_timezone = forecast_timezone  # None stands for the local timezone of the host
+
+
+class CacheSettings(object):
+    def __init__(self, weather_ttl: int, forecast_ttl: int, max_size: int, disk_path: str, disk_max_size: int) -> None:
+        self.weather_ttl = weather_ttl
+        self.forecast_ttl = forecast_ttl
+        self.max_size = max_size
+        self.disk_path = disk_path  # None disables the disk cache
+        self.disk_max_size = disk_max_size
+
+
+class HedgingSettings(object):
+    def __init__(self, enabled: bool, percentile: int) -> None:
+        self.enabled = enabled
+        self.percentile = percentile
+
+
+class PrefetchSettings(object):
+    def __init__(self, locations_count: int, min_requests: float) -> None:
+        self.locations_count = locations_count
+        self.min_requests = min_requests
+
+
+class LocationSettings(object):
+    def __init__(self, city_index_path: str) -> None:
+        self.city_index_path = city_index_path
+
+
+class ShardingSettings(object):
+    def __init__(self, enabled: bool, shard_count: int, process_count: int, state_socket_path: str) -> None:
+        self.enabled = enabled
+        self.shard_count = shard_count  # None stands for the number of shards recommended by discord
+        self.process_count = process_count
+        self.state_socket_path = state_socket_path
+
+
+class MetricsSettings(object):
+    def __init__(self, port: int) -> None:
+        self.port = port  # None disables the metrics endpoint
+
 
 class ApplicationSettings(object):
     def __init__(self,
@@ -84,7 +139,14 @@ class ApplicationSettings(object):
                  concurrency_priority: ConcurrencyPriority,
                  integration_settings: IntegrationSettings,
                  command_settings: CommandSettings,
-                 home_settings: HomeSettings) -> None:
+                 home_settings: HomeSettings,
+                 guild_home_settings: Dict[int, HomeSettings],
+                 cache_settings: CacheSettings,
+                 hedging_settings: HedgingSettings,
+                 prefetch_settings: PrefetchSettings,
+                 location_settings: LocationSettings,
+                 sharding_settings: ShardingSettings,
+                 metrics_settings: MetricsSettings) -> None:
         self.logging_level = logging_level
         self.language = language
         self.measurement_system = measurement_system
@@ -92,3 +154,10 @@ class ApplicationSettings(object):
         self.integration_settings = integration_settings
         self.command_settings = command_settings
         self.home_settings = home_settings
+        self.guild_home_settings = guild_home_settings  # guild id -> home settings overriding the default ones
+        self.cache_settings = cache_settings
+        self.hedging_settings = hedging_settings
+        self.prefetch_settings = prefetch_settings
+        self.location_settings = location_settings
+        self.sharding_settings = sharding_settings
+        self.metrics_settings = metrics_settings
@@ -0,0 +1,272 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from cache import TtlLruCache, CacheTier
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+
+# The shard processes of a same host share their weather cache and their weather providers rate limits through a
+# state server, listening on a unix socket. Each request and each response is a single line of json
+
+
+class SharedStateServer(object):
+    _MAX_LINE_LENGTH = 1024 * 1024  # bytes
+
+    def __init__(self,
+                 socket_path: str,
+                 cache_max_size: int,
+                 rate_limits: Dict[str, List[RateLimit]],
+                 cache_tier: CacheTier = None) -> None:
+        self._socket_path = socket_path
+        self._cache = TtlLruCache(cache_max_size)
+        self._cache_tier = cache_tier
+        self._rate_limiters = {name: SlidingWindowRateLimiter(limits) for name, limits in rate_limits.items()}
+
+    def __get_rate_limiter_state__(self, name: str) -> dict:
+        rate_limiter = self._rate_limiters[name]
+
+        return {"delay": rate_limiter.get_delay(),
+                "utilization": rate_limiter.get_utilization(),
+                "remaining": {str(limit.period): rate_limiter.get_remaining(limit.period)
+                              for limit in rate_limiter.limits}}
+
+    async def __get__(self, key: str) -> dict:
+        value = self._cache.get(key)
+
+        if value is not None:
+            return {"value": value, "ttl": self._cache.get_time_to_live(key)}
+
+        entry = await self._cache_tier.get(key) if self._cache_tier is not None else None
+
+        if entry is None:
+            return {"value": None}
+
+        value, time_to_live = entry
+        self._cache.set(key, value, time_to_live)
+        return {"value": value, "ttl": time_to_live}
+
+    async def __set__(self, key: str, value: str, ttl: float) -> dict:
+        self._cache.set(key, value, ttl)
+
+        if self._cache_tier is not None:
+            await self._cache_tier.set(key, value, ttl)
+
+        return {}
+
+    async def __handle_request__(self, request: dict) -> dict:
+        operation = request["op"]
+
+        if operation == "get":
+            return await self.__get__(request["key"])
+        elif operation == "set":
+            return await self.__set__(request["key"], request["value"], request["ttl"])
+        elif operation == "acquire":
+            acquired = self._rate_limiters[request["name"]].try_acquire()
+            return dict(self.__get_rate_limiter_state__(request["name"]), acquired=acquired)
+        elif operation == "status":
+            return self.__get_rate_limiter_state__(request["name"])
+        else:
+            raise ValueError("unknown shared state operation '{}'".format(operation))
+
+    async def __handle_connection__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+
+                if not line:
+                    break
+
+                try:
+                    response = await self.__handle_request__(json.loads(line))
+                except Exception as e:
+                    logging.exception("invalid shared state request")
+                    response = {"error": repr(e)}
+
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            logging.debug("a shard process has disconnected from the shared state server")
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        if os.path.exists(self._socket_path):
+            os.remove(self._socket_path)  # left over by a previous run
+
+        server = await asyncio.start_unix_server(self.__handle_connection__, self._socket_path,
+                                                 limit=SharedStateServer._MAX_LINE_LENGTH)
+
+        logging.info("shared state server listening on {}".format(self._socket_path))
+
+        async with server:
+            if self._cache_tier is None:
+                await server.serve_forever()
+            else:
+                await asyncio.gather(server.serve_forever(), self._cache_tier.maintain())
+
+
+class SharedStateClient(CacheTier):
+    # The weather cache tier of a shard process, backed by the shared state server. The requests go through a single
+    # connection, one at a time, which is (re)opened on demand
+
+    def __init__(self, socket_path: str) -> None:
+        self._socket_path = socket_path
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    async def __connect__(self) -> None:
+        self._reader, self._writer = await asyncio.open_unix_connection(self._socket_path,
+                                                                        limit=SharedStateServer._MAX_LINE_LENGTH)
+
+    def __disconnect__(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+        self._reader = None
+        self._writer = None
+
+    async def request(self, request: dict) -> dict:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self.__connect__()
+
+                self._writer.write(json.dumps(request).encode("utf-8") + b"\n")
+                await self._writer.drain()
+                line = await self._reader.readline()
+            except (OSError, asyncio.CancelledError):
+                self.__disconnect__()
+                raise
+
+            if not line:
+                self.__disconnect__()
+                raise ConnectionError("the shared state server has closed the connection")
+
+        response = json.loads(line)
+
+        if "error" in response:
+            raise ValueError("the shared state request failed: {}".format(response["error"]))
+
+        return response
+
+    async def get(self, key: str) -> Optional[Tuple[str, float]]:
+        try:
+            response = await self.request({"op": "get", "key": key})
+        except (OSError, ValueError) as e:
+            logging.warning("failed to read the weather cache entry '{}' from the shared state ({!r})".format(key, e))
+            return None
+
+        return None if response["value"] is None else (response["value"], response["ttl"])
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        if ttl <= 0:
+            return
+
+        try:
+            await self.request({"op": "set", "key": key, "value": value, "ttl": ttl})
+        except (OSError, ValueError) as e:
+            logging.warning("failed to write the weather cache entry '{}' to the shared state ({!r})".format(key, e))
+
+    def close(self) -> None:
+        self.__disconnect__()
+
+
+class SharedRateLimiter(SlidingWindowRateLimiter):
+    # The requests are acquired from the shared state server, the other methods are answered from the latest state
+    # it has returned. The limiter fails closed: without the server, there is no way to know what the other
+    # processes have used, so no request is made until it can be reached again
+
+    _SYNC_FREQUENCY = 1  # second
+    _MAX_STATE_AGE = 5 * _SYNC_FREQUENCY  # seconds after which the latest state is considered stale
+    _MAX_UNREACHABLE_WAIT = 10  # seconds an acquisition waits for the server before failing
+
+    def __init__(self, client: SharedStateClient, name: str, limits: List[RateLimit]) -> None:
+        super().__init__(limits)  # only used for the limits, the windows live in the shared state server
+        self._client = client
+        self._name = name
+        self._state = None
+        self._state_time = None
+
+    def __update_state__(self, response: dict) -> None:
+        self._state = response
+        self._state_time = time.monotonic()
+
+    def __get_shared_state__(self) -> Optional[dict]:
+        if self._state is None or time.monotonic() - self._state_time > SharedRateLimiter._MAX_STATE_AGE:
+            return None
+
+        return self._state
+
+    def has_capacity(self) -> bool:
+        state = self.__get_shared_state__()
+        return state is not None and state["delay"] <= 0
+
+    def get_delay(self) -> float:
+        state = self.__get_shared_state__()
+        return SharedRateLimiter._SYNC_FREQUENCY if state is None else max(state["delay"], 0)
+
+    def get_utilization(self) -> float:
+        state = self.__get_shared_state__()
+        return 1.0 if state is None else state["utilization"]
+
+    def get_remaining(self, period: float) -> int:
+        state = self.__get_shared_state__()
+        return 0 if state is None else state["remaining"][str(period)]
+
+    def try_acquire(self) -> bool:
+        # a synchronous acquisition cannot reach the shared state server, the requests go through acquire()
+        return False
+
+    async def acquire(self) -> None:
+        deadline = time.monotonic() + SharedRateLimiter._MAX_UNREACHABLE_WAIT
+
+        while True:
+            try:
+                response = await self._client.request({"op": "acquire", "name": self._name})
+            except (OSError, ValueError) as e:
+                self._state = None
+
+                if time.monotonic() >= deadline:
+                    raise ValueError("the shared {} rate limit is unreachable ({!r})".format(self._name, e))
+
+                await asyncio.sleep(SharedRateLimiter._SYNC_FREQUENCY)
+                continue
+
+            self.__update_state__(response)
+
+            if response["acquired"]:
+                return
+
+            await asyncio.sleep(max(response["delay"], 0.01))
+
+    async def keep_synced(self) -> None:
+        while True:
+            try:
+                self.__update_state__(await self._client.request({"op": "status", "name": self._name}))
+            except (OSError, ValueError):
+                self._state = None
+
+            await asyncio.sleep(SharedRateLimiter._SYNC_FREQUENCY)
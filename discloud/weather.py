@@ -15,14 +15,20 @@
 # You should have received a copy of the GNU General Public License
 # along with discloud.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import datetime
 import logging
-import configparser
 import json
-import http.client
-import pyowm
-from typing import List
-from settings import MeasurementSystem
+import aiohttp
+from typing import Callable, List, Optional, Union
+from settings import MeasurementSystem, CacheSettings, HedgingSettings, PrefetchSettings
+from cache import TtlLruCache, PopularityTracker, CacheTier
+from cities import City, CityIndex, UnknownLocationError
+from coalescing import RequestCoalescer
+from http_pool import HttpConnectionPool
+from lookup import get_lookup_tables
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+from routing import ProviderRouter
 
 
 class Weather(object):
@@ -36,87 +42,125 @@ class Weather(object):
         self.humidity = humidity
         self.wind_speed = wind_speed
 
+    def to_dict(self) -> dict:
+        return {"location": self.location,
+                "date": self.date.isoformat(),
+                "measurement_system": self.measurement_system.value,
+                "weather_code": self.weather_code,
+                "temperature": self.temperature,
+                "humidity": self.humidity,
+                "wind_speed": self.wind_speed}
+
+    @staticmethod
+    def from_dict(weather_dict: dict) -> "Weather":
+        return Weather(weather_dict["location"],
+                       datetime.date.fromisoformat(weather_dict["date"]),
+                       MeasurementSystem(weather_dict["measurement_system"]),
+                       weather_dict["weather_code"],
+                       weather_dict["temperature"],
+                       weather_dict["humidity"],
+                       weather_dict["wind_speed"])
+
 
 class WeatherForecast(object):
     def __init__(self, weathers: List[Weather]) -> None:
         self.weathers = weathers
 
+    def to_dict(self) -> dict:
+        return {"weathers": [weather.to_dict() for weather in self.weathers]}
+
+    @staticmethod
+    def from_dict(forecast_dict: dict) -> "WeatherForecast":
+        return WeatherForecast([Weather.from_dict(weather_dict) for weather_dict in forecast_dict["weathers"]])
+
+
+class AsyncWeatherRepository(object):
+    # Every provider is queried through the shared keep-alive pool, so that no request ever blocks the event loop
+
+    def __init__(self, rate_limiter: SlidingWindowRateLimiter) -> None:
+        self._rate_limiter = rate_limiter
+
+    @property
+    def rate_limiter(self) -> SlidingWindowRateLimiter:
+        return self._rate_limiter
 
-class WeatherRepository(object):
     def is_queryable(self) -> bool:
-        pass
+        return self._rate_limiter.has_capacity()
+
+    def get_request_count(self, locations: List[Union[str, City]]) -> int:
+        # number of requests needed to fetch the weathers of the locations together
+        return len(locations)
+
+    @staticmethod
+    def __get_location_name__(location: Union[str, City]) -> str:
+        return location.name if isinstance(location, City) else location
 
-    def get_weather(self, location: str, measurement_system: MeasurementSystem) -> Weather:
-        pass
+    async def get_weather_async(self, location: Union[str, City], measurement_system: MeasurementSystem) -> Weather:
+        raise NotImplementedError()
 
-    def get_forecast(self, location: str, measurement_system: MeasurementSystem) -> WeatherForecast:
-        pass
+    async def get_weathers_async(self, locations: List[Union[str, City]],
+                                 measurement_system: MeasurementSystem) -> List[Weather]:
+        # without batch endpoint, the weathers are fetched concurrently, with one request per location
+        return list(await asyncio.gather(*[self.get_weather_async(location, measurement_system)
+                                           for location in locations]))
 
+    async def get_forecast_async(self, location: Union[str, City],
+                                 measurement_system: MeasurementSystem) -> WeatherForecast:
+        raise NotImplementedError()
 
-class WeatherUndergroundRepository(WeatherRepository):
+
+class WeatherUndergroundRepository(AsyncWeatherRepository):
     NAME = "WU"
 
     _HOST = "api.wunderground.com"
+    _BASE_URL = "http://" + _HOST
     _REQUESTS_PER_DAY = 490  # should be 500 but we keep it safe
     _REQUESTS_PER_MINUTE = 9  # should be 10 but we keep it safe
 
-    def __init__(self, wu_api_key: str) -> None:
-        self._wu_api_key = wu_api_key
-        self._past_requests = list()
-
-    @staticmethod
-    def __get_json__(endpoint: str, title: str):
-        conn = http.client.HTTPConnection(WeatherUndergroundRepository._HOST)
-
-        try:
-            conn.request("GET", endpoint)
-            response = conn.getresponse()
-            data = response.read().decode("utf-8")
-            return json.loads(data)
-        except:
-            logging.exception("failed to fetch the " + title + " from Weather Underground")
-            return None
-        finally:
-            conn.close()
+    RATE_LIMITS = [RateLimit(_REQUESTS_PER_MINUTE, SlidingWindowRateLimiter.MINUTE),
+                   RateLimit(_REQUESTS_PER_DAY, SlidingWindowRateLimiter.DAY)]
 
-    @staticmethod
-    def __get_weather_code__(wu_icon_code: str) -> int:
-        config = configparser.ConfigParser()
-        config.read("config/weather_underground.ini")
-        return config["owm-codes"][wu_icon_code]
+    def __init__(self, wu_api_key: str, http_pool: HttpConnectionPool,
+                 rate_limiter: SlidingWindowRateLimiter = None, base_url: str = None) -> None:
+        super().__init__(rate_limiter or SlidingWindowRateLimiter(WeatherUndergroundRepository.RATE_LIMITS))
+        self._wu_api_key = wu_api_key
+        self._http_pool = http_pool
+        self._base_url = base_url or WeatherUndergroundRepository._BASE_URL  # e.g. a stand-in server for load tests
 
-    def __get_weather_json__(self, location: str):
-        endpoint = "/api/{}/conditions/q/{}.json".format(self._wu_api_key, location.replace(" ", "_"))
-        return WeatherUndergroundRepository.__get_json__(endpoint, "weather")
+    async def __get_json_async__(self, endpoint: str, expected_key: str, location_name: str):
+        # the failures are raised to the router, which accounts them in the provider health
+        response_json = await self._http_pool.get_json(self._base_url + endpoint)
+        error = response_json.get("response", dict()).get("error")
 
-    def __get_forecast_json__(self, location: str):
-        endpoint = "/api/{}/forecast/q/{}.json".format(self._wu_api_key, location.replace(" ", "_"))
-        return WeatherUndergroundRepository.__get_json__(endpoint, "weather forecast")
+        # the invalid queries are answered with a 200 and an error, or with several matching results
+        if error is not None and error.get("type") != "querynotfound":
+            raise ValueError("Weather Underground error: {}".format(error.get("description", error.get("type"))))
 
-    def __log_request__(self):
-        self._past_requests.insert(0, datetime.datetime.now())
+        if error is not None or expected_key not in response_json:
+            raise UnknownLocationError("unknown location '{}'".format(location_name))
 
-        if len(self._past_requests) > WeatherUndergroundRepository._REQUESTS_PER_DAY:
-            self._past_requests = self._past_requests[:WeatherUndergroundRepository._REQUESTS_PER_DAY]
+        return response_json
 
-    def is_queryable(self) -> bool:
-        if len(self._past_requests) > WeatherUndergroundRepository._REQUESTS_PER_DAY:
-            raise ValueError("there are too many requests in the queue")
+    @staticmethod
+    def __get_weather_code__(wu_icon_code: str) -> int:
+        return get_lookup_tables().owm_codes[wu_icon_code]
 
-        within_daily_threshold = len(self._past_requests) <= WeatherUndergroundRepository._REQUESTS_PER_DAY
+    @staticmethod
+    def __get_query__(location: Union[str, City]) -> str:
+        # the resolved cities are queried by coordinates, which are not ambiguous
+        if isinstance(location, City):
+            return "{},{}".format(location.latitude, location.longitude)
 
-        if len(self._past_requests) <= WeatherUndergroundRepository._REQUESTS_PER_MINUTE:
-            within_minute_threshold = True
-        else:
-            oldest_minute_request = self._past_requests[WeatherUndergroundRepository._REQUESTS_PER_MINUTE-1]
-            within_minute_threshold = (datetime.datetime.now() - oldest_minute_request).total_seconds() <= 60
+        return location.replace(" ", "_")
 
-        return within_daily_threshold and within_minute_threshold
+    def __get_weather_endpoint__(self, location: Union[str, City]) -> str:
+        return "/api/{}/conditions/q/{}.json".format(self._wu_api_key, self.__get_query__(location))
 
-    def get_weather(self, location: str, measurement_system: MeasurementSystem) -> Weather:
-        logging.debug("retrieving current weather @{} using Weather Underground...".format(location))
+    def __get_forecast_endpoint__(self, location: Union[str, City]) -> str:
+        return "/api/{}/forecast/q/{}.json".format(self._wu_api_key, self.__get_query__(location))
 
-        weather_json = self.__get_weather_json__(location)
+    @staticmethod
+    def __build_weather__(location: str, weather_json, measurement_system: MeasurementSystem) -> Weather:
         current_observation = weather_json["current_observation"]
 
         date = datetime.date.today()
@@ -135,14 +179,10 @@ class WeatherUndergroundRepository(WeatherRepository):
         humidity = int(humidity_str)
         wind_speed = int(wind_speed_str)
 
-        self.__log_request__()
-
         return Weather(location, date, measurement_system, weather_code, temperature, humidity, wind_speed)
 
-    def get_forecast(self, location: str, measurement_system: MeasurementSystem) -> WeatherForecast:
-        logging.debug("retrieving weather forecast @{} using Weather Underground...".format(location))
-
-        forecast_json = self.__get_forecast_json__(location)
+    @staticmethod
+    def __build_forecast__(location: str, forecast_json, measurement_system: MeasurementSystem) -> WeatherForecast:
         weathers = list()
 
         forec = forecast_json["forecast"]
@@ -169,100 +209,432 @@ class WeatherUndergroundRepository(WeatherRepository):
 
             weathers.append(weather)
 
-        self.__log_request__()
-
         return WeatherForecast(weathers)
 
-
-class OpenWeatherMapRepository(WeatherRepository):
+    async def get_weather_async(self, location: Union[str, City], measurement_system: MeasurementSystem) -> Weather:
+        location_name = self.__get_location_name__(location)
+        logging.debug("retrieving current weather @{} using Weather Underground...".format(location_name))
+        await self._rate_limiter.acquire()
+        weather_json = await self.__get_json_async__(self.__get_weather_endpoint__(location), "current_observation",
+                                                     location_name)
+        return WeatherUndergroundRepository.__build_weather__(location_name, weather_json, measurement_system)
+
+    async def get_forecast_async(self, location: Union[str, City],
+                                 measurement_system: MeasurementSystem) -> WeatherForecast:
+        location_name = self.__get_location_name__(location)
+        logging.debug("retrieving weather forecast @{} using Weather Underground...".format(location_name))
+        await self._rate_limiter.acquire()
+        forecast_json = await self.__get_json_async__(self.__get_forecast_endpoint__(location), "forecast",
+                                                      location_name)
+        return WeatherUndergroundRepository.__build_forecast__(location_name, forecast_json, measurement_system)
+
+
+class OpenWeatherMapRepository(AsyncWeatherRepository):
     NAME = "OWM"
 
-    def __init__(self, owm_api_key: str) -> None:
-        self._owm = pyowm.OWM(owm_api_key)
+    MAX_BATCH_SIZE = 20  # maximum number of city IDs of the group endpoint
+
+    _BASE_URL = "http://api.openweathermap.org/data/2.5"
+    _REQUESTS_PER_MINUTE = 59  # should be 60 but we keep it safe
+
+    RATE_LIMITS = [RateLimit(_REQUESTS_PER_MINUTE, SlidingWindowRateLimiter.MINUTE)]
+
+    def __init__(self, owm_api_key: str, http_pool: HttpConnectionPool,
+                 rate_limiter: SlidingWindowRateLimiter = None, base_url: str = None) -> None:
+        super().__init__(rate_limiter or SlidingWindowRateLimiter(OpenWeatherMapRepository.RATE_LIMITS))
+        self._owm_api_key = owm_api_key
+        self._http_pool = http_pool
+        self._base_url = base_url or OpenWeatherMapRepository._BASE_URL  # e.g. a stand-in server for load tests
+
+    def get_request_count(self, locations: List[Union[str, City]]) -> int:
+        cities_count = len({location.id for location in locations if isinstance(location, City)})
+        others_count = sum(1 for location in locations if not isinstance(location, City))
+        return -(-cities_count // OpenWeatherMapRepository.MAX_BATCH_SIZE) + others_count
 
     @staticmethod
-    def __get_temperature_unit__(measurement_system: MeasurementSystem):
-        if measurement_system is MeasurementSystem.METRIC:
-            return "celsius"
-        elif measurement_system is MeasurementSystem.IMPERIAL:
-            return "fahrenheit"
+    def __build_weather_from_json__(location: str, weather_json, measurement_system: MeasurementSystem) -> Weather:
+        # the json is requested with the units of the measurement system, so only the wind speed must be converted
+        weather_code = weather_json["weather"][0]["id"]
+
+        if "main" in weather_json:
+            temperature = weather_json["main"]["temp"]
+            humidity = weather_json["main"]["humidity"]
+            wind_speed = int(weather_json["wind"]["speed"])
         else:
-            raise ValueError("measurement system must be either metric or imperial")
+            temperature = weather_json["temp"]["day"]
+            humidity = weather_json["humidity"]
+            wind_speed = int(weather_json["speed"])
 
-    @staticmethod
-    def __get_wind_unit(measurement_system: MeasurementSystem):
         if measurement_system is MeasurementSystem.METRIC:
-            return "meters_sec"
-        elif measurement_system is MeasurementSystem.IMPERIAL:
-            return "miles_hour"
+            wind_speed = wind_speed * 3.6  # m/s to km/h
+
+        date = datetime.date.fromtimestamp(weather_json["dt"])
+
+        return Weather(location, date, measurement_system, weather_code, temperature, humidity, wind_speed)
+
+    def __get_params__(self, location: Union[str, City], measurement_system: MeasurementSystem) -> dict:
+        params = {"units": measurement_system.value, "appid": self._owm_api_key}
+
+        if isinstance(location, City):
+            params["id"] = location.id
         else:
-            raise ValueError("measurement system must be either metric or imperial")
+            params["q"] = location
+
+        return params
+
+    async def __get_location_json_async__(self, endpoint: str, location: Union[str, City],
+                                          measurement_system: MeasurementSystem):
+        # the unknown locations are answered with a 404
+        try:
+            return await self._http_pool.get_json(self._base_url + endpoint,
+                                                  self.__get_params__(location, measurement_system))
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                raise UnknownLocationError("unknown location '{}'".format(self.__get_location_name__(location)))
+
+            raise
+
+    async def get_weather_async(self, location: Union[str, City], measurement_system: MeasurementSystem) -> Weather:
+        location_name = self.__get_location_name__(location)
+        logging.debug("retrieving current weather @{} using Open Weather Map...".format(location_name))
+        await self._rate_limiter.acquire()
+        weather_json = await self.__get_location_json_async__("/weather", location, measurement_system)
+        return OpenWeatherMapRepository.__build_weather_from_json__(location_name, weather_json, measurement_system)
+
+    async def __get_city_weathers_async__(self, cities: List[City], measurement_system: MeasurementSystem) -> dict:
+        logging.debug("retrieving current weather @{} using Open Weather Map..."
+                      .format(",".join(city.name for city in cities)))
+        await self._rate_limiter.acquire()
+        url = self._base_url + "/group"
+        params = {"id": ",".join(str(city.id) for city in cities),
+                  "units": measurement_system.value,
+                  "appid": self._owm_api_key}
+        group_json = await self._http_pool.get_json(url, params)
+        weathers_json = {weather_json["id"]: weather_json for weather_json in group_json["list"]}
+
+        weathers = dict()
+
+        for city in cities:
+            if city.id not in weathers_json:
+                raise ValueError("the weather @{} is missing from the Open Weather Map group".format(city.name))
+
+            weathers[city.id] = OpenWeatherMapRepository.__build_weather_from_json__(city.name,
+                                                                                     weathers_json[city.id],
+                                                                                     measurement_system)
+
+        return weathers
+
+    async def get_weathers_async(self, locations: List[Union[str, City]],
+                                 measurement_system: MeasurementSystem) -> List[Weather]:
+        # the resolved cities are fetched by groups of IDs, the other locations can only be fetched one by one
+        cities = list({location.id: location for location in locations if isinstance(location, City)}.values())
+        batches = [cities[i:i + OpenWeatherMapRepository.MAX_BATCH_SIZE]
+                   for i in range(0, len(cities), OpenWeatherMapRepository.MAX_BATCH_SIZE)]
+        others = [location for location in locations if not isinstance(location, City)]
+
+        results = await asyncio.gather(*[self.__get_city_weathers_async__(batch, measurement_system)
+                                         for batch in batches],
+                                       *[self.get_weather_async(location, measurement_system) for location in others])
+
+        city_weathers = dict()
+
+        for batch_weathers in results[:len(batches)]:
+            city_weathers.update(batch_weathers)
+
+        other_weathers = iter(results[len(batches):])
+
+        return [city_weathers[location.id] if isinstance(location, City) else next(other_weathers)
+                for location in locations]
+
+    async def get_forecast_async(self, location: Union[str, City],
+                                 measurement_system: MeasurementSystem) -> WeatherForecast:
+        location_name = self.__get_location_name__(location)
+        logging.debug("retrieving weather forecast @{} using Open Weather Map...".format(location_name))
+        await self._rate_limiter.acquire()
+        forecast_json = await self.__get_location_json_async__("/forecast/daily", location, measurement_system)
+
+        weathers = [OpenWeatherMapRepository.__build_weather_from_json__(location_name, weather_json,
+                                                                         measurement_system)
+                    for weather_json in forecast_json["list"]]
+
+        return WeatherForecast(weathers)
+
+
+class WeatherService(object):
+    _WEATHER_KIND = "weather"
+    _FORECAST_KIND = "forecast"
+    _POPULARITY_HALF_LIFE = 6 * 60 * 60  # 6 hours
+    _REFRESH_AHEAD_FREQUENCY = 30  # seconds
+    _REFRESH_AHEAD_WINDOW = 2 * _REFRESH_AHEAD_FREQUENCY  # seconds before expiration from which entries are refreshed
+    _MAX_REFRESH_AHEAD_UTILIZATION = 0.5  # refreshes only spend the spare half of each rate limit window
+
+    def __init__(self,
+                 owm_api_key: str,
+                 wu_api_key: str,
+                 cache_settings: CacheSettings,
+                 hedging_settings: HedgingSettings,
+                 prefetch_settings: PrefetchSettings,
+                 http_pool: HttpConnectionPool,
+                 city_index: CityIndex = None,
+                 cache_tier: CacheTier = None,
+                 rate_limiter_factory: Callable[[str, List[RateLimit]], SlidingWindowRateLimiter] = None,
+                 owm_base_url: str = None,
+                 wu_base_url: str = None) -> None:
+        if not owm_api_key and not wu_api_key:
+            raise ValueError("at least one weather api key (Open Weather Map or Weather Underground) must be provided")
+
+        # the rate limiters may be provided (e.g. shared by several processes), they are local otherwise
+        def __create_rate_limiter__(repository_class) -> Optional[SlidingWindowRateLimiter]:
+            if rate_limiter_factory is None:
+                return None
+
+            return rate_limiter_factory(repository_class.NAME, repository_class.RATE_LIMITS)
+
+        self._owm = OpenWeatherMapRepository(owm_api_key, http_pool,
+                                             __create_rate_limiter__(OpenWeatherMapRepository), owm_base_url) \
+            if owm_api_key else None
+        self._wu = WeatherUndergroundRepository(wu_api_key, http_pool,
+                                                __create_rate_limiter__(WeatherUndergroundRepository), wu_base_url) \
+            if wu_api_key else None
+        self._router = ProviderRouter([repository for repository in [self._wu, self._owm] if repository is not None],
+                                      hedging_settings)
+        self._cache_settings = cache_settings
+        self._cache = TtlLruCache(cache_settings.max_size)
+        self._coalescer = RequestCoalescer()
+        self._prefetch_settings = prefetch_settings
+        self._popularity = PopularityTracker(WeatherService._POPULARITY_HALF_LIFE,
+                                             max(4 * prefetch_settings.locations_count, 1))
+        self._city_index = city_index
+        self._cache_tier = cache_tier
+
+    @property
+    def cache(self) -> TtlLruCache:
+        return self._cache
+
+    @property
+    def router(self) -> ProviderRouter:
+        return self._router
+
+    def __resolve__(self, location: str) -> Union[str, City]:
+        # without city index, the locations are passed as is to the weather providers
+        if self._city_index is None:
+            return location
+
+        city = self._city_index.resolve(location)
+
+        if city is not None:
+            return city
+
+        # the suffix is not a country of the cities with this name (e.g. "Paris,TX"), the provider knows better
+        if self._city_index.has_city_named(location):
+            return location
+
+        raise UnknownLocationError("unknown location '{}'".format(location))
+
+    def get_location_key(self, location: str) -> Union[str, int]:
+        # the same key for the spellings of a location sharing the same cache entries (e.g. "Paris,FR" and "paris, fr")
+        city = self._city_index.resolve(location) if self._city_index is not None else None
+        return city.id if city is not None else location.strip().lower()
+
+    def is_same_location(self, location: str, other_location: str) -> bool:
+        if self._city_index is None:
+            return location.strip().lower() == other_location.strip().lower()
+
+        city = self._city_index.resolve(location)
+        other_city = self._city_index.resolve(other_location)
+
+        return city is not None and other_city is not None and city.id == other_city.id
+
+    @staticmethod
+    def __get_cache_key__(kind: str, location: Union[str, City], measurement_system: MeasurementSystem) -> tuple:
+        if isinstance(location, City):
+            return kind, location.id, measurement_system
+
+        return kind, location.strip().lower(), measurement_system
 
     @staticmethod
-    def __build_weather__(location: str, owm_weather, measurement_system: MeasurementSystem) -> Weather:
-        temperature_unit = OpenWeatherMapRepository.__get_temperature_unit__(measurement_system)
-        wind_unit = OpenWeatherMapRepository.__get_wind_unit(measurement_system)
+    def __get_tier_key__(cache_key: tuple) -> str:
+        kind, location, measurement_system = cache_key
+        return "{}|{}|{}".format(kind, location, measurement_system.value)
 
-        weather_code = owm_weather.get_weather_code()
-        humidity = owm_weather.get_humidity()
+    async def __store__(self, cache_key: tuple, value, ttl: int) -> None:
+        self._cache.set(cache_key, value, ttl)
 
-        owm_temperature = owm_weather.get_temperature(temperature_unit)
+        if self._cache_tier is not None:
+            await self._cache_tier.set(WeatherService.__get_tier_key__(cache_key), json.dumps(value.to_dict()), ttl)
 
-        if "temp" in owm_temperature:
-            temperature = owm_temperature["temp"]
-        elif "day" in owm_temperature:
-            temperature = owm_temperature["day"]
-        else:
-            raise ValueError("the temperature cannot be extracted from owm temperature object")
+    async def __load_from_tier__(self, cache_key: tuple, from_dict: Callable[[dict], object]):
+        # the cache tier hits are promoted to memory, with their remaining time to live
+        if self._cache_tier is None:
+            return None
 
-        wind_speed = int(owm_weather.get_wind(wind_unit)["speed"])
+        entry = await self._cache_tier.get(WeatherService.__get_tier_key__(cache_key))
 
-        if measurement_system is MeasurementSystem.METRIC:
-            wind_speed = wind_speed * 3.6  # m/s to km/h
+        if entry is None:
+            return None
+
+        value_json, time_to_live = entry
+        value = from_dict(json.loads(value_json))
+        self._cache.set(cache_key, value, time_to_live)
+        return value
 
-        date = datetime.date.fromtimestamp(owm_weather.get_reference_time())
+    async def __fetch_weather__(self, cache_key: tuple, location: Union[str, City],
+                                measurement_system: MeasurementSystem):
+        weather = await self._router.call(lambda repository: repository.get_weather_async(location,
+                                                                                          measurement_system))
+        await self.__store__(cache_key, weather, self._cache_settings.weather_ttl)
+        return weather
 
-        weather = Weather(location, date, measurement_system,
-                          weather_code, temperature, humidity, wind_speed)
+    async def __fetch_forecast__(self, cache_key: tuple, location: Union[str, City],
+                                 measurement_system: MeasurementSystem):
+        forecast = await self._router.call(lambda repository: repository.get_forecast_async(location,
+                                                                                            measurement_system))
+        await self.__store__(cache_key, forecast, self._cache_settings.forecast_ttl)
+        return forecast
+
+    async def __fetch_batch__(self, cache_keys: List[tuple], cities: List[City],
+                              measurement_system: MeasurementSystem) -> List[Weather]:
+        weathers = await self._router.call(lambda repository: repository.get_weathers_async(cities,
+                                                                                            measurement_system),
+                                           cities)
+
+        for cache_key, weather in zip(cache_keys, weathers):
+            await self.__store__(cache_key, weather, self._cache_settings.weather_ttl)
+
+        return weathers
+
+    async def __fetch_weathers__(self, cache_keys: List[tuple], locations: List[Union[str, City]],
+                                 measurement_system: MeasurementSystem) -> List[Weather]:
+        # Only the resolved cities can be fetched together, the other locations (and a lone city) are fetched one by
+        # one. Both go through the coalescer, so that they share the requests already in flight and the concurrent
+        # requests share them
+        cities = {cache_key: location for cache_key, location in zip(cache_keys, locations)
+                  if isinstance(location, City) and cache_key not in self._coalescer}
+
+        if len(cities) < 2:
+            cities = dict()
+
+        singles = [(cache_key, location) for cache_key, location in zip(cache_keys, locations)
+                   if cache_key not in cities]
+
+        weathers = dict()  # cache key -> weather
+
+        async def __fetch_single__(cache_key: tuple, location: Union[str, City]) -> None:
+            weathers[cache_key] = await self._coalescer.run(cache_key,
+                                                            lambda: self.__fetch_weather__(cache_key, location,
+                                                                                           measurement_system))
+
+        # the batched cities are registered right away, before a concurrent request of one of them may start
+        batch_keys = list(cities.keys())
+        batch_weathers = self._coalescer.run_many(
+            batch_keys,
+            lambda missing_keys: self.__fetch_batch__(missing_keys, [cities[key] for key in missing_keys],
+                                                      measurement_system)) if cities else None
+
+        async def __fetch_all_batch__() -> None:
+            weathers.update(zip(batch_keys, await batch_weathers))
+
+        await asyncio.gather(*[__fetch_single__(cache_key, location) for cache_key, location in singles],
+                             *([__fetch_all_batch__()] if cities else []))
+
+        return [weathers[cache_key] for cache_key in cache_keys]
+
+    async def __load_weather__(self, cache_key: tuple, location: Union[str, City],
+                               measurement_system: MeasurementSystem):
+        weather = await self.__load_from_tier__(cache_key, Weather.from_dict)
+        return weather if weather is not None else await self.__fetch_weather__(cache_key, location,
+                                                                                measurement_system)
+
+    async def __load_forecast__(self, cache_key: tuple, location: Union[str, City],
+                                measurement_system: MeasurementSystem):
+        forecast = await self.__load_from_tier__(cache_key, WeatherForecast.from_dict)
+        return forecast if forecast is not None else await self.__fetch_forecast__(cache_key, location,
+                                                                                   measurement_system)
+
+    async def get_weather(self, location: str, measurement_system: MeasurementSystem) -> Weather:
+        location = self.__resolve__(location)
+        cache_key = WeatherService.__get_cache_key__(WeatherService._WEATHER_KIND, location, measurement_system)
+        self._popularity.track(cache_key, (location, measurement_system))
+        weather = self._cache.get(cache_key)
+
+        if weather is None:
+            # concurrent requests for the same weather share a single provider call
+            weather = await self._coalescer.run(cache_key,
+                                                lambda: self.__load_weather__(cache_key, location, measurement_system))
 
         return weather
 
-    def is_queryable(self) -> bool:
-        return True
+    async def get_forecast(self, location: str, measurement_system: MeasurementSystem) -> WeatherForecast:
+        location = self.__resolve__(location)
+        cache_key = WeatherService.__get_cache_key__(WeatherService._FORECAST_KIND, location, measurement_system)
+        self._popularity.track(cache_key, (location, measurement_system))
+        forecast = self._cache.get(cache_key)
 
-    def get_weather(self, location: str, measurement_system: MeasurementSystem) -> Weather:
-        logging.debug("retrieving current weather @{} using Open Weather Map...".format(location))
-        owm_weather = self._owm.weather_at_place(location).get_weather()
-        return OpenWeatherMapRepository.__build_weather__(location, owm_weather, measurement_system)
+        if forecast is None:
+            forecast = await self._coalescer.run(cache_key,
+                                                 lambda: self.__load_forecast__(cache_key, location,
+                                                                                measurement_system))
 
-    def get_forecast(self, location: str, measurement_system: MeasurementSystem) -> WeatherForecast:
-        logging.debug("retrieving weather forecast @{} using Open Weather Map...".format(location))
-        forecast = self._owm.daily_forecast(location)
+        return forecast
 
-        weathers = [OpenWeatherMapRepository.__build_weather__(location, weather, measurement_system)
-                    for weather in forecast.get_forecast()]
+    def __has_spare_budget__(self, locations: List[Union[str, City]] = None) -> bool:
+        # the budget is checked on the provider the refresh would be sent to, for all the requests it would make
+        repository = self._router.get_serving_repository(locations)
 
-        return WeatherForecast(weathers)
+        if repository is None:
+            return False
 
+        request_count = 1 if locations is None else repository.get_request_count(locations)
+        rate_limiter = repository.rate_limiter
 
-class WeatherService(object):
-    def __init__(self, owm_api_key: str, wu_api_key: str) -> None:
-        if not owm_api_key and not wu_api_key:
-            raise ValueError("at least one weather api key (Open Weather Map or Weather Underground) must be provided")
+        return all(rate_limiter.get_remaining(limit.period) - request_count
+                   >= limit.max_requests * (1 - WeatherService._MAX_REFRESH_AHEAD_UTILIZATION)
+                   for limit in rate_limiter.limits)
 
-        self._owm = OpenWeatherMapRepository(owm_api_key) if owm_api_key else None
-        self._wu = WeatherUndergroundRepository(wu_api_key) if wu_api_key else None
+    async def __refresh_ahead_once__(self) -> None:
+        weathers_to_refresh = dict()  # measurement system -> {cache key -> location}
+        forecasts_to_refresh = list()
 
-    def __get_weather_repository__(self):
-        if self._wu is not None and self._wu.is_queryable():
-            return self._wu
-        elif self._owm is not None and self._owm.is_queryable():
-            return self._owm
-        else:
-            raise ValueError("there is no queryable weather repository at the moment")
+        for cache_key, (location, measurement_system) in \
+                self._popularity.get_most_popular(self._prefetch_settings.locations_count,
+                                                  self._prefetch_settings.min_requests):
+            time_to_live = self._cache.get_time_to_live(cache_key)
+
+            # only the entries about to expire are refreshed, the other ones are either fresh or already gone
+            if not time_to_live or time_to_live > WeatherService._REFRESH_AHEAD_WINDOW:
+                continue
+
+            if cache_key[0] == WeatherService._WEATHER_KIND:
+                weathers_to_refresh.setdefault(measurement_system, dict())[cache_key] = location
+            else:
+                forecasts_to_refresh.append((cache_key, location, measurement_system))
+
+        # the current weathers are refreshed in batches, there is no batch endpoint for the forecasts
+        for measurement_system, locations in weathers_to_refresh.items():
+            if not self.__has_spare_budget__(list(locations.values())):
+                logging.debug("no spare rate limit budget left to refresh the popular locations")
+                return
+
+            logging.debug("refreshing the weather of {} location(s) ahead of expiration...".format(len(locations)))
+            await self.__fetch_weathers__(list(locations.keys()), list(locations.values()), measurement_system)
+
+        for cache_key, location, measurement_system in forecasts_to_refresh:
+            if not self.__has_spare_budget__():
+                logging.debug("no spare rate limit budget left to refresh the popular locations")
+                return
+
+            logging.debug("refreshing the forecast @{} ahead of its expiration...".format(cache_key[1]))
+            await self._coalescer.run(cache_key,
+                                      lambda: self.__fetch_forecast__(cache_key, location, measurement_system))
+
+    async def refresh_ahead(self) -> None:
+        if self._prefetch_settings.locations_count <= 0:
+            return
 
-    def get_weather(self, location: str, measurement_system: MeasurementSystem) -> Weather:
-        return self.__get_weather_repository__().get_weather(location, measurement_system)
+        while True:
+            try:
+                await self.__refresh_ahead_once__()
+            except Exception:
+                logging.exception("failed to refresh the popular locations ahead of their expiration")
 
-    def get_forecast(self, location: str, measurement_system: MeasurementSystem) -> WeatherForecast:
-        return self.__get_weather_repository__().get_forecast(location, measurement_system)
+            await asyncio.sleep(WeatherService._REFRESH_AHEAD_FREQUENCY)
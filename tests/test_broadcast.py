@@ -0,0 +1,69 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from broadcast import BroadcastMessageDiscordCommand, ForecastChannelIndex
+from guilds import GuildHomeTable
+from metrics import BROADCAST_FAILURES
+from settings import HomeSettings
+
+
+class FakeServer(object):
+    def __init__(self, server_id: int, name: str) -> None:
+        self.id = server_id
+        self.name = name
+
+
+class FakeChannel(object):
+    def __init__(self, channel_id: int, name: str, server: FakeServer = None) -> None:
+        self.id = channel_id
+        self.name = name
+        self.server = server
+
+
+class FailingDiscordClient(object):
+    def __init__(self, failing_channel_ids: set) -> None:
+        self.failing_channel_ids = failing_channel_ids
+        self.sent_channel_ids = list()
+
+    async def send_message(self, channel: FakeChannel, msg: str) -> None:
+        if channel.id in self.failing_channel_ids:
+            raise ConnectionResetError("connection reset by peer")
+
+        self.sent_channel_ids.append(channel.id)
+
+
+def test_a_failing_channel_does_not_stop_the_broadcast():
+    server = FakeServer(1, "guild")
+    channels = [FakeChannel(channel_id, "general", server) for channel_id in range(5)] + [FakeChannel(5, "private")]
+    discord_client = FailingDiscordClient({1, 5})
+    failures_before = BROADCAST_FAILURES.get()
+
+    sent_count = asyncio.run(BroadcastMessageDiscordCommand(discord_client, channels, "forecast").execute())
+
+    assert sent_count == 4
+    assert sorted(discord_client.sent_channel_ids) == [0, 2, 3, 4]
+    assert BROADCAST_FAILURES.get() == failures_before + 2
+
+
+def test_the_channels_without_server_are_not_indexed():
+    home_settings = HomeSettings("Paris,FR", "Paris", ["general"], "08:00", "20:00", None)
+    channel_index = ForecastChannelIndex(GuildHomeTable(home_settings, {}))
+
+    channel_index.index_channels([FakeChannel(1, "general", FakeServer(1, "guild")), FakeChannel(2, "general")])
+
+    assert [channel.id for channel in channel_index.channels] == [1]
@@ -0,0 +1,87 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import cache
+from cache import TtlLruCache, PopularityTracker
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    ttl_lru_cache = TtlLruCache(2)
+    ttl_lru_cache.set("a", 1, 60)
+    ttl_lru_cache.set("b", 2, 60)
+    ttl_lru_cache.get("a")
+    ttl_lru_cache.set("c", 3, 60)
+
+    assert len(ttl_lru_cache) == 2
+    assert ttl_lru_cache.get("b") is None
+    assert ttl_lru_cache.get("a") == 1
+    assert ttl_lru_cache.get("c") == 3
+
+
+def test_overwritten_entry_becomes_most_recently_used() -> None:
+    ttl_lru_cache = TtlLruCache(2)
+    ttl_lru_cache.set("a", 1, 60)
+    ttl_lru_cache.set("b", 2, 60)
+    ttl_lru_cache.set("a", 10, 60)
+    ttl_lru_cache.set("c", 3, 60)
+
+    assert ttl_lru_cache.get("a") == 10
+    assert ttl_lru_cache.get("b") is None
+
+
+def test_entries_expire_after_their_ttl(clock, monkeypatch) -> None:
+    monkeypatch.setattr(cache, "time", clock)
+    ttl_lru_cache = TtlLruCache(10)
+    ttl_lru_cache.set("a", 1, 60)
+    ttl_lru_cache.set("b", 2, 120)
+
+    clock.advance(60)
+
+    assert ttl_lru_cache.get("a") is None
+    assert ttl_lru_cache.get("b") == 2
+    assert ttl_lru_cache.get_time_to_live("b") == 60
+    assert len(ttl_lru_cache) == 1
+
+
+def test_hits_and_misses_are_counted(clock, monkeypatch) -> None:
+    monkeypatch.setattr(cache, "time", clock)
+    ttl_lru_cache = TtlLruCache(10)
+    ttl_lru_cache.set("a", 1, 60)
+
+    ttl_lru_cache.get("a")
+    ttl_lru_cache.get("b")
+    clock.advance(60)
+    ttl_lru_cache.get("a")
+
+    assert ttl_lru_cache.hits == 1
+    assert ttl_lru_cache.misses == 2
+
+
+def test_unpopular_keys_are_left_out(clock, monkeypatch) -> None:
+    monkeypatch.setattr(cache, "time", clock)
+    popularity_tracker = PopularityTracker(60, 10)
+
+    for _ in range(4):
+        popularity_tracker.track("a", 1)
+
+    popularity_tracker.track("b", 2)
+
+    assert popularity_tracker.get_most_popular(10, 3) == [("a", 1)]
+
+    clock.advance(60)
+    assert popularity_tracker.get_most_popular(10, 3) == []
+    assert popularity_tracker.get_most_popular(10) == [("a", 1), ("b", 2)]
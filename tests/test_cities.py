@@ -0,0 +1,95 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import pytest
+from cities import CityIndex
+
+_CITIES = [("Paria", "VE", 1000),
+           ("Paris", "FR", 2000000),
+           ("Paris", "US", 25000),
+           ("Londa", "IT", 10),
+           ("London", "GB", 8000000),
+           ("London", "CA", 380000),
+           ("Saint-Étienne", "FR", 170000),
+           ("Nice", "FR", 340000),
+           ("New York", "US", 8400000),
+           ("Los Angeles", "US", 3900000)]
+
+
+@pytest.fixture
+def city_index(tmp_path) -> CityIndex:
+    city_list_path = str(tmp_path / "city.list.json")
+    index_path = str(tmp_path / "cities.idx")
+
+    with open(city_list_path, "w", encoding="utf-8") as f:
+        json.dump([{"id": city_id, "name": name, "country": country, "coord": {"lat": 0, "lon": 0},
+                    "stat": {"population": population}}
+                   for city_id, (name, country, population) in enumerate(_CITIES)], f)
+
+    CityIndex.build(city_list_path, index_path)
+    city_index = CityIndex(index_path)
+    yield city_index
+    city_index.close()
+
+
+def test_all_the_cities_are_indexed(city_index: CityIndex) -> None:
+    assert len(city_index) == len(_CITIES)
+
+
+def test_names_are_folded() -> None:
+    assert CityIndex.fold("  Saint-Étienne ") == "saint etienne"
+    assert CityIndex.fold("L'Aquila") == "l aquila"
+
+
+@pytest.mark.parametrize("location", ["Paris", "paris", "PARIS", " Paris "])
+def test_most_populated_city_is_resolved(city_index: CityIndex, location: str) -> None:
+    city = city_index.resolve(location)
+    assert (city.name, city.country) == ("Paris", "FR")
+
+
+@pytest.mark.parametrize("location, country", [("Paris,US", "US"), ("paris, us", "US"), ("London,UK", "GB"),
+                                               ("London,CA", "CA")])
+def test_country_suffix_selects_the_city(city_index: CityIndex, location: str, country: str) -> None:
+    assert city_index.resolve(location).country == country
+
+
+def test_unknown_suffix_is_not_resolved(city_index: CityIndex) -> None:
+    assert city_index.resolve("Paris,TX") is None
+    assert city_index.has_city_named("Paris,TX")
+    assert not city_index.has_city_named("Atlantis,TX")
+
+
+@pytest.mark.parametrize("location, name, country", [("NYC", "New York", "US"), ("la", "Los Angeles", "US"),
+                                                     ("London,England", "London", "GB")])
+def test_aliases_are_resolved(city_index: CityIndex, location: str, name: str, country: str) -> None:
+    city = city_index.resolve(location)
+    assert (city.name, city.country) == (name, country)
+
+
+def test_diacritics_and_separators_are_ignored(city_index: CityIndex) -> None:
+    assert city_index.resolve("saint etienne").name == "Saint-Étienne"
+
+
+@pytest.mark.parametrize("location, name", [("Pari", "Paris"), ("Lond", "London"), ("Saint", "Saint-Étienne")])
+def test_prefix_matches_are_ranked_by_population(city_index: CityIndex, location: str, name: str) -> None:
+    assert city_index.resolve(location).name == name
+
+
+@pytest.mark.parametrize("location", ["Nic", "Atlantis", "", ","])
+def test_unknown_locations_are_not_resolved(city_index: CityIndex, location: str) -> None:
+    assert city_index.resolve(location) is None
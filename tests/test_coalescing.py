@@ -0,0 +1,78 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import pytest
+from coalescing import RequestCoalescer
+
+
+def test_concurrent_requests_share_a_single_call() -> None:
+    coalescer = RequestCoalescer()
+    calls = list()
+
+    async def __fetch__() -> str:
+        calls.append("Paris")
+        await asyncio.sleep(0.01)
+        return "sunny"
+
+    async def __run__() -> list:
+        results = await asyncio.gather(*[coalescer.run("Paris", __fetch__) for _ in range(10)])
+        assert len(coalescer) == 0
+        return results
+
+    assert asyncio.run(__run__()) == ["sunny"] * 10
+    assert calls == ["Paris"]
+
+
+def test_failures_are_shared_and_not_kept() -> None:
+    coalescer = RequestCoalescer()
+    calls = list()
+
+    async def __fetch__() -> str:
+        calls.append("Paris")
+        await asyncio.sleep(0.01)
+        raise ValueError("provider unavailable")
+
+    async def __run__() -> list:
+        return await asyncio.gather(*[coalescer.run("Paris", __fetch__) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(__run__()))
+    assert calls == ["Paris"]
+
+    # the next request is not answered with the previous failure
+    with pytest.raises(ValueError):
+        asyncio.run(coalescer.run("Paris", __fetch__))
+
+    assert calls == ["Paris", "Paris"]
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call() -> None:
+    coalescer = RequestCoalescer()
+
+    async def __fetch__() -> str:
+        await asyncio.sleep(0.01)
+        return "sunny"
+
+    async def __run__() -> str:
+        cancelled_waiter = asyncio.ensure_future(coalescer.run("Paris", __fetch__))
+        other_waiter = asyncio.ensure_future(coalescer.run("Paris", __fetch__))
+        await asyncio.sleep(0)
+        cancelled_waiter.cancel()
+        return await other_waiter
+
+    assert asyncio.run(__run__()) == "sunny"
+
@@ -0,0 +1,169 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import datetime
+from broadcast import ForecastChannelIndex
+from command import DiscordProfileState, UpdateWeatherProfileDiscordCommand, WeatherDiscordService
+from lookup import get_lookup_tables
+from guilds import GuildHomeTable
+from publisher import HomeWeatherSnapshot
+from settings import HomeSettings, MeasurementSystem
+from weather import Weather, WeatherForecast
+
+
+class FakeUser(object):
+    def __init__(self, name: str, avatar: str) -> None:
+        self.name = name
+        self.avatar = avatar
+        self.edits = list()
+
+    async def edit(self, password: str = None, **changes) -> None:
+        self.edits.append(changes)
+
+        if "username" in changes:
+            self.name = changes["username"]
+
+        if "avatar" in changes:
+            self.avatar = "hash-{}".format(len(self.edits))
+
+
+class FakeDiscordClient(object):
+    def __init__(self, user: FakeUser) -> None:
+        self.user = user
+        self.presences = list()
+
+    async def change_presence(self, activity) -> None:
+        self.presences.append(activity.name)
+
+
+class FakePublisher(object):
+    def __init__(self) -> None:
+        self.snapshot = None
+
+    def publish(self, temperature: float) -> None:
+        weather = Weather("Paris", datetime.date.today(), MeasurementSystem.METRIC, 800, temperature, 50, 10)
+        self.snapshot = HomeWeatherSnapshot(weather, datetime.datetime.now())
+
+
+def __create_weather_discord_service__(discord_client: FakeDiscordClient, publisher: FakePublisher,
+                                       profile_state: DiscordProfileState) -> WeatherDiscordService:
+    return WeatherDiscordService(MeasurementSystem.METRIC, None, None, discord_client, None, None, publisher,
+                                 updates_profile=False, profile_state=profile_state)
+
+
+def test_presence_is_only_sent_when_the_weather_changes(tmp_path) -> None:
+    discord_client = FakeDiscordClient(FakeUser("Paris", None))
+    publisher = FakePublisher()
+    weather_discord_service = __create_weather_discord_service__(discord_client, publisher,
+                                                                 DiscordProfileState(str(tmp_path / "hashes.json")))
+
+    async def __run__() -> None:
+        publisher.publish(20)
+
+        for _ in range(5):
+            await weather_discord_service.update_presence_once()
+
+        assert discord_client.presences == ["20°C  50%  10 kmh"]
+
+        # the help presence takes its turn with the next weather
+        publisher.publish(21)
+
+        for _ in range(5):
+            await weather_discord_service.update_presence_once()
+
+        assert len(discord_client.presences) == 2
+        assert discord_client.presences[1].startswith("21°C") and "!discloud" in discord_client.presences[1]
+
+    asyncio.run(__run__())
+
+
+def test_profile_left_by_the_previous_run_is_not_uploaded_again(tmp_path, repository_directory) -> None:
+    avatar_hashes_path = str(tmp_path / "hashes.json")
+    weather = Weather("Paris", datetime.date.today(), MeasurementSystem.METRIC, 800, 20, 50, 10)
+    user = FakeUser("London", "previous-hash")
+
+    async def __update_profile__() -> None:
+        profile_state = DiscordProfileState(avatar_hashes_path)
+        profile_state.seed(user)
+        await UpdateWeatherProfileDiscordCommand(FakeDiscordClient(user), weather, profile_state).execute()
+
+    asyncio.run(__update_profile__())
+    assert user.edits == [{"avatar": DiscordProfileState(avatar_hashes_path).get_avatar_bytes(
+        get_lookup_tables().google_icons[800]), "username": "Paris"}]
+
+    # after a restart, the profile is already up to date
+    asyncio.run(__update_profile__())
+    assert len(user.edits) == 1
+
+
+class FakeServer(object):
+    def __init__(self, server_id: int) -> None:
+        self.id = server_id
+        self.name = str(server_id)
+
+
+class FakeChannel(object):
+    def __init__(self, channel_id: int, server: FakeServer) -> None:
+        self.id = channel_id
+        self.name = "general"
+        self.server = server
+
+
+class FakeForecastDiscordClient(object):
+    def __init__(self) -> None:
+        self.sent_channel_ids = list()
+
+    async def send_message(self, channel: FakeChannel, msg: str) -> None:
+        self.sent_channel_ids.append(channel.id)
+
+
+class FakeWeatherService(object):
+    def __init__(self) -> None:
+        self.forecast_locations = list()
+
+    def get_location_key(self, location: str) -> str:
+        return location.replace(" ", "").lower()
+
+    async def get_forecast(self, location: str, measurement_system: MeasurementSystem) -> WeatherForecast:
+        self.forecast_locations.append(location)
+        return WeatherForecast([Weather(location, datetime.date.today(), measurement_system, 800, 20, 50, 10)])
+
+
+class FakeMessageFactory(object):
+    def format_weather_forecast(self, forecast: WeatherForecast) -> str:
+        return forecast.weathers[0].location
+
+
+def test_homes_spelled_differently_share_their_forecast() -> None:
+    def __create_home_settings__(full_name: str) -> HomeSettings:
+        return HomeSettings(full_name, "Paris", ["general"], "08:00", None, None)
+
+    guild_home_table = GuildHomeTable(__create_home_settings__("Paris,FR"), {2: __create_home_settings__("paris, fr"),
+                                                                            3: __create_home_settings__("Lyon,FR")})
+    forecast_channel_index = ForecastChannelIndex(guild_home_table)
+    forecast_channel_index.index_channels([FakeChannel(server_id, FakeServer(server_id)) for server_id in [1, 2, 3]])
+    discord_client = FakeForecastDiscordClient()
+    weather_service = FakeWeatherService()
+    weather_discord_service = WeatherDiscordService(MeasurementSystem.METRIC, guild_home_table, weather_service,
+                                                    discord_client, FakeMessageFactory(), forecast_channel_index,
+                                                    FakePublisher(), updates_profile=False)
+
+    asyncio.run(weather_discord_service.__send_home_forecasts__("sending...", lambda h: True, lambda w: w))
+
+    assert sorted(weather_service.forecast_locations) == ["Lyon,FR", "Paris,FR"]
+    assert sorted(discord_client.sent_channel_ids) == [1, 2, 3]
@@ -0,0 +1,88 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import disk_cache
+from disk_cache import SqliteCacheTier
+
+
+class FakeWallClock(object):
+    # stands for the time module of the disk cache, whose expirations are wall clock times
+
+    def __init__(self) -> None:
+        self.now = 1500000000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_entries_survive_a_restart(tmp_path) -> None:
+    file_path = str(tmp_path / "cache" / "weather.sqlite")
+
+    cache_tier = SqliteCacheTier(file_path, 10)
+    asyncio.run(cache_tier.set("weather|paris", "{}", 600))
+    cache_tier.close()
+
+    cache_tier = SqliteCacheTier(file_path, 10)
+    value, ttl = asyncio.run(cache_tier.get("weather|paris"))
+    cache_tier.close()
+
+    assert value == "{}"
+    assert 0 < ttl <= 600
+
+
+def test_expired_entries_are_not_served(tmp_path, monkeypatch) -> None:
+    clock = FakeWallClock()
+    monkeypatch.setattr(disk_cache, "time", clock)
+    cache_tier = SqliteCacheTier(str(tmp_path / "weather.sqlite"), 10)
+
+    async def __run__() -> None:
+        await cache_tier.set("weather|paris", "{}", 600)
+        await cache_tier.set("weather|lyon", "{}", 0)  # not cached at all
+
+        clock.now += 599
+        assert await cache_tier.get("weather|paris") == ("{}", 1)
+        assert await cache_tier.get("weather|lyon") is None
+
+        clock.now += 1
+        assert await cache_tier.get("weather|paris") is None
+
+    asyncio.run(__run__())
+    cache_tier.close()
+
+
+def test_compaction_evicts_the_entries_closest_to_their_expiration(tmp_path, monkeypatch) -> None:
+    clock = FakeWallClock()
+    monkeypatch.setattr(disk_cache, "time", clock)
+    cache_tier = SqliteCacheTier(str(tmp_path / "weather.sqlite"), 2)
+
+    async def __run__() -> int:
+        await cache_tier.set("expired", "{}", 10)
+        clock.now += 10
+
+        for key, ttl in [("short", 100), ("long", 300), ("medium", 200)]:
+            await cache_tier.set(key, "{}", ttl)
+
+        removed_count = await cache_tier.__run__(cache_tier.__compact__)
+
+        assert await cache_tier.get("short") is None
+        assert await cache_tier.get("medium") is not None
+        assert await cache_tier.get("long") is not None
+        return removed_count
+
+    assert asyncio.run(__run__()) == 2
+    cache_tier.close()
@@ -0,0 +1,47 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+from dispatcher import CommandDispatcher, CommandKind
+from settings import CommandSettings
+
+
+def __create_dispatcher__() -> CommandDispatcher:
+    return CommandDispatcher(CommandSettings(["!", "?", ""], ["weather", "w", "météo"], ["forecast"], ["discloud"]))
+
+
+def test_commands_are_dispatched_with_their_location() -> None:
+    dispatcher = __create_dispatcher__()
+
+    assert dispatcher.dispatch("!weather Paris,FR") == (CommandKind.WEATHER, "Paris,FR")
+    assert dispatcher.dispatch("?forecast @ Los Angeles,CA ") == (CommandKind.FORECAST, "Los Angeles,CA")
+    assert dispatcher.dispatch("!météo") == (CommandKind.WEATHER, None)
+    assert dispatcher.dispatch("!discloud") == (CommandKind.HELP, None)
+
+
+def test_longest_command_wins_over_its_prefixes() -> None:
+    # "w" is a prefix of "weather", which must not be read as "w" with the "eather" location
+    assert __create_dispatcher__().dispatch("!weather") == (CommandKind.WEATHER, None)
+    assert __create_dispatcher__().dispatch("!w Lyon") == (CommandKind.WEATHER, "Lyon")
+
+
+def test_other_messages_are_not_commands() -> None:
+    dispatcher = __create_dispatcher__()
+
+    assert dispatcher.dispatch("") is None
+    assert dispatcher.dispatch("hello there") is None
+    assert dispatcher.dispatch("!unknown Paris") is None
+    assert dispatcher.dispatch("weather Paris") is None
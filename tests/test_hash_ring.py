@@ -0,0 +1,61 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+from hash_ring import ConsistentHashRing
+
+_KEYS = range(10000)
+
+
+def test_keys_are_spread_between_the_nodes() -> None:
+    hash_ring = ConsistentHashRing(["a", "b", "c", "d"])
+    shares = dict()
+
+    for key in _KEYS:
+        node = hash_ring.get_node(key)
+        shares[node] = shares.get(node, 0) + 1
+
+    assert set(shares) == {"a", "b", "c", "d"}
+    assert all(share > len(_KEYS) / 4 * 0.75 for share in shares.values())
+
+
+def test_same_nodes_give_the_same_owners() -> None:
+    hash_ring = ConsistentHashRing([1, 2, 3])
+    other_hash_ring = ConsistentHashRing([3, 1, 2])
+
+    assert all(hash_ring.get_node(key) == other_hash_ring.get_node(key) for key in _KEYS)
+
+
+def test_added_node_only_takes_keys() -> None:
+    hash_ring = ConsistentHashRing(["a", "b", "c", "d"])
+    grown_hash_ring = ConsistentHashRing(["a", "b", "c", "d", "e"])
+    moved_keys = [key for key in _KEYS if hash_ring.get_node(key) != grown_hash_ring.get_node(key)]
+
+    assert all(grown_hash_ring.get_node(key) == "e" for key in moved_keys)
+    assert len(moved_keys) < len(_KEYS) / 5 * 1.25
+
+
+def test_removed_node_only_gives_its_keys() -> None:
+    hash_ring = ConsistentHashRing(["a", "b", "c", "d"])
+    shrunk_hash_ring = ConsistentHashRing(["a", "b", "c"])
+
+    for key in _KEYS:
+        if hash_ring.get_node(key) != "d":
+            assert shrunk_hash_ring.get_node(key) == hash_ring.get_node(key)
+
+
+def test_empty_ring_has_no_owner() -> None:
+    assert ConsistentHashRing([]).get_node("key") is None
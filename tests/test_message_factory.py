@@ -0,0 +1,67 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+from message_factory import MessageFactory
+from settings import Language, MeasurementSystem
+from weather import Weather, WeatherForecast
+
+
+class FakeApplicationSettings(object):
+    def __init__(self, language: Language) -> None:
+        self.language = language
+
+
+def __create_weather__(days: int = 0, temperature: float = 20.4) -> Weather:
+    return Weather("paris", datetime.date(2026, 6, 1) + datetime.timedelta(days=days), MeasurementSystem.METRIC,
+                   800, temperature, 50, 10)
+
+
+def test_renders_are_served_from_the_cache(repository_directory) -> None:
+    message_factory = MessageFactory(FakeApplicationSettings(Language.ENGLISH))
+    forecast = WeatherForecast([__create_weather__(days) for days in range(3)])
+
+    msg = message_factory.format_weather_forecast(forecast)
+
+    assert message_factory.format_weather_forecast(WeatherForecast(list(forecast.weathers))) is msg
+    assert msg == MessageFactory(FakeApplicationSettings(Language.ENGLISH)).__render_forecast__(forecast)
+    assert message_factory.format_weather(__create_weather__(), False) == "**@ Paris**: :sunny:   20°C   50%   10 kmh"
+
+
+def test_renders_are_keyed_on_the_rendered_data(repository_directory) -> None:
+    message_factory = MessageFactory(FakeApplicationSettings(Language.ENGLISH))
+    weather = __create_weather__()
+
+    assert message_factory.format_weather(weather, False) != message_factory.format_weather(weather, True)
+    assert message_factory.format_weather(__create_weather__(temperature=25), False).endswith("25°C   50%   10 kmh")
+
+    # e.g. the home weather snapshot, labelled with the home display name
+    weather.location = "home"
+    assert message_factory.format_weather(weather, False).startswith("**@ Home**")
+
+
+def test_renders_are_not_shared_between_languages(repository_directory) -> None:
+    application_settings = FakeApplicationSettings(Language.ENGLISH)
+    message_factory = MessageFactory(application_settings)
+    forecast = WeatherForecast([__create_weather__()])
+
+    english_msg = message_factory.format_weather_forecast(forecast)
+    application_settings.language = Language.FRENCH
+    french_msg = message_factory.format_weather_forecast(forecast)
+
+    assert english_msg != french_msg
+    assert french_msg == message_factory.__render_forecast__(forecast)
@@ -0,0 +1,108 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import datetime
+import command
+from command import WeatherDiscordService
+from publisher import HomeWeatherPublisher
+from settings import HomeSettings, MeasurementSystem
+from weather import Weather
+
+
+class FakeWeatherService(object):
+    # fails the given number of times, then answers the same (cached) weather instance
+
+    def __init__(self, failures_count: int = 0) -> None:
+        self.weather = Weather("paris,fr", datetime.date.today(), MeasurementSystem.METRIC, 800, 20, 50, 10)
+        self.requests_count = 0
+        self._failures_count = failures_count
+
+    async def get_weather(self, location: str, measurement_system: MeasurementSystem) -> Weather:
+        self.requests_count += 1
+
+        if self.requests_count <= self._failures_count:
+            raise ValueError("there is no queryable weather repository at the moment")
+
+        return self.weather
+
+
+def __create_publisher__(weather_service: FakeWeatherService) -> HomeWeatherPublisher:
+    home_settings = HomeSettings("Paris,FR", "Paris", ["general"], "08:00", "20:00", None)
+    return HomeWeatherPublisher(MeasurementSystem.METRIC, home_settings, weather_service)
+
+
+def test_subscribers_share_a_single_snapshot() -> None:
+    weather_service = FakeWeatherService()
+    received_snapshots = list()
+
+    async def __subscriber__(snapshot) -> None:
+        received_snapshots.append(snapshot)
+
+    async def __failing_subscriber__(snapshot) -> None:
+        raise ValueError("discord is unavailable")
+
+    async def __run__():
+        publisher = __create_publisher__(weather_service)
+
+        for subscriber in [__subscriber__, __failing_subscriber__, __subscriber__]:
+            publisher.subscribe(subscriber)
+
+        return await publisher.publish()
+
+    snapshot = asyncio.run(__run__())
+
+    assert weather_service.requests_count == 1
+    assert received_snapshots == [snapshot, snapshot]
+    assert snapshot.weather.location == "Paris"
+    assert weather_service.weather.location == "paris,fr"  # the cached weather is left untouched
+
+
+class FakeDiscordClient(object):
+    # closes itself after the given number of sleeps of the publication loop
+
+    def __init__(self, sleeps_count: int) -> None:
+        self.sleeps = list()
+        self._sleeps_count = sleeps_count
+
+    async def wait_until_ready(self) -> None:
+        pass
+
+    def is_closed(self) -> bool:
+        return len(self.sleeps) >= self._sleeps_count
+
+
+def test_first_publication_is_retried_with_a_backoff(monkeypatch) -> None:
+    weather_service = FakeWeatherService(failures_count=3)
+    discord_client = FakeDiscordClient(5)
+
+    async def __sleep__(delay: float) -> None:
+        discord_client.sleeps.append(delay)
+
+    async def __run__() -> None:
+        monkeypatch.setattr(command.asyncio, "sleep", __sleep__)
+        weather_discord_service = WeatherDiscordService(MeasurementSystem.METRIC, None, weather_service,
+                                                        discord_client, None, None,
+                                                        __create_publisher__(weather_service), updates_profile=False)
+        await weather_discord_service.publish_home_weather()
+
+    asyncio.run(__run__())
+
+    first_delay = WeatherDiscordService._FIRST_PUBLICATION_RETRY_DELAY
+    publication_delay = WeatherDiscordService._REALTIME_WEATHER_FREQUENCY
+    assert discord_client.sleeps == [first_delay, 2 * first_delay, 4 * first_delay, publication_delay,
+                                     publication_delay]
@@ -0,0 +1,95 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import time
+import pytest
+import rate_limit
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+
+
+def test_requests_are_refused_once_a_window_is_full(clock, monkeypatch) -> None:
+    monkeypatch.setattr(rate_limit, "time", clock)
+    rate_limiter = SlidingWindowRateLimiter([RateLimit(2, SlidingWindowRateLimiter.MINUTE)])
+
+    assert rate_limiter.try_acquire()
+    assert rate_limiter.try_acquire()
+    assert not rate_limiter.try_acquire()
+    assert rate_limiter.get_remaining(SlidingWindowRateLimiter.MINUTE) == 0
+    assert rate_limiter.get_utilization() == 1.0
+
+
+def test_requests_leave_the_window_after_its_period(clock, monkeypatch) -> None:
+    monkeypatch.setattr(rate_limit, "time", clock)
+    rate_limiter = SlidingWindowRateLimiter([RateLimit(2, SlidingWindowRateLimiter.MINUTE)])
+
+    rate_limiter.try_acquire()
+    clock.advance(30)
+    rate_limiter.try_acquire()
+
+    assert rate_limiter.get_delay() == 30
+    clock.advance(30)
+    assert rate_limiter.get_remaining(SlidingWindowRateLimiter.MINUTE) == 1
+    assert rate_limiter.try_acquire()
+    assert not rate_limiter.try_acquire()
+
+
+def test_every_window_must_have_capacity(clock, monkeypatch) -> None:
+    monkeypatch.setattr(rate_limit, "time", clock)
+    rate_limiter = SlidingWindowRateLimiter([RateLimit(10, SlidingWindowRateLimiter.MINUTE),
+                                             RateLimit(3, SlidingWindowRateLimiter.DAY)])
+
+    for _ in range(3):
+        assert rate_limiter.try_acquire()
+
+    clock.advance(SlidingWindowRateLimiter.MINUTE)
+
+    assert rate_limiter.get_remaining(SlidingWindowRateLimiter.MINUTE) == 10
+    assert rate_limiter.get_remaining(SlidingWindowRateLimiter.DAY) == 0
+    assert not rate_limiter.has_capacity()
+    assert rate_limiter.get_delay() == SlidingWindowRateLimiter.DAY - SlidingWindowRateLimiter.MINUTE
+
+
+def test_unknown_period_is_rejected() -> None:
+    rate_limiter = SlidingWindowRateLimiter([RateLimit(1, SlidingWindowRateLimiter.MINUTE)])
+
+    with pytest.raises(ValueError):
+        rate_limiter.get_remaining(SlidingWindowRateLimiter.DAY)
+
+
+def test_waiters_are_served_in_order() -> None:
+    rate_limiter = SlidingWindowRateLimiter([RateLimit(1, 0.05)])
+    served = list()
+
+    async def __acquire__(index: int) -> None:
+        await rate_limiter.acquire()
+        served.append(index)
+
+    async def __run__() -> None:
+        tasks = list()
+
+        for index in range(5):
+            tasks.append(asyncio.ensure_future(__acquire__(index)))
+            await asyncio.sleep(0)  # the waiters queue up in their creation order
+
+        await asyncio.gather(*tasks)
+
+    start = time.monotonic()
+    asyncio.run(__run__())
+
+    assert served == list(range(5))
+    assert time.monotonic() - start >= 4 * 0.05
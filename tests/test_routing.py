@@ -0,0 +1,174 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import routing
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+from routing import CircuitState, ProviderHealth, ProviderRouter
+from settings import HedgingSettings
+
+
+def __fail__(health: ProviderHealth, times: int) -> None:
+    for _ in range(times):
+        health.start_request()
+        health.record_failure(0.1)
+
+
+def test_circuit_opens_after_consecutive_failures(clock, monkeypatch) -> None:
+    monkeypatch.setattr(routing, "time", clock)
+    health = ProviderHealth("TEST")
+
+    __fail__(health, ProviderHealth._FAILURE_THRESHOLD - 1)
+    assert health.state is CircuitState.CLOSED
+    assert health.is_available()
+
+    __fail__(health, 1)
+    assert health.state is CircuitState.OPEN
+    assert not health.is_available()
+
+
+def test_success_resets_the_consecutive_failures(clock, monkeypatch) -> None:
+    monkeypatch.setattr(routing, "time", clock)
+    health = ProviderHealth("TEST")
+
+    __fail__(health, ProviderHealth._FAILURE_THRESHOLD - 1)
+    health.record_success(0.1)
+    __fail__(health, ProviderHealth._FAILURE_THRESHOLD - 1)
+
+    assert health.state is CircuitState.CLOSED
+
+
+def test_open_circuit_lets_a_single_probe_through(clock, monkeypatch) -> None:
+    monkeypatch.setattr(routing, "time", clock)
+    health = ProviderHealth("TEST")
+    __fail__(health, ProviderHealth._FAILURE_THRESHOLD)
+
+    clock.advance(ProviderHealth._OPEN_DURATION)
+
+    assert health.is_available()
+    assert health.state is CircuitState.HALF_OPEN
+
+    health.start_request()
+    assert not health.is_available()
+
+
+def test_successful_probe_closes_the_circuit(clock, monkeypatch) -> None:
+    monkeypatch.setattr(routing, "time", clock)
+    health = ProviderHealth("TEST")
+    __fail__(health, ProviderHealth._FAILURE_THRESHOLD)
+    clock.advance(ProviderHealth._OPEN_DURATION)
+    health.is_available()
+
+    health.start_request()
+    health.record_success(0.1)
+
+    assert health.state is CircuitState.CLOSED
+    assert health.is_available()
+
+
+def test_failed_probe_opens_the_circuit_again(clock, monkeypatch) -> None:
+    monkeypatch.setattr(routing, "time", clock)
+    health = ProviderHealth("TEST")
+    __fail__(health, ProviderHealth._FAILURE_THRESHOLD)
+    clock.advance(ProviderHealth._OPEN_DURATION)
+    health.is_available()
+
+    __fail__(health, 1)
+
+    assert health.state is CircuitState.OPEN
+    assert not health.is_available()
+
+    clock.advance(ProviderHealth._OPEN_DURATION)
+    assert health.is_available()
+
+
+def test_cancelled_probe_frees_the_half_open_circuit(clock, monkeypatch) -> None:
+    monkeypatch.setattr(routing, "time", clock)
+    health = ProviderHealth("TEST")
+    __fail__(health, ProviderHealth._FAILURE_THRESHOLD)
+    clock.advance(ProviderHealth._OPEN_DURATION)
+    health.is_available()
+
+    health.start_request()
+    health.cancel_request()
+
+    assert health.is_available()
+
+
+class DelayedRepository(object):
+    # answers its own name after the given delay, and records its calls
+
+    def __init__(self, name: str, delay: float) -> None:
+        self.NAME = name
+        self.rate_limiter = SlidingWindowRateLimiter([RateLimit(10, SlidingWindowRateLimiter.MINUTE)])
+        self.calls = 0
+        self.cancelled = False
+        self._delay = delay
+
+    def is_queryable(self) -> bool:
+        return self.rate_limiter.has_capacity()
+
+    def get_request_count(self, locations: list) -> int:
+        return len(locations)
+
+    async def get_name(self) -> str:
+        self.calls += 1
+
+        try:
+            await asyncio.sleep(self._delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+        return self.NAME
+
+
+def __call_hedged__(monkeypatch, primary: DelayedRepository, secondary: DelayedRepository, locations: list = None):
+    monkeypatch.setattr(ProviderRouter, "_DEFAULT_HEDGING_DELAY", 0.01)
+    router = ProviderRouter([primary, secondary], HedgingSettings(True, 95))
+    return asyncio.run(router.call(lambda repository: repository.get_name(), locations))
+
+
+def test_slow_provider_is_hedged_with_the_other_one(monkeypatch) -> None:
+    primary, secondary = DelayedRepository("PRIMARY", 1), DelayedRepository("SECONDARY", 0)
+
+    assert __call_hedged__(monkeypatch, primary, secondary) == "SECONDARY"
+    assert primary.cancelled
+
+
+def test_fast_provider_is_not_hedged(monkeypatch) -> None:
+    primary, secondary = DelayedRepository("PRIMARY", 0), DelayedRepository("SECONDARY", 0)
+
+    assert __call_hedged__(monkeypatch, primary, secondary) == "PRIMARY"
+    assert secondary.calls == 0
+
+
+def test_hedges_only_spend_the_spare_half_of_the_rate_limit(monkeypatch) -> None:
+    primary, secondary = DelayedRepository("PRIMARY", 0.05), DelayedRepository("SECONDARY", 0)
+
+    for _ in range(5):
+        secondary.rate_limiter.try_acquire()
+
+    assert __call_hedged__(monkeypatch, primary, secondary) == "PRIMARY"
+    assert secondary.calls == 0
+
+
+def test_batches_are_not_hedged(monkeypatch) -> None:
+    primary, secondary = DelayedRepository("PRIMARY", 0.05), DelayedRepository("SECONDARY", 0)
+
+    assert __call_hedged__(monkeypatch, primary, secondary, ["Paris", "Lyon"]) == "PRIMARY"
+    assert secondary.calls == 0
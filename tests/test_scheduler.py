@@ -0,0 +1,117 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import datetime
+import zoneinfo
+from scheduler import AsyncScheduler, DailyJob
+
+_PARIS = zoneinfo.ZoneInfo("Europe/Paris")
+
+
+async def __nothing__() -> None:
+    pass
+
+
+def test_next_run_is_today_or_tomorrow() -> None:
+    job = DailyJob(datetime.time(8, 0), _PARIS, __nothing__)
+
+    before = datetime.datetime(2026, 6, 1, 7, 0, tzinfo=_PARIS)
+    assert job.get_next_run(before) == datetime.datetime(2026, 6, 1, 8, 0, tzinfo=_PARIS)
+
+    at = datetime.datetime(2026, 6, 1, 8, 0, tzinfo=_PARIS)
+    assert job.get_next_run(at) == datetime.datetime(2026, 6, 2, 8, 0, tzinfo=_PARIS)
+
+
+def test_next_run_follows_the_daylight_saving_time_changes() -> None:
+    job = DailyJob(datetime.time(8, 0), _PARIS, __nothing__)
+
+    # the clocks move forward during the night of the 29th of March 2026
+    next_run = job.get_next_run(datetime.datetime(2026, 3, 28, 9, 0, tzinfo=_PARIS))
+
+    assert next_run.astimezone(datetime.timezone.utc) == datetime.datetime(2026, 3, 29, 6, 0,
+                                                                           tzinfo=datetime.timezone.utc)
+
+
+class WakeUpRecorder(object):
+    # stands for the wall clock of the scheduler, and records the jobs runs
+
+    def __init__(self, now: datetime.datetime) -> None:
+        self.now = now
+        self.runs = list()
+
+    def create_job(self, time_of_day: datetime.time, tag: str) -> DailyJob:
+        async def __run__() -> None:
+            self.runs.append(tag)
+
+        return DailyJob(time_of_day, datetime.timezone.utc, __run__, tag)
+
+
+def __wake_up_at__(monkeypatch, recorder: WakeUpRecorder, jobs: list, wake_up_time: datetime.datetime,
+                   removed_tag: str = None) -> AsyncScheduler:
+    monkeypatch.setattr(AsyncScheduler, "__now__", staticmethod(lambda: recorder.now))
+    scheduler = AsyncScheduler()
+
+    async def __run__() -> None:
+        scheduler.start(asyncio.get_event_loop())
+
+        for job in jobs:
+            scheduler.add_job(job)
+
+        if removed_tag is not None:
+            scheduler.remove_jobs(removed_tag)
+
+        recorder.now = wake_up_time
+        scheduler.__wake_up__()
+        await asyncio.sleep(0)
+        scheduler.stop()
+
+    asyncio.run(__run__())
+    return scheduler
+
+
+def test_due_jobs_run_and_are_rescheduled(monkeypatch) -> None:
+    recorder = WakeUpRecorder(datetime.datetime(2026, 6, 1, 7, 0, tzinfo=datetime.timezone.utc))
+    jobs = [recorder.create_job(datetime.time(8, 0), "morning"), recorder.create_job(datetime.time(20, 0), "evening")]
+
+    scheduler = __wake_up_at__(monkeypatch, recorder, jobs,
+                               datetime.datetime(2026, 6, 1, 8, 0, 1, tzinfo=datetime.timezone.utc))
+
+    assert recorder.runs == ["morning"]
+    assert len(scheduler) == 2
+
+
+def test_runs_missed_for_too_long_are_skipped(monkeypatch) -> None:
+    recorder = WakeUpRecorder(datetime.datetime(2026, 6, 1, 7, 0, tzinfo=datetime.timezone.utc))
+    jobs = [recorder.create_job(datetime.time(8, 0), "morning")]
+
+    # e.g. the host was suspended
+    __wake_up_at__(monkeypatch, recorder, jobs, datetime.datetime(2026, 6, 1, 8, 0, tzinfo=datetime.timezone.utc)
+                   + datetime.timedelta(seconds=AsyncScheduler._MAX_LATENESS + 1))
+
+    assert recorder.runs == []
+
+
+def test_removed_jobs_do_not_run(monkeypatch) -> None:
+    recorder = WakeUpRecorder(datetime.datetime(2026, 6, 1, 7, 0, tzinfo=datetime.timezone.utc))
+    jobs = [recorder.create_job(datetime.time(8, 0), "morning"), recorder.create_job(datetime.time(8, 0), "other")]
+
+    scheduler = __wake_up_at__(monkeypatch, recorder, jobs,
+                               datetime.datetime(2026, 6, 1, 8, 0, 1, tzinfo=datetime.timezone.utc), "morning")
+
+    assert recorder.runs == ["other"]
+    assert len(scheduler) == 1
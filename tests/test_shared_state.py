@@ -0,0 +1,94 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+import pytest
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+from shared_state import SharedRateLimiter, SharedStateClient, SharedStateServer
+
+_RATE_LIMITS = {"OWM": [RateLimit(3, SlidingWindowRateLimiter.MINUTE)]}
+
+
+async def __start_server__(socket_path: str) -> asyncio.Future:
+    server_task = asyncio.ensure_future(SharedStateServer(socket_path, 10, _RATE_LIMITS).serve())
+
+    while not os.path.exists(socket_path):
+        await asyncio.sleep(0.01)
+
+    return server_task
+
+
+def test_processes_share_their_cache_entries(tmp_path) -> None:
+    socket_path = str(tmp_path / "state.sock")
+
+    async def __run__() -> None:
+        server_task = await __start_server__(socket_path)
+        client, other_client = SharedStateClient(socket_path), SharedStateClient(socket_path)
+
+        await client.set("weather|paris", "{}", 600)
+        value, ttl = await other_client.get("weather|paris")
+
+        assert value == "{}"
+        assert 0 < ttl <= 600
+        assert await other_client.get("weather|lyon") is None
+
+        client.close()
+        other_client.close()
+        server_task.cancel()
+
+    asyncio.run(__run__())
+
+
+def test_processes_share_their_rate_limits(tmp_path) -> None:
+    socket_path = str(tmp_path / "state.sock")
+
+    async def __run__() -> None:
+        server_task = await __start_server__(socket_path)
+        clients = [SharedStateClient(socket_path) for _ in range(2)]
+        rate_limiters = [SharedRateLimiter(client, "OWM", _RATE_LIMITS["OWM"]) for client in clients]
+
+        for rate_limiter in [rate_limiters[0], rate_limiters[1], rate_limiters[0]]:
+            await rate_limiter.acquire()
+
+        # the quota is spent, whatever the process which has spent it
+        assert not rate_limiters[0].has_capacity()
+        assert rate_limiters[0].get_remaining(SlidingWindowRateLimiter.MINUTE) == 0
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(rate_limiters[1].acquire(), 0.1)
+
+        for client in clients:
+            client.close()
+
+        server_task.cancel()
+
+    asyncio.run(__run__())
+
+
+def test_unreachable_server_fails_closed(tmp_path) -> None:
+    client = SharedStateClient(str(tmp_path / "missing.sock"))
+    rate_limiter = SharedRateLimiter(client, "OWM", _RATE_LIMITS["OWM"])
+
+    async def __run__() -> None:
+        assert await client.get("weather|paris") is None
+        await client.set("weather|paris", "{}", 600)  # only logged
+
+    asyncio.run(__run__())
+
+    assert not rate_limiter.has_capacity()
+    assert rate_limiter.get_utilization() == 1.0
@@ -0,0 +1,209 @@
+# Copyright (C) 2017 discloud
+#
+# This file is part of discloud.
+#
+# discloud is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# discloud is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with discloud.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import datetime
+import aiohttp
+import pytest
+import cache
+from cities import City, UnknownLocationError
+from rate_limit import RateLimit, SlidingWindowRateLimiter
+from routing import CircuitState, ProviderRouter
+from settings import CacheSettings, HedgingSettings, MeasurementSystem, PrefetchSettings
+from weather import AsyncWeatherRepository, OpenWeatherMapRepository, Weather, WeatherService, \
+    WeatherUndergroundRepository
+
+
+class FakeHttpPool(object):
+    # answers the requests with the given json, or raises the given error, and records them
+
+    def __init__(self, response=None, error: Exception = None) -> None:
+        self._response = response
+        self._error = error
+        self.requests = list()
+
+    async def get_json(self, url: str, params: dict = None):
+        self.requests.append((url, params))
+
+        if self._error is not None:
+            raise self._error
+
+        return self._response
+
+
+class GroupHttpPool(FakeHttpPool):
+    # answers the Open Weather Map group requests with a weather for each requested city ID
+
+    async def get_json(self, url: str, params: dict = None):
+        self.requests.append((url, params))
+        await asyncio.sleep(0)
+        return {"list": [{"id": int(city_id), "dt": 0, "weather": [{"id": 800}], "main": {"temp": 20.0, "humidity": 50},
+                          "wind": {"speed": 3}}
+                         for city_id in params["id"].split(",")]}
+
+
+class FakeCityIndex(object):
+    def __init__(self, cities: list) -> None:
+        self._cities = {city.name.lower(): city for city in cities}
+
+    def resolve(self, location: str) -> City:
+        return self._cities.get(location.strip().lower())
+
+    def has_city_named(self, location: str) -> bool:
+        return location.strip().lower() in self._cities
+
+
+def __create_http_error__(status: int) -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(None, (), status=status)
+
+
+def test_owm_unknown_location_is_reported() -> None:
+    repository = OpenWeatherMapRepository("key", FakeHttpPool(error=__create_http_error__(404)))
+
+    with pytest.raises(UnknownLocationError):
+        asyncio.run(repository.get_weather_async("Atlantis", MeasurementSystem.METRIC))
+
+    with pytest.raises(UnknownLocationError):
+        asyncio.run(repository.get_forecast_async("Atlantis", MeasurementSystem.METRIC))
+
+
+def test_owm_server_errors_are_raised_as_is() -> None:
+    repository = OpenWeatherMapRepository("key", FakeHttpPool(error=__create_http_error__(502)))
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(repository.get_weather_async("Paris", MeasurementSystem.METRIC))
+
+
+def test_wu_unknown_location_is_reported() -> None:
+    http_pool = FakeHttpPool({"response": {"error": {"type": "querynotfound"}}})
+    repository = WeatherUndergroundRepository("key", http_pool)
+
+    with pytest.raises(UnknownLocationError):
+        asyncio.run(repository.get_weather_async("Atlantis", MeasurementSystem.METRIC))
+
+
+def test_wu_other_errors_are_provider_failures() -> None:
+    http_pool = FakeHttpPool({"response": {"error": {"type": "keynotfound", "description": "invalid key"}}})
+    repository = WeatherUndergroundRepository("key", http_pool)
+
+    with pytest.raises(ValueError) as error_info:
+        asyncio.run(repository.get_weather_async("Paris", MeasurementSystem.METRIC))
+
+    assert not isinstance(error_info.value, UnknownLocationError)
+
+
+def test_unknown_locations_do_not_open_the_circuit() -> None:
+    repository = OpenWeatherMapRepository("key", FakeHttpPool(error=__create_http_error__(404)))
+    router = ProviderRouter([repository], HedgingSettings(False, 95))
+
+    async def __request__() -> None:
+        await router.call(lambda r: r.get_weather_async("Atlantis", MeasurementSystem.METRIC))
+
+    for _ in range(10):
+        with pytest.raises(UnknownLocationError):
+            asyncio.run(__request__())
+
+    assert router.get_health(repository).state is CircuitState.CLOSED
+
+
+class CountingRepository(AsyncWeatherRepository):
+    NAME = "COUNTING"
+
+    def __init__(self) -> None:
+        super().__init__(SlidingWindowRateLimiter([RateLimit(10 ** 6, SlidingWindowRateLimiter.MINUTE)]))
+        self.requested_locations = list()
+
+    async def get_weather_async(self, location, measurement_system: MeasurementSystem) -> Weather:
+        self.requested_locations.append(location)
+        return Weather(location, datetime.date.today(), measurement_system, 800, 20.0, 50, 10)
+
+
+def __create_weather_service__(repository: AsyncWeatherRepository, prefetch_settings: PrefetchSettings = None) \
+        -> WeatherService:
+    weather_service = WeatherService("key", None, CacheSettings(600, 3600, 100, None, 0), HedgingSettings(False, 95),
+                                     prefetch_settings or PrefetchSettings(0, 3), None)
+    weather_service._router = ProviderRouter([repository], HedgingSettings(False, 95))
+    return weather_service
+
+
+def test_idle_locations_stop_being_refreshed(clock, monkeypatch) -> None:
+    monkeypatch.setattr(cache, "time", clock)
+    repository = CountingRepository()
+    weather_service = __create_weather_service__(repository, PrefetchSettings(10, 3))
+
+    async def __run__() -> None:
+        for _ in range(4):
+            await weather_service.get_weather("Paris", MeasurementSystem.METRIC)
+
+        await weather_service.get_weather("Lyon", MeasurementSystem.METRIC)
+
+        # the popular location is refreshed before it expires, the one asked once is not
+        clock.advance(590)
+        await weather_service.__refresh_ahead_once__()
+        assert repository.requested_locations == ["Paris", "Lyon", "Paris"]
+
+        # nobody asks for the popular location anymore, its popularity fades below the floor
+        for _ in range(2 * 24 * 6):
+            clock.advance(590)
+            await weather_service.__refresh_ahead_once__()
+
+        refreshes_count = len(repository.requested_locations)
+        clock.advance(590)
+        await weather_service.__refresh_ahead_once__()
+        assert len(repository.requested_locations) == refreshes_count
+        assert refreshes_count < 2 * 24 * 6
+
+    asyncio.run(__run__())
+
+
+def test_owm_cities_are_fetched_by_groups() -> None:
+    http_pool = GroupHttpPool()
+    repository = OpenWeatherMapRepository("key", http_pool)
+    cities = [City(city_id, "City {}".format(city_id), "FR", 0.0, 0.0) for city_id in range(25)]
+
+    weathers = asyncio.run(repository.get_weathers_async(cities, MeasurementSystem.METRIC))
+
+    assert [url for url, _ in http_pool.requests] == [OpenWeatherMapRepository._BASE_URL + "/group"] * 2
+    assert [len(params["id"].split(",")) for _, params in http_pool.requests] == [20, 5]
+    assert [weather.location for weather in weathers] == [city.name for city in cities]
+    assert repository.get_request_count(cities) == 2
+
+
+def test_batched_cities_are_shared_with_concurrent_requests() -> None:
+    http_pool = GroupHttpPool()
+    cities = [City(1, "Paris", "FR", 48.85, 2.35), City(2, "Lyon", "FR", 45.75, 4.85)]
+    weather_service = __create_weather_service__(OpenWeatherMapRepository("key", http_pool))
+    weather_service._city_index = FakeCityIndex(cities)
+    cache_keys = [WeatherService.__get_cache_key__("weather", city, MeasurementSystem.METRIC) for city in cities]
+
+    async def __run__():
+        return await asyncio.gather(weather_service.__fetch_weathers__(cache_keys, cities, MeasurementSystem.METRIC),
+                                    weather_service.get_weather("Lyon", MeasurementSystem.METRIC))
+
+    batch_weathers, weather = asyncio.run(__run__())
+
+    assert len(http_pool.requests) == 1
+    assert [weather.location for weather in batch_weathers] == ["Paris", "Lyon"]
+    assert weather.location == "Lyon"
+
+
+def test_location_keys_follow_the_cache_normalization() -> None:
+    weather_service = __create_weather_service__(CountingRepository())
+    assert weather_service.get_location_key("Paris,FR") == weather_service.get_location_key(" paris,fr ")
+
+    weather_service._city_index = FakeCityIndex([City(2988507, "Paris", "FR", 48.85, 2.35)])
+    assert weather_service.get_location_key("Paris") == 2988507